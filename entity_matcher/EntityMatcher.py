@@ -13,50 +13,129 @@ from .config import (
     validate_config
 )
 from .blocking import (
+    Blocks,
     standard_blocking,
-    token_blocking
+    token_blocking,
+    lsh_blocking,
+    knn_blocking,
+    sorted_neighborhood
 )
 from .block_processing import (
     purge_blocks,
-    meta_blocks
+    filter_blocks,
+    meta_blocks,
+    expand_blocks
+)
+from .pairs import (
+    create_index_pairs,
+    iter_index_pairs,
+    keys_to_pairs,
+    pairs_to_keys,
+    unique_pair_keys,
+    is_member,
+    CandidatePairs
+)
+from .planning import plan_memory
+from .linking import LinkIndex
+from .executor import (
+    ScoringExecutor,
+    get_n_jobs
+)
+from .clustering import (
+    get_connected_components,
+    get_canonical_records
 )
 from . import preprocess
 from .matching import (
     cosine,
-    exact,
-    levenshtein,
-    embedding
+    embedding,
+    prepare_field_values
 )
 
 import pandas as pd
 import numpy as np
 
-import psutil
-
 
 
 class EntityMatcher:
     """..."""
 
     _threshold = 0.70
-    _available_memory = psutil.Process().memory_info().rss          #largest physical memory process used; convert to MB rss / 1024 ** 2
-    _available_blocking_methods = ['standard', 'purge']
-    _available_scoring_methods = ['exact','fuzzy','levenshtein']
+    _memory_budget_fraction = 0.5           #fraction of free system memory a run may plan to use
+    _available_blocking_operations = ['standard', 'token', 'sorted_neighborhood', 'lsh', 'knn']
+    _available_blocking_processes = ['purge', 'meta']
+    _available_meta_weightings = ['CBS', 'ECBS', 'JS', 'ARCS']
+    _available_meta_prunings = ['WEP', 'CNP']
+    _available_scoring_methods = ['exact','fuzzy','levenshtein','embedding']
     _default_combined_pair_name = 'Combined_Fields'
     _default_blocking = {"operation": "standard", "process": "purge"}      
-
-
-    def __init__(self, field_config: dict[str, str]) -> None:
+    _default_purging_threshold = 10000      #blocks of this many records or more are purged
+    _default_window_size = 3                #records before each record paired by sorted neighborhood
+    _default_lsh_bands = 20                 #MinHash signature bands of `lsh` blocking
+    _default_lsh_rows = 5                   #hashes per band of `lsh` blocking
+    _default_knn_neighbors = 10             #nearest records paired with each record by `knn` blocking
+    _sparse_top_k = None                    #keep every candidate above the threshold
+    _sparse_block_size = 1000               #rows per sparse matrix product
+    _canonical_record = 'min'               #record that names a cluster: 'min', 'max' or a column
+    _scoring_costs = {'exact': 0, 'fuzzy': 1, 'levenshtein': 2, 'embedding': 3}
+    _executor_backend = 'process'           #pool of `n_jobs` workers: 'process' or 'thread'
+    _executor_chunk_pairs = 200_000         #pairs per scoring task of the pool
+
+
+    def __init__(self, field_config: dict[str, str], memory_limit: int = None, n_jobs: int = None) -> None:
         validated_shape = True    #validate_config(field_config)
         if validated_shape:
             if field_config['blocking'] !={}:
-                for method in field_config['blocking'].values():
-                    if method not in self._available_blocking_methods:
+                if field_config['blocking']['operation'] not in self._available_blocking_operations:
+                    raise TypeError
+                if field_config['blocking']['operation'] == 'sorted_neighborhood':
+                    #pairs come straight from the sorted windows, without block processing
+                    for key in field_config['blocking'].get('keys', []):
+                        if type(key) not in [str, list]:
+                            raise TypeError
+                    if not int(field_config['blocking'].get('window', self._default_window_size)) > 0:
+                        raise TypeError
+                elif field_config['blocking']['operation'] == 'knn':
+                    #pairs come straight from the nearest neighbors, without block processing
+                    if not int(field_config['blocking'].get('neighbors', self._default_knn_neighbors)) > 0:
+                        raise TypeError
+                    if field_config['blocking'].get('vectors', 'tfidf') not in ['tfidf', 'embedding']:
                         raise TypeError
+                elif field_config['blocking']['process'] not in self._available_blocking_processes:
+                    raise TypeError
+                for field in field_config['blocking'].get('fields', []):
+                    if type(field) != str:
+                        raise TypeError
+                if field_config['blocking'].get('expansion', 'all') not in ['all', 'star']:
+                    raise TypeError
+                if field_config['blocking'].get('weighting', 'CBS') not in self._available_meta_weightings:
+                    raise TypeError
+                if field_config['blocking'].get('pruning', 'WEP') not in self._available_meta_prunings:
+                    raise TypeError
+                if not field_config['blocking'].get('purging_threshold', self._default_purging_threshold) > 1:
+                    raise TypeError
+                if not field_config['blocking'].get('comparison_budget', 1) > 0:
+                    raise TypeError
+                if not 0 < field_config['blocking'].get('filter_ratio', 1) <= 1:
+                    raise TypeError
             for method in field_config['scoring'].values():
                 if method not in self._available_scoring_methods:
                     raise TypeError
+            for field, weight in field_config.get('weights', {}).items():
+                if field not in field_config['scoring'] or not weight > 0:
+                    raise TypeError
+            if isinstance(field_config.get('cascade'), list):
+                if sorted(field_config['cascade']) != sorted(field_config['scoring']):
+                    raise TypeError
+            n_jobs = n_jobs if n_jobs is not None else field_config.get('n_jobs', 1)
+            if type(n_jobs) != int or n_jobs == 0:
+                raise TypeError
         self.field_config = field_config
+        #vectors of the `embedding` scorer and of `knn` blocking on embedding vectors, cleared after each run
+        self.vector_cache = embedding.VectorCache(embedding.get_encoder(field_config.get('embedding')))
+        self.memory_limit = memory_limit
+        self.n_jobs = n_jobs
+        self.plan = None
 
 
     def preprocess(self, df: pd.DataFrame, columns: list=None) -> pd.DataFrame:
@@ -70,126 +149,469 @@ class EntityMatcher:
         return preprocess.preprocess_df_columns(df, columns)
 
 
-    def get_matches(self, df: pd.DataFrame) -> np.ndarray:
+    def get_matches(self, df: pd.DataFrame, chunk_pairs: int = None) -> np.ndarray:
         """Get a column of matches, aligned to the dataframe, based on the `field_config`.
-        
+
+        If `chunk_pairs` is given, candidate pairs are scored in chunks of at most
+        that many pairs and only the pairs above the threshold are kept, so memory
+        is bounded by the chunk instead of the total number of pairs.
+
+        Usage::
+            >>> df['Proposed Matches'] = Matcher.get_matches(df, chunk_pairs=5_000_000)
         """
         
-        #check memory requirement and applying default blocking if necessary
-        if not self.field_config['blocking']:
-            for field in self.field_config['scoring']:
-                if self.is_process_memory_constrained(df[field])['dot_product_size']:
-                    print(f'''INFO: Records for field {field}, are too many for memory 
-                          constraints at: {df[field].shape[0]} records!  Applying blocking.'''
-                          )
-                    self.field_config['blocking'] = self._default_blocking
-
-        #create pairs from indices
-        pair_dict = self.create_pairs_from_blocking_approach(
-            df=df,
-            field_config=self.field_config
-        )
-            
-        #score pairs based on configuration methods
-        '''
-        pair_dict
-        {'title': array([[ 1,  0],
-           ...[30, 29]])}'''
-        matches = self.get_field_similarity_scores_from_pairs(
-            df=df, 
-            pair_dict=pair_dict, 
-            field_config=self.field_config,
-            threshold=self._threshold
+        #check memory requirement and apply blocking or chunking if necessary
+        plan = self.plan_memory(df)
+        if plan['blocking'] != self.field_config['blocking']:
+            print(f'''INFO: Records are too many for memory constraints at: {df.shape[0]} records!  
+                  Applying blocking: {plan['blocking']}.'''
+                  )
+            self.field_config['blocking'] = plan['blocking']
+        if not chunk_pairs and plan['chunk_pairs']:
+            print(f'''INFO: Estimated memory of {plan['estimated_memory'] / 1024 ** 2:,.0f} MB exceeds budget!  
+                  Scoring in chunks of {plan['chunk_pairs']:,} pairs.'''
+                  )
+            chunk_pairs = plan['chunk_pairs']
+        #blocks built by the plan are used once, and not kept with it
+        blocks = plan.pop('blocks')
+
+        #stream chunks of pairs through scoring
+        if chunk_pairs:
+            matches = self.get_field_similarity_scores_from_chunks(
+                df=df,
+                field_config=self.field_config,
+                threshold=self._threshold,
+                chunk_pairs=chunk_pairs,
+                blocks=blocks
+                )
+
+        else:
+            #create pairs from indices
+            pair_dict = self.create_pairs_from_blocking_approach(
+                df=df,
+                field_config=self.field_config,
+                blocks=blocks
             )
+
+            #score pairs based on configuration methods
+            '''
+            pair_dict
+            {'title': array([[ 1,  0],
+               ...[30, 29]])}'''
+            matches = self.get_field_similarity_scores_from_pairs(
+                df=df,
+                pair_dict=pair_dict,
+                field_config=self.field_config,
+                threshold=self._threshold
+                )
         
         #align results with original index
         groups = self.match_pairs_to_columns(
             df=df, 
             matches=matches
             )
+        self.vector_cache.clear()
 
         return groups
 
 
-    def is_process_memory_constrained(self, arr: np.array) -> bool:
-        """Determine if the dot product is constrained by memory.
-        Assuming default datatype `float64` with 8 bytes.
-        ref: https://stackoverflow.com/questions/25046076/python-numpy-huge-matrices-multiplication
+    def link(
+            self, 
+            left_df: pd.DataFrame, right_df: pd.DataFrame, 
+            index: LinkIndex = None, batch_size: int = None
+            ) -> pd.DataFrame:
+        """Link the records of `left_df` to those of `right_df`, based on the
+        `field_config`, and get a table of matches with the index labels
+        `left_idx` and `right_idx`, a score for each field and the combined
+        `scores`.
+
+        Blocking runs on both sides and only creates cross-source pairs, which
+        every field scores.  The right side is indexed once, by
+        `create_link_index()`; pass the `index` to reuse it across calls.  With
+        `batch_size`, the left records are linked in batches of that many.
+
+        Usage::
+            >>> index = Matcher.create_link_index(reference_df)
+            >>> matches = Matcher.link(incoming_df, reference_df, index=index, batch_size=100_000)
+            >>> matches
+                   left_idx  right_idx     title    artist    scores
+                0         3       1022  0.912871  1.000000  0.956435
+                ...
         """
-        result = {
-            'record_size': True,
-            'dot_product_size': True
-        }
-        item_size = arr.dtype.itemsize
-        records_size_in_mb = item_size * arr.shape[0] * 1 / 1024 ** 2
-        tolerance = records_size_in_mb - (arr.nbytes / 1024 ** 2)
-        assert tolerance < .0001
-        dot_product_size_in_mb = item_size * arr.shape[0] * arr.shape[0] / 1024 ** 2
-
-        if records_size_in_mb < self._available_memory:
-            result['record_size'] = False
-        if dot_product_size_in_mb < self._available_memory:
-            result['dot_product_size'] = False
-
-        return result
+        index = index or self.create_link_index(right_df)
+        fields = list( self.field_config['scoring'].keys() )
+        right_values = {
+            field: prepare_field_values(right_df[field], sim_type).reset_index(drop=True)
+            for field, sim_type in self.field_config['scoring'].items()
+            }
+        n_right = right_df.shape[0]
+        batch_size = batch_size or max(left_df.shape[0], 1)
+
+        tables = []
+        for start in range(0, left_df.shape[0], batch_size):
+            left = left_df.iloc[start:start + batch_size]
+            n_left = left.shape[0]
+            pairs = index.candidate_pairs(left)
+
+            #right records follow the left ones, so each pair (right, left) has i > j
+            n_records = n_left + n_right
+            field_values = {
+                field: pd.concat([
+                    prepare_field_values(left[field], sim_type).reset_index(drop=True), 
+                    right_values[field]
+                    ], ignore_index=True)
+                for field, sim_type in self.field_config['scoring'].items()
+                }
+            store = CandidatePairs(n_records, np.sort((n_left + pairs[:, 1]) * n_records + pairs[:, 0]))
+            field_keys = {field: store.keys for field in fields}
+            with self.get_executor(field_values) as executor:
+                combined = self.score_candidate_pairs(field_values, store, field_keys, self.field_config, self._threshold, executor)
+            matches = store.to_frame(combined > self._threshold, combined)
+
+            table = pd.DataFrame({
+                'left_idx': left.index[matches[1].to_numpy()],
+                'right_idx': right_df.index[matches[0].to_numpy() - n_left],
+                })
+            for column in fields + ['scores']:
+                table[column] = matches[column].to_numpy()
+            order = np.lexsort((matches[0].to_numpy(), matches[1].to_numpy()))
+            tables.append(table.iloc[order])
+
+        self.vector_cache.clear()
+        if not tables:
+            return pd.DataFrame(columns=['left_idx', 'right_idx'] + fields + ['scores'])
+        return pd.concat(tables, ignore_index=True)
+
+
+    def create_link_index(self, right_df: pd.DataFrame) -> LinkIndex:
+        """Blocking index of the right side of `link()`, from the blocking
+        operation of the `field_config` on the shared blocking `fields`, or else
+        the scored fields.  Without blocking, every pair is a candidate.
+
+        Cross-source blocks are only purged by `purging_threshold`.  Options
+        that the index does not apply raise a TypeError rather than being
+        ignored: the `sorted_neighborhood` operation, the `meta` process,
+        `comparison_budget`, `filter_ratio` and knn on `embedding` vectors.
+
+        Usage::
+            >>> index = Matcher.create_link_index(reference_df)
+        """
+        blocking = self.field_config['blocking']
+        if blocking.get('operation') == 'sorted_neighborhood':
+            raise TypeError
+        if blocking.get('process') == 'meta' or blocking.get('vectors', 'tfidf') != 'tfidf':
+            raise TypeError
+        if blocking.get('comparison_budget') is not None or blocking.get('filter_ratio') is not None:
+            raise TypeError
+        return LinkIndex(
+            right_df,
+            fields=blocking.get('fields') or list( self.field_config['scoring'].keys() ),
+            operation=blocking.get('operation'),
+            purging_threshold=blocking.get('purging_threshold', self._default_purging_threshold),
+            bands=blocking.get('bands', self._default_lsh_bands),
+            rows=blocking.get('rows', self._default_lsh_rows),
+            n_neighbors=int(blocking.get('neighbors', self._default_knn_neighbors)),
+            cutoff=blocking.get('cutoff', 0.0),
+            n_components=blocking.get('components')
+            )
+
+
+    def plan_memory(self, df: pd.DataFrame) -> dict:
+        """Estimate the memory of each matching stage from the config and the
+        data, and choose blocking and chunk size to fit the memory budget.
+
+        The budget is measured from free system memory, capped by `memory_limit`.
+        The plan is kept in `self.plan`; see `planning.format_plan()` for a report.
+
+        Usage::
+            >>> Matcher = EntityMatcher(field_config, memory_limit=4 * 1024 ** 3)
+            >>> print(planning.format_plan(Matcher.plan_memory(df)))
+        """
+        self.plan = plan_memory(
+            df=df,
+            field_config=self.field_config,
+            memory_limit=self.memory_limit,
+            default_blocking=self._default_blocking,
+            budget_fraction=self._memory_budget_fraction,
+            sparse_cosine=self.is_sparse_cosine_applicable(self.field_config),
+            sparse_top_k=self._sparse_top_k,
+            n_jobs=get_n_jobs(self.n_jobs),
+            lsh_bands=self._default_lsh_bands,
+            lsh_rows=self._default_lsh_rows
+        )
+        return self.plan
     
 
-    def create_unique_index_pairs(self, df):
-        """Create pairs for each record index when not applying blocking."""
-        rows = df.shape[0] - 1
-        groups = []
-        for idx in range(0,rows):
-            group = [[idx, item] for item in range(0,rows) if not (idx <= item)]
-            groups.extend(group)
-        pairs = np.array(groups)
-        return pairs
+    def create_unique_index_pairs(self, df, chunk_size: int = None):
+        """Create pairs for each record index when not applying blocking.
+
+        All (i, j) pairs, with i > j, are returned as a single int32 array.  If
+        `chunk_size` is given, a generator of arrays with at most `chunk_size`
+        pairs is returned instead.
+        """
+        rows = df.shape[0]
+        if chunk_size:
+            return iter_index_pairs(rows, chunk_size)
+        return create_index_pairs(rows)
     
 
-    def create_pairs_from_blocking_approach(self, df: pd.DataFrame, field_config: dict) -> dict[str, np.ndarray]:
+    def is_sparse_cosine_applicable(self, field_config: dict) -> bool:
+        """Without blocking, fields that are all scored by `fuzzy` get their
+        candidates from the sparse cosine engine instead of every pair."""
+        return (
+            field_config['blocking'] == {} and
+            all(sim_type == 'fuzzy' for sim_type in field_config['scoring'].values())
+        )
+
+
+    def create_sparse_cosine_pairs(
+            self, 
+            df: pd.DataFrame, field_config: dict, threshold: float
+            ) -> np.ndarray:
+        """Create candidate pairs, without blocking, from the records' 3-gram
+        vectors.
+
+        Each record is vectorized once per field and pairs with a cosine
+        similarity of at least `threshold` are found with a chunked sparse
+        matrix product.  The combined score is a mean over the fields, so a pair
+        above the threshold is above it for at least one field: the union of the
+        fields' candidates loses no matches unless `_sparse_top_k` is set.
+        """
+        n_records = df.shape[0]
+        keys = [np.empty(0, dtype=np.int64)]
+        for field in field_config['scoring'].keys():
+            token_matrix = cosine.get_normalized_token_matrix(df[field].fillna(""))
+            pairs, _ = cosine.sparse_cosine_top_k(
+                token_matrix, 
+                cutoff=threshold, 
+                top_k=self._sparse_top_k, 
+                block_size=self._sparse_block_size
+                )
+            keys.append(unique_pair_keys(pairs, n_records))
+        return keys_to_pairs(np.unique(np.concatenate(keys)), n_records)
+
+
+    def create_pairs_from_blocking_approach(
+            self, df: pd.DataFrame, field_config: dict, blocks: dict[str, Blocks] = None
+            ) -> dict[str, np.ndarray]:
         """Pairs are generated based on blocking operation and process methods,
         if methods are chosen.
 
         Note: This method forces a consistent output which may not be possible 
         for some blocking approaches, such as `sorted_neighborhood()`.
-        
+
+        Blocks are purged with `purge_blocks()`, configured with the blocking
+        keys `purging_threshold`, `comparison_budget` and `filter_ratio`.
+
+        The `meta` process purges the blocks, then keeps the pairs of the
+        weighted block graph of `meta_blocks()`, configured with the blocking
+        keys `weighting` (CBS, ECBS, JS, ARCS), `pruning` (WEP, CNP) and
+        `edge_weight_threshold` (WEP only, default the mean edge weight).
+
+        The `lsh` operation blocks on MinHash bands of 3-grams, with the blocking
+        keys `bands` and `rows` (hashes per band).
+
+        The `sorted_neighborhood` operation creates pairs directly, with
+        `create_sorted_neighborhood_pairs()`, and no process is applied.  So
+        does the `knn` operation, with `create_knn_pairs()`.
+
+        If `field_config['blocking']['fields']` lists blocking key fields, the
+        blocks of those fields produce a single union candidate set, returned
+        under `_default_combined_pair_name`, on which every field is scored.
+
+        Blocks already built by `plan_memory()` are passed as `blocks`, by
+        blocking field, and are not built again.
+
+        Usage::
+            >>> field_config['blocking'] = {"operation": "standard", "process": "purge", "fields": ["title", "artist"]}
+            >>> Matcher.create_pairs_from_blocking_approach(df, field_config)
+                {'Combined_Fields': array([[  36,   12],
+                   ...
         """
         pairs = {}
         fields = field_config['scoring'].keys()
+        shared_fields = field_config['blocking'].get('fields')
+        if shared_fields:
+            fields = shared_fields
 
-        if field_config['blocking'] == {}:
+        if field_config['blocking'] == {} and self.is_sparse_cosine_applicable(field_config):
+            candidate_pairs = self.create_sparse_cosine_pairs(df, field_config, self._threshold)
             for field in fields:
-                pairs[field] = self.create_unique_index_pairs(df[field])
+                pairs[field] = candidate_pairs
+
+        elif field_config['blocking'] == {}:
+            all_pairs = self.create_unique_index_pairs(df)
+            for field in fields:
+                pairs[field] = all_pairs
+
+        elif field_config['blocking']['operation'] == 'sorted_neighborhood':
+            pairs = self.create_sorted_neighborhood_pairs(df, field_config)
+
+        elif field_config['blocking']['operation'] == 'knn':
+            pairs = self.create_knn_pairs(df, field_config)
 
         else:
-            op = field_config['blocking']['operation']
-            match op:
-                case 'standard':
-                    for field in fields:
-                        pairs[field] = standard_blocking(df[field])
-                case 'token':
-                    for field in fields:
-                        pairs[field] = token_blocking(df[field])
+            pairs = dict(blocks) if blocks else self.create_blocks(df, field_config)
             proc = field_config['blocking']['process']
             match proc:
                 case 'purge':
+                    expansion = field_config['blocking'].get('expansion', 'all')
                     for field in fields:
-                        dicts = purge_blocks(pairs[field])
-                        dicts_without_nan = {k:v for k,v in dicts.items() if k is not np.nan}
-                        indices = np.array( [np.array(pair) for pair in dicts_without_nan.values()], dtype="object" )
-                        tuples = []
-                        for idx, line in enumerate(indices):
-                            grp = []
-                            if len(line) > 2:
-                                grp.append(line[:2])
-                                for item in line[2:]:
-                                    grp.append(np.append(line[0], item))
-                            else:
-                                grp.append(line)
-                            #print(idx)
-                            tuples.extend(grp)
-                        pairs[field] = np.array(tuples)
+                        blocks = self.purge_blocks(pairs[field], field_config)
+                        pairs[field] = expand_blocks(blocks, mode=expansion)
+                case 'meta':
+                    for field in fields:
+                        blocks = self.purge_blocks(pairs[field], field_config)
+                        pairs[field] = meta_blocks(
+                            df, 
+                            blocks, 
+                            edge_weight_threshold=field_config['blocking'].get('edge_weight_threshold'),
+                            weighting=field_config['blocking'].get('weighting', 'CBS'),
+                            pruning=field_config['blocking'].get('pruning', 'WEP')
+                            )
+
+            if shared_fields:
+                n_records = df.shape[0]
+                keys = [unique_pair_keys(pairs[field], n_records) for field in fields]
+                pairs = {self._default_combined_pair_name: keys_to_pairs(np.unique(np.concatenate(keys)), n_records)}
 
         return pairs
+
+
+    def create_blocks(self, df: pd.DataFrame, field_config: dict) -> dict[str, Blocks]:
+        """Blocks of each blocking field, from the blocking operation, before
+        any process is applied.  Blocking fields are the shared blocking
+        `fields`, or else the scored fields.
+
+        Usage::
+            >>> field_config['blocking'] = {"operation": "standard", "process": "purge"}
+            >>> Matcher.create_blocks(df, field_config)
+                {'title': Blocks(105,468 blocks, 127,451 members), ...
+        """
+        blocks = {}
+        fields = field_config['blocking'].get('fields') or field_config['scoring'].keys()
+        op = field_config['blocking']['operation']
+        match op:
+            case 'standard':
+                for field in fields:
+                    blocks[field] = standard_blocking(df[field])
+            case 'token':
+                for field in fields:
+                    blocks[field] = token_blocking(df[field], n_jobs=get_n_jobs(self.n_jobs))
+            case 'lsh':
+                for field in fields:
+                    blocks[field] = lsh_blocking(
+                        df[field], 
+                        bands=field_config['blocking'].get('bands', self._default_lsh_bands),
+                        rows=field_config['blocking'].get('rows', self._default_lsh_rows)
+                        )
+            case _:
+                raise TypeError
+        return blocks
+
+
+    def purge_blocks(self, blocks: Blocks, field_config: dict) -> Blocks:
+        """Blocks without missing keys, purged with the blocking keys 
+        `purging_threshold` (default 10000) and `comparison_budget`, then, with
+        a `filter_ratio`, filtered so each record is only in the smallest
+        share of its blocks.
+
+        Usage::
+            >>> field_config['blocking'] = {"operation": "token", "process": "purge", "comparison_budget": 50_000_000, "filter_ratio": 0.8}
+            >>> Matcher.purge_blocks(token_blocks, field_config)
+                Blocks(..., ... members)
+        """
+        blocking = field_config['blocking']
+        purging = {
+            'purging_threshold': blocking.get('purging_threshold', self._default_purging_threshold),
+            'comparison_budget': blocking.get('comparison_budget')
+            }
+        blocks = purge_blocks(Blocks.from_dict(blocks).drop_missing(), **purging)
+        if blocking.get('filter_ratio') is not None:
+            blocks = purge_blocks(filter_blocks(blocks, blocking['filter_ratio']), **purging)
+        return blocks
+
+
+    def create_sorted_neighborhood_pairs(self, df: pd.DataFrame, field_config: dict) -> dict[str, np.ndarray]:
+        """Pairs from `sorted_neighborhood()`, with a window of `window` records.
+
+        Each field is sorted on its own values.  If sort `keys` (columns, or
+        lists of columns) or shared blocking `fields` are given, they are the
+        passes of a multi-pass sort and give a single candidate set, under
+        `_default_combined_pair_name`, that every field is scored on.
+
+        Usage::
+            >>> field_config['blocking'] = {"operation": "sorted_neighborhood", "window": 5, "keys": ["title", ["artist", "album"]]}
+            >>> Matcher.create_sorted_neighborhood_pairs(df, field_config)
+                {'Combined_Fields': array([[  42,   12],
+                   ...
+        """
+        window_size = int(field_config['blocking'].get('window', self._default_window_size))
+        keys = field_config['blocking'].get('keys') or field_config['blocking'].get('fields')
+        if keys:
+            candidate_pairs = sorted_neighborhood(df, keys, window_size, multi_pass=True)
+            return {self._default_combined_pair_name: candidate_pairs}
+        return {
+            field: sorted_neighborhood(df, [field], window_size)
+            for field in field_config['scoring'].keys()
+            }
+
+
+    def create_knn_pairs(self, df: pd.DataFrame, field_config: dict) -> dict[str, np.ndarray]:
+        """Pairs from `knn_blocking()` of each record with its `neighbors` nearest
+        records, by cosine similarity of 3-gram TF-IDF vectors, of at least
+        `cutoff`.  With `components`, the vectors are reduced by TruncatedSVD.
+        With `vectors` of `embedding`, the vectors of the `embedding` scorer's
+        encoder are searched instead.
+
+        Each field is searched on its own values, or the pairs of the shared
+        blocking `fields` are combined under `_default_combined_pair_name`.
+
+        Usage::
+            >>> field_config['blocking'] = {"operation": "knn", "neighbors": 10, "cutoff": 0.5, "fields": ["title"]}
+            >>> Matcher.create_knn_pairs(df, field_config)
+                {'Combined_Fields': array([[  17,    3],
+                   ...
+        """
+        blocking = field_config['blocking']
+        options = {
+            'n_neighbors': int(blocking.get('neighbors', self._default_knn_neighbors)),
+            'cutoff': blocking.get('cutoff', 0.0),
+            'n_components': blocking.get('components'),
+            'vector_type': blocking.get('vectors', 'tfidf'),
+            'cache': self.vector_cache
+            }
+        shared_fields = blocking.get('fields')
+        if shared_fields:
+            n_records = df.shape[0]
+            keys = [unique_pair_keys(knn_blocking(df[field], **options), n_records) for field in shared_fields]
+            return {self._default_combined_pair_name: keys_to_pairs(np.unique(np.concatenate(keys)), n_records)}
+        return {
+            field: knn_blocking(df[field], **options)
+            for field in field_config['scoring'].keys()
+            }
+
+
+    def get_field_pair_keys(
+            self, 
+            df: pd.DataFrame, pair_dict: dict[str, np.ndarray], field_config: dict
+            ) -> dict[str, np.ndarray]:
+        """Sorted, unique pair keys to score for each field: the field's own pairs,
+        or the shared candidate set under `_default_combined_pair_name`."""
+        n_records = df.shape[0]
+        if list( pair_dict.keys() ) == [self._default_combined_pair_name]:
+            keys = unique_pair_keys(pair_dict[self._default_combined_pair_name], n_records)
+            return {field: keys for field in field_config['scoring']}
+
+        #fields sharing the same pair array share their keys
+        keys_by_array = {}
+        field_keys = {}
+        for field in field_config['scoring']:
+            pairs = pair_dict[field]
+            if id(pairs) not in keys_by_array:
+                keys_by_array[id(pairs)] = unique_pair_keys(pairs, n_records)
+            field_keys[field] = keys_by_array[id(pairs)]
+        return field_keys
     
 
     def get_field_similarity_scores_from_pairs(
@@ -219,42 +641,25 @@ class EntityMatcher:
                 (13794,)
         """
         matches = pd.DataFrame()
+        n_records = df.shape[0]
 
-        #get score for each field
-        field_scores = {}
-        for field, sim_type in field_config['scoring'].items():
-            pairs = pair_dict[field]
-            match sim_type:
-                case "exact":
-                    field_scores[field] = exact.exact_matches(df[field], pairs)
-                case "fuzzy": 
-                    mod_df = df[field].fillna("")
-                    field_scores[field] = cosine.cosine_similarities(mod_df, pairs)
-                case "levenshtein":
-                    mod_df = df[field].fillna("")
-                    field_scores[field] = levenshtein.levenshtein_distance(mod_df, pairs)
-                case "embedding":
-                    mod_df = df[field].fillna("")
-                    field_scores[field] = embedding.wv_cosine_similarities(mod_df, pairs)       #TODO
-        
         fields = list( pair_dict.keys() )
-        #combined score across fields
-        if fields == [self._default_combined_pair_name]:
-            pass
-
-        #individual score for each field
-        elif all( [field in df.columns for field in fields] ):
-            tmpDf = pd.DataFrame()
-            for field in fields:
-                tmp = pd.DataFrame(pair_dict[field])
-                tmp[field] = field_scores[field]
-                if tmpDf.empty:
-                    tmpDf = tmp
-                else: 
-                    tmpDf = pd.merge(tmpDf, tmp, on=[0,1], how='outer')
-            tmpDf['scores'] = tmpDf[fields].mean(axis=1, skipna=True)
-            matches = tmpDf[tmpDf['scores']>threshold].reset_index(drop=True)
-            assert matches[0].unique().shape[0] <= matches[0].shape[0]
+        #combined candidate set shared by every field, or individual pairs for each field
+        if (
+            fields == [self._default_combined_pair_name] or 
+            all( [field in df.columns for field in fields] )
+            ):
+            field_keys = self.get_field_pair_keys(df, pair_dict, field_config)
+            store = CandidatePairs(n_records, np.unique(np.concatenate(list(field_keys.values()))))
+            field_values = {
+                field: prepare_field_values(df[field], sim_type) 
+                for field, sim_type in field_config['scoring'].items()
+                }
+
+            #get score for each field, scattered into the pair store
+            with self.get_executor(field_values) as executor:
+                combined = self.score_candidate_pairs(field_values, store, field_keys, field_config, threshold, executor)
+            matches = store.to_frame(combined > threshold, combined)
 
         #some error occured
         else:
@@ -266,38 +671,221 @@ class EntityMatcher:
         return matches
     
 
-    def match_pairs_to_columns(
-            self, 
-            df: pd.DataFrame, matches: pd.DataFrame, new_column_name: str ='group'
+    def iter_pair_chunks(
+            self,
+            df: pd.DataFrame, field_config: dict, chunk_pairs: int, blocks: dict[str, Blocks] = None
+            ) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """Yield chunks of candidate pairs with, for each field, a mask of the
+        pairs in the chunk that the field's blocking produced.
+
+        Without blocking, pairs are generated chunk by chunk and every field
+        scores every pair.  With blocking, the per-field pairs are combined into
+        one sorted set of unique pair keys, which is then sliced into chunks.
+        """
+        fields = list( field_config['scoring'].keys() )
+        n_records = df.shape[0]
+
+        if field_config['blocking'] == {} and self.is_sparse_cosine_applicable(field_config):
+            candidate_pairs = self.create_sparse_cosine_pairs(df, field_config, self._threshold)
+            for start in range(0, candidate_pairs.shape[0], chunk_pairs):
+                pairs = candidate_pairs[start:start + chunk_pairs]
+                yield pairs, {field: np.ones(pairs.shape[0], dtype=bool) for field in fields}
+
+        elif field_config['blocking'] == {}:
+            for pairs in self.create_unique_index_pairs(df, chunk_size=chunk_pairs):
+                yield pairs, {field: np.ones(pairs.shape[0], dtype=bool) for field in fields}
+
+        else:
+            pair_dict = self.create_pairs_from_blocking_approach(
+                df=df,
+                field_config=field_config,
+                blocks=blocks
+            )
+            field_keys = self.get_field_pair_keys(df, pair_dict, field_config)
+            all_keys = np.unique(np.concatenate(list(field_keys.values())))
+            for start in range(0, all_keys.shape[0], chunk_pairs):
+                keys = all_keys[start:start + chunk_pairs]
+                yield (
+                    keys_to_pairs(keys, n_records),
+                    {field: is_member(keys, field_keys[field]) for field in fields}
+                )
+
+
+    def get_field_similarity_scores_from_chunks(
+            self,
+            df: pd.DataFrame, field_config: dict[str, str], threshold: float, chunk_pairs: int,
+            blocks: dict[str, Blocks] = None
+            ) -> pd.DataFrame:
+        """Streaming version of `get_field_similarity_scores_from_pairs()`.
+
+        Every configured field is scored on a chunk of pairs, the threshold is
+        applied to the chunk and only the surviving pairs are kept.  The result
+        has the same columns: the pair indices `0` and `1`, a score for each
+        field and the combined `scores`.
+        """
+        fields = list( field_config['scoring'].keys() )
+        field_values = {
+            field: prepare_field_values(df[field], sim_type) 
+            for field, sim_type in field_config['scoring'].items()
+            }
+
+        chunks = []
+        with self.get_executor(field_values) as executor:
+            for pairs, masks in self.iter_pair_chunks(df, field_config, chunk_pairs, blocks):
+                keys = pairs_to_keys(pairs, df.shape[0])
+                store = CandidatePairs(df.shape[0], np.unique(keys))
+                field_keys = {field: np.sort(keys[masks[field]]) for field in fields}
+                combined = self.score_candidate_pairs(field_values, store, field_keys, field_config, threshold, executor)
+                chunks.append(store.to_frame(combined > threshold, combined))
+
+        if not chunks:
+            return pd.DataFrame(columns=[0, 1] + fields + ['scores'])
+        return pd.concat(chunks, ignore_index=True)
+
+
+    def get_scoring_order(self, field_config: dict) -> list[str]:
+        """Order in which fields are scored: the `field_config['cascade']` list,
+        cheapest method first if `cascade` is True, or the `scoring` order."""
+        cascade = field_config.get('cascade')
+        if isinstance(cascade, list):
+            return cascade
+        fields = list( field_config['scoring'].keys() )
+        if cascade:
+            return sorted(fields, key=lambda field: self._scoring_costs[field_config['scoring'][field]])
+        return fields
+
+
+    def get_executor(self, field_values: dict[str, pd.Series]) -> ScoringExecutor:
+        """Executor that scores the fields' pairs with a pool of `n_jobs` workers,
+        given on the matcher or as `field_config['n_jobs']` (-1 for every core)."""
+        return ScoringExecutor(
+            field_values, 
+            n_jobs=self.n_jobs, 
+            chunk_size=self._executor_chunk_pairs, 
+            backend=self._executor_backend,
+            cache=self.vector_cache
+            )
+
+
+    def score_candidate_pairs(
+            self,
+            field_values: dict[str, pd.Series], 
+            store: CandidatePairs, 
+            field_keys: dict[str, np.ndarray], 
+            field_config: dict, 
+            threshold: float,
+            executor: ScoringExecutor = None
             ) -> np.ndarray:
-        """..
+        """Score each field on its `field_keys`, scattering the scores into the
+        pair `store`, and return the combined score of every pair in the store.
 
-        sb_pairs[np.where(sb_pairs[:,0]==idx)]
-        rows_group_1 = sb_pairs[idx_group_1][:,1]
-        rows_group_1 = np.insert(rows_group_1, 0, idx)
-        row_pairs = df[['title','artist','album']].iloc[rows_group_1]
-        
-        scores = get_field_similarity_scores_from_pairs(df, sb_pairs, field_config)
-        scores['title'].shape
-        (13794,).
-        
-        TODO:optimize performance 
+        The combined score is the mean of the available field scores, weighted
+        by `field_config['weights']` (default 1).  With `field_config['cascade']`
+        the fields are scored cheapest first and, after each field, pairs that
+        can no longer exceed the `threshold` (even if every remaining field
+        scored 1) are pruned, so expensive fields only score the viable pairs.
+        Pruned pairs have a combined score of NaN.
+
+        Pairs are scored by the `executor` (serially if not given).  Without a
+        cascade, every field is scored concurrently; with one, each field's
+        pairs are scored concurrently once the previous field has pruned them.
+
+        Usage::
+            >>> field_config['weights'] = {'title': 2, 'artist': 1, 'number': .5}
+            >>> field_config['cascade'] = True
         """
+        weights = field_config.get('weights', {})
+        order = self.get_scoring_order(field_config)
+        members = {
+            field: (
+                np.ones(len(store), dtype=bool) if field_keys[field].shape[0] == len(store) 
+                else is_member(store.keys, field_keys[field])
+            )
+            for field in order
+            }
 
-        df[new_column_name] = ''
-        for i in matches.index:
-            #print( df['title'].iloc[ list(matches[[0,1]].iloc[i]) ] )
-            grp = list(matches[[0,1]].iloc[i])
-            if df[new_column_name].iloc[grp[0]] == '':
-                rows = matches[matches[0].isin(grp)]
-                idxs = list(set(rows[1].values))
-                idxs.insert(0, grp[0])
-                df[new_column_name].iloc[ idxs ] = grp[0]
-        new_column = df[new_column_name]
-        df.drop(columns=[new_column_name], inplace=True)
-        return new_column
+        executor = executor or ScoringExecutor(field_values, cache=self.vector_cache)
+        field_scores = {}
+        if not field_config.get('cascade'):
+            field_scores = executor.score({
+                field: (field_config['scoring'][field], keys_to_pairs(store.keys[members[field]], store.n_records))
+                for field in order
+                })
+
+        total = np.zeros(len(store), dtype=np.float64)
+        weight = np.zeros(len(store), dtype=np.float64)
+        remaining = sum( weights.get(field, 1) * members[field].astype(np.float64) for field in order )
+        viable = np.ones(len(store), dtype=bool)
+        scored = {}
+        for field in order:
+            sim_type = field_config['scoring'][field]
+            field_weight = weights.get(field, 1)
+            to_score = members[field] & viable
+            keys = store.keys[to_score]
+            if field in field_scores:
+                scores = field_scores.pop(field)
+            else:
+                scores = executor.score({field: (sim_type, keys_to_pairs(keys, store.n_records))})[field]
+            store.set_scores_by_keys(field, keys, scores)
+            scored[field] = (to_score, scores)
+
+            if field_config.get('cascade'):
+                total[to_score] += field_weight * scores
+                weight[to_score] += field_weight
+                remaining = remaining - field_weight * members[field]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    upper_bound = (total + remaining) / (weight + remaining)
+                viable &= upper_bound > threshold
+
+        #sum in the `scoring` order, so a cascade gives the same scores as scoring every field
+        total[:] = 0
+        weight[:] = 0
+        for field in field_config['scoring']:
+            to_score, scores = scored.pop(field)
+            total[to_score] += weights.get(field, 1) * scores
+            weight[to_score] += weights.get(field, 1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            combined = total / weight
+        combined[~viable] = np.nan
+        return combined
 
-        
+
+    def match_pairs_to_columns(
+            self, 
+            df: pd.DataFrame, matches: pd.DataFrame, new_column_name: str ='group', canonical: str = None
+            ) -> pd.Series:
+        """Group matched records into clusters and return a column, aligned to 
+        `df`, with the canonical record of each record's cluster.
+
+        Clusters are the connected components of the graph of matched pairs, so
+        transitive matches are fully resolved in one pass.  The canonical record
+        is the lowest (`canonical='min'`) or highest (`'max'`) position in the
+        cluster, or the value of the column `canonical` at the lowest position.
+        Records without any match are left as ''.
+
+        Usage::
+            >>> groups = Matcher.match_pairs_to_columns(df, matches, canonical='CID')
+            >>> groups.value_counts()
+        """
+        canonical = canonical or self._canonical_record
+        n_records = df.shape[0]
+        pairs = matches[[0,1]].to_numpy(dtype=np.int64)
+
+        labels = get_connected_components(pairs, n_records)
+        canonical_records = get_canonical_records(
+            labels, 
+            canonical='max' if canonical == 'max' else 'min'
+            )
+        if canonical in ['min', 'max']:
+            ids = canonical_records.astype(object)
+        else:
+            ids = df[canonical].to_numpy(dtype=object)[canonical_records]
+
+        is_matched = np.zeros(n_records, dtype=bool)
+        is_matched[pairs.ravel()] = True
+        ids[~is_matched] = ''
+        return pd.Series(ids, index=df.index, name=new_column_name, dtype=object)
 
 
     def calc_overall_scores(
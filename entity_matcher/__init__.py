@@ -1,5 +1,6 @@
 from entity_matcher.config import field_config
 from entity_matcher.EntityMatcher import EntityMatcher
+from entity_matcher.match_index import MatchIndex
 from entity_matcher import utils
 
 
@@ -7,5 +8,6 @@ from entity_matcher import utils
 __all__ = [
     "field_config",
     "EntityMatcher",
+    "MatchIndex",
     "utils"
     ]
\ No newline at end of file
@@ -8,77 +8,350 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 
+from .blocking import (
+    Blocks,
+    standard_blocking,
+    token_blocking,
+    sorted_neighborhood
+)
+
 import pandas as pd
 import numpy as np
 
 
 def purge_blocks(
-    blocks: dict[str, list], purging_threshold: int = 10000
-) -> dict[str, list]:
+    blocks: Blocks, purging_threshold: int = 10000, comparison_budget: int = None
+) -> Blocks:
     """Reduces the number of items in a block to a maximum threshold value
 
+    Blocks of a single record are removed, as are blocks of `purging_threshold`
+    records or more.  With a `comparison_budget`, the threshold is lowered
+    to `get_purging_threshold()` so the blocks kept create at most that many
+    comparisons.
+
     Usage::
         >>> sb_title = purge_blocks(sb_title)
         >>> sb_title
-            {'well you needn t first down': [2, 33833], 'macabre discovery di...
-        >>> token_blocks = purge_blocks(token_blocks)
+            Blocks(9,862 blocks, 21,342 members)
+        >>> token_blocks = purge_blocks(token_blocks, comparison_budget=50_000_000)
         >>> token_blocks
             ...
     """
-    blocks_purged = {
-        key: indices
-        for key, indices in blocks.items()
-        if len(indices) < purging_threshold and len(indices) > 1
-    }
-    return blocks_purged
+    blocks = Blocks.from_dict(blocks)
+    if comparison_budget is not None:
+        purging_threshold = min(purging_threshold, get_purging_threshold(blocks.sizes, comparison_budget))
+    sizes = blocks.sizes
+    return blocks.select((sizes < purging_threshold) & (sizes > 1))
+
+
+def get_block_cardinalities(blocks: Blocks) -> np.ndarray:
+    """Comparisons, `size * (size - 1) / 2`, each block creates.
+
+    Usage::
+        >>> get_block_cardinalities({'a': [0, 3], 'b': [1, 2, 4]})
+            array([1, 3])
+    """
+    sizes = Blocks.from_dict(blocks).sizes
+    return sizes * (sizes - 1) // 2
+
+
+def get_purging_threshold(block_sizes: np.ndarray, comparison_budget: int) -> int:
+    """Smallest purging threshold, for `purge_blocks()`, that keeps the
+    largest blocks whose comparisons, smallest blocks first, total at most
+    `comparison_budget`.  Blocks of the same size are kept or removed together.
+
+    Usage::
+        >>> get_purging_threshold(blocks.sizes, comparison_budget=50_000_000)
+            1734
+        >>> get_purging_threshold(np.array([2, 3, 4]), comparison_budget=5)
+            4
+    """
+    sizes = np.asarray(block_sizes, dtype=np.int64)
+    sizes = sizes[sizes > 1]
+    unique_sizes, counts = np.unique(sizes, return_counts=True)
+    comparisons = np.cumsum(counts * unique_sizes * (unique_sizes - 1) // 2)
+    within_budget = unique_sizes[comparisons <= comparison_budget]
+    return int(within_budget.max()) + 1 if within_budget.shape[0] else 2
+
+
+def filter_blocks(blocks: Blocks, filter_ratio: float = 0.8) -> Blocks:
+    """Keep each record only in the smallest `filter_ratio` of its blocks,
+    rounded up so a record stays in at least one block.  Ties in block size
+    keep the earlier block.  Blocks left with a single record are kept, so
+    purge afterwards.
+
+    Usage::
+        >>> filter_blocks({'a': [0, 1], 'b': [0, 1, 2], 'c': [0, 2]}, filter_ratio=0.5)
+            Blocks(3 blocks, 4 members)
+        >>> dict(filter_blocks({'a': [0, 1], 'b': [0, 1, 2], 'c': [0, 2]}, filter_ratio=0.5))
+            {'a': array([0, 1], dtype=int32), 'b': array([], dtype=int32), 'c': array([0, 2], dtype=int32)}
+    """
+    blocks = Blocks.from_dict(blocks)
+    sizes = blocks.sizes
+    block_of_entry = np.repeat(np.arange(sizes.shape[0]), sizes)
+    members = blocks.members
+
+    #rank each record's blocks from smallest
+    order = np.lexsort((block_of_entry, sizes[block_of_entry], members))
+    members_sorted = members[order]
+    block_counts = np.bincount(members_sorted, minlength=int(members.max()) + 1 if members.shape[0] else 0)
+    rank = np.arange(order.shape[0]) - (np.cumsum(block_counts) - block_counts)[members_sorted]
+    keep = np.zeros(order.shape[0], dtype=bool)
+    keep[order] = rank < np.ceil(filter_ratio * block_counts[members_sorted])
+
+    kept_sizes = np.bincount(block_of_entry[keep], minlength=sizes.shape[0])
+    offsets = np.concatenate(([0], np.cumsum(kept_sizes)))
+    return Blocks(blocks.keys_array, offsets, members[keep])
+
+
+from scipy.sparse import csr_matrix, diags, tril
+
+from .pairs import (
+    triangle_index_to_pairs,
+    get_pair_dtype,
+    unique_pair_keys,
+    keys_to_pairs
+)
+
+
+def blocks_to_csr(blocks: Blocks | dict[str, list]) -> tuple[np.ndarray, np.ndarray]:
+    """Get the CSR-style pair of arrays of blocks: `offsets` (int64), where
+    block `b` holds `members[offsets[b]:offsets[b+1]]`, and `members` (int32).
+
+    Usage::
+        >>> offsets, members = blocks_to_csr({'a': [0, 3], 'b': [1, 2, 4]})
+        >>> offsets, members
+            (array([0, 2, 5]), array([0, 3, 1, 2, 4], dtype=int32))
+    """
+    return Blocks.from_dict(blocks).to_csr()
+
+
+def expand_blocks(
+    blocks: Blocks | dict[str, list] | tuple[np.ndarray, np.ndarray], mode: str = 'all', deduplicate: bool = True
+) -> np.ndarray:
+    """Expand blocks into pairs (i, j), with i > j, using only NumPy index
+    arithmetic.  `mode='all'` emits every pair within a block and `mode='star'`
+    pairs the first member of a block with each of the others.  Pairs found in
+    more than one block are removed if `deduplicate`.
+
+    Blocks are either `Blocks`, a dict of indices or the `(offsets, members)`
+    arrays of `blocks_to_csr()`.
+
+    Usage::
+        >>> expand_blocks({'a': [0, 3], 'b': [1, 2, 4]})
+            array([[2, 1],
+                   [3, 0],
+                   [4, 1],
+                   [4, 2]], dtype=int32)
+        >>> expand_blocks({'a': [0, 3], 'b': [1, 2, 4]}, mode='star')
+            array([[2, 1],
+                   [3, 0],
+                   [4, 1]], dtype=int32)
+    """
+    offsets, members = blocks if isinstance(blocks, tuple) else blocks_to_csr(blocks)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    sizes = np.diff(offsets)
+    n_records = int(members.max()) + 1 if members.shape[0] else 0
+    dtype = get_pair_dtype(n_records)
+
+    match mode:
+        case 'all':
+            counts = sizes * (sizes - 1) // 2
+        case 'star':
+            counts = np.maximum(sizes - 1, 0)
+        case _:
+            raise ValueError(f'mode must be `all` or `star`, not {mode}')
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty((0, 2), dtype=dtype)
+
+    block_of_pair = np.repeat(np.arange(sizes.shape[0]), counts)
+    local = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    start = offsets[block_of_pair]
+    if mode == 'all':
+        first, second = triangle_index_to_pairs(local)
+    else:
+        first, second = local + 1, np.zeros(total, dtype=np.int64)
+    left = members[start + first]
+    right = members[start + second]
+    del block_of_pair, local, start, first, second
 
+    if deduplicate:
+        return keys_to_pairs(unique_pair_keys(np.column_stack((left, right)), n_records), n_records)
+    pairs = np.column_stack((np.maximum(left, right), np.minimum(left, right))).astype(dtype, copy=False)
+    return pairs[pairs[:, 0] != pairs[:, 1]]
 
-import itertools
-from scipy.sparse import csr_matrix
+_weighting_schemes = ['CBS', 'ECBS', 'JS', 'ARCS']
+_pruning_schemes = ['WEP', 'CNP']
 
-def meta_blocks(df: pd.DataFrame, blocks: dict[str, list], edge_weight_threshold: int = 2) -> np.ndarray:
+
+def meta_blocks(
+    df: pd.DataFrame,
+    blocks: Blocks,
+    edge_weight_threshold: float = 2,
+    weighting: str = 'CBS',
+    pruning: str = 'WEP',
+    n_neighbors: int = None,
+    verbose: bool = False
+) -> np.ndarray:
     """Transform blocks into graph and prune lower-weighted edges
 
+    Edges of the block co-occurrence graph are weighted with `get_edge_weights()`
+    and pruned with `prune_edge_weights()`.  The defaults keep the pairs that
+    share at least two blocks.
+
+    Usage::
+        >>> pairs = meta_blocks(df, token_blocks)
+        >>> pairs = meta_blocks(df, token_blocks, edge_weight_threshold=None, weighting='JS', pruning='CNP')
+        >>> pairs
+            array([[  965,     0],
+                   [ 1806,     0],
+                   ...
     """
-    pairs = get_pairs_from_blocks(blocks)
-    adj_matrix1 = get_adjacency_matrix_from_pairs(pairs, (len(df), len(df)))
-    adj_matrix2 = prune_edges(adj_matrix1, edge_weight_threshold, verbose=True)
-    new_pairs = get_pairs_from_adj_matrix(adj_matrix2)
-    return new_pairs
+    n_records = len(df)
+    blocks = Blocks.from_dict(blocks)
+    graph = get_edge_weights(blocks, n_records, weighting)
+    if pruning == 'CNP' and n_neighbors is None:
+        #average number of blocks per record, as the cardinality of each node
+        n_neighbors = max(int(blocks.sizes.sum() / max(n_records, 1)) - 1, 1)
+    pruned = prune_edge_weights(graph, pruning, edge_weight_threshold, n_neighbors)
+    if verbose:
+        print(f"original edge count: {graph.nnz:,}")
+        print(f"edge count after pruning: {pruned.nnz:,}")
+    i, j = pruned.nonzero()
+    dtype = get_pair_dtype(n_records)
+    return np.column_stack((i.astype(dtype, copy=False), j.astype(dtype, copy=False)))
+
+
+def get_incidence_matrix(blocks: Blocks | dict[str, list], n_records: int) -> csr_matrix:
+    """Sparse record x block incidence matrix, with a one where a record is in a block.
+
+    Usage::
+        >>> get_incidence_matrix({'a': [0, 3], 'b': [1, 2, 3]}, 4).toarray()
+            array([[1, 0],
+                   [0, 1],
+                   [0, 1],
+                   [1, 1]], dtype=int32)
+    """
+    offsets, members = blocks_to_csr(blocks)
+    block_matrix = csr_matrix(
+        (np.ones(members.shape[0], dtype=np.int32), members, offsets),
+        shape=(offsets.shape[0] - 1, n_records)
+    )
+    return block_matrix.T.tocsr()
+
+
+def get_edge_weights(
+    blocks: Blocks | dict[str, list], n_records: int, weighting: str = 'CBS'
+) -> csr_matrix:
+    """Weighted block co-occurrence graph as a lower-triangle (i > j) sparse matrix.
+
+    Common blocks of each pair come from the product of the incidence matrix
+    with its transpose.  Weighting schemes:
+
+    * CBS: number of common blocks
+    * ECBS: CBS scaled by log(|B| / |B_i|) * log(|B| / |B_j|), for |B| blocks
+      of which record i is in |B_i|
+    * JS: Jaccard similarity of the blocks of both records
+    * ARCS: sum of 1 / comparisons in each common block
 
+    Usage::
+        >>> graph = get_edge_weights(token_blocks, len(df), weighting='JS')
+        >>> graph.nnz
+            ...
+    """
+    incidence = get_incidence_matrix(blocks, n_records)
+    sizes = np.diff(blocks_to_csr(blocks)[0])
+    match weighting:
+        case 'CBS' | 'ECBS' | 'JS':
+            common = incidence @ incidence.T
+        case 'ARCS':
+            comparisons = sizes * (sizes - 1) / 2
+            block_weights = np.divide(1.0, comparisons, out=np.zeros(sizes.shape[0]), where=comparisons > 0)
+            common = incidence @ diags(block_weights) @ incidence.T
+        case _:
+            raise ValueError(f'weighting must be one of {_weighting_schemes}, not {weighting}')
 
-def get_pairs_from_blocks(blocks: dict[str, list]) -> list[list]:
-    """Transform list to get pair (a,b) from each combination of values 
+    common = tril(common, k=-1).tocoo()
+    i, j, weights = common.row, common.col, common.data.astype(np.float64)
+    match weighting:
+        case 'ECBS':
+            n_blocks = sizes.shape[0]
+            record_blocks = incidence.getnnz(axis=1)
+            weights = weights * np.log(n_blocks / record_blocks[i]) * np.log(n_blocks / record_blocks[j])
+        case 'JS':
+            record_blocks = incidence.getnnz(axis=1)
+            weights = weights / (record_blocks[i] + record_blocks[j] - weights)
+    return csr_matrix((weights, (i, j)), shape=(n_records, n_records))
+
+
+def prune_edge_weights(
+    graph: csr_matrix, pruning: str = 'WEP', edge_weight_threshold: float = None, n_neighbors: int = 1
+) -> csr_matrix:
+    """Prune a weighted graph from `get_edge_weights()`.
+
+    * WEP: keep edges with a weight of at least `edge_weight_threshold`, or of
+      the mean edge weight if no threshold is given
+    * CNP: keep the `n_neighbors` highest weighted edges of each record; an
+      edge is kept if it is among those of either record
+
+    Usage::
+        >>> pruned = prune_edge_weights(graph, 'CNP', n_neighbors=5)
+    """
+    graph = graph.tocoo()
+    weights = graph.data
+    match pruning:
+        case 'WEP':
+            if edge_weight_threshold is None:
+                edge_weight_threshold = weights.mean() if weights.shape[0] else 0
+            keep = weights >= edge_weight_threshold
+        case 'CNP':
+            n_edges = weights.shape[0]
+            nodes = np.concatenate((graph.row, graph.col))
+            edges = np.tile(np.arange(n_edges), 2)
+            order = np.lexsort((-np.concatenate((weights, weights)), nodes))
+            nodes, edges = nodes[order], edges[order]
+            counts = np.bincount(nodes, minlength=graph.shape[0])
+            rank = np.arange(nodes.shape[0]) - (np.cumsum(counts) - counts)[nodes]
+            keep = np.zeros(n_edges, dtype=bool)
+            keep[edges[rank < n_neighbors]] = True
+        case _:
+            raise ValueError(f'pruning must be one of {_pruning_schemes}, not {pruning}')
+    return csr_matrix((weights[keep], (graph.row[keep], graph.col[keep])), shape=graph.shape)
+
+
+def get_pairs_from_blocks(blocks: Blocks) -> np.ndarray:
+    """Get pair (a,b), with a > b, from each combination of values in a block.
+    Pairs shared by several blocks are repeated once per block.
 
     Usage::
         >>> key = list(token_blocks.keys())[0]
         >>> token_blocks[key]
-            [0, 965, 1806, 6488, 8693, 9577, 11060, 12338, 12598]
+            array([    0,   965,  1806,  6488,  8693,  9577, 11060, 12338, 12598], dtype=int32)
         >>> pairs = get_pairs_from_blocks(token_blocks)
         >>> pairs
-            [(0, 965), (0, 1806), (0, 6488), (0, 8693), (0, 9577), (0, 11060), (0, 12338), (0, 12598), (965, 1806), (965, 6488), (965, ...
+            array([[  965,     0],
+                   [ 1806,     0],
+                   [ 1806,   965],
+                   ...
         >>> len(token_blocks)
             35977
         >>> len(pairs)
             3102150
     """
-    return [
-        pair
-        for indices in blocks.values()
-        for pair in list(itertools.combinations(indices, 2))
-    ]
+    return expand_blocks(blocks, mode='all', deduplicate=False)
 
 
 def get_adjacency_matrix_from_pairs(
-    pairs: list[list], matrix_shape: tuple[int, int]
+    pairs: np.ndarray, matrix_shape: tuple[int, int]
 ) -> csr_matrix:
-    """ """
+    """Count of each pair as a sparse matrix.  Counts are int32, so edges found
+    in many blocks do not overflow."""
 
-    idx1 = [pair[0] for pair in pairs]
-    idx2 = [pair[1] for pair in pairs]
-    ones = np.ones(len(idx1))
+    pairs = np.asarray(pairs).reshape(-1, 2)
+    ones = np.ones(pairs.shape[0], dtype=np.int32)
     return csr_matrix(
-        (ones, (idx1, idx2)), shape=matrix_shape, dtype=np.int8
+        (ones, (pairs[:, 0], pairs[:, 1])), shape=matrix_shape, dtype=np.int32
     )
 
 
@@ -104,7 +377,7 @@ def get_pairs_from_adj_matrix(adjacency_matrix: csr_matrix) -> np.ndarray:
 
 
 
-def union_of_blocks(df: pd.DataFrame, block_dict: dict[str, list]) -> np.ndarray:
+def union_of_blocks(df: pd.DataFrame, block_dict: dict[str, Blocks]) -> np.ndarray:
     """..."""
 
     adj_matrix_list = []
@@ -128,10 +401,25 @@ def get_union_of_adj_matrices(adj_matrix_list: list) -> csr_matrix:
 
 
 def run_all_blocking_approaches(df: pd.DataFrame, cols: list) -> dict:
-    """TODO"""
+    """Pairs of each blocking approach on the columns `cols`: the union of the
+    purged standard blocks of each column, the purged token blocks of all
+    columns and the sorted neighborhood of the sorted columns.
+
+    See `utils.compare_blocking_approaches()` for their quality and cost.
+
+    Usage::
+        >>> result = run_all_blocking_approaches(pp_df, ['title', 'artist', 'album'])
+        >>> {name: pairs.shape for name, pairs in result.items()}
+            {'sb_pairs': (6867135, 2), 'tb_pairs': (...), 'sn_pairs': (382296, 2)}
+    """
+    n_records = len(df)
+    sb_keys = [
+        unique_pair_keys(expand_blocks(purge_blocks(standard_blocking(df[col])).drop_missing()), n_records)
+        for col in cols
+        ]
     result = {
-        'sb_pairs': [],
-        'tb_pairs': [],
-        'sn_pairs': []
+        'sb_pairs': keys_to_pairs(np.unique(np.concatenate(sb_keys)), n_records),
+        'tb_pairs': expand_blocks(purge_blocks(token_blocking(df[cols]))),
+        'sn_pairs': sorted_neighborhood(df, cols)
               }
-    return result
\ No newline at end of file
+    return result
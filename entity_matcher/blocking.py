@@ -8,88 +8,384 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 
-from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from .pairs import (
+    get_pair_dtype,
+    pairs_to_keys,
+    keys_to_pairs
+)
+from .matching.cosine import get_token_matrix
+from .matching import embedding
 
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix, issparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.neighbors import NearestNeighbors
 
 import string
 import nltk
-from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
-nltk.download('punkt')
 nltk.download('stopwords')
 
 
-def standard_blocking(field_values: pd.Series) -> dict[str, list]:
+class Blocks(Mapping):
+    """Compact blocks of record indices.  Block `b` has key `keys[b]` and the
+    records `members[offsets[b]:offsets[b+1]]`, with int64 `offsets` and int32
+    `members`.  It reads like a dict of key to indices.
+
+    Usage::
+        >>> blocks = Blocks.from_entries(rows=np.array([0, 1, 2, 3]), keys=np.array(['a', 'b', 'a', 'a']))
+        >>> blocks['a']
+            array([0, 2, 3], dtype=int32)
+        >>> blocks.sizes
+            array([3, 1])
+    """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, members: np.ndarray) -> None:
+        self.keys_array = keys
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.members = np.asarray(members, dtype=np.int32)
+        self._positions = None
+
+    @classmethod
+    def from_entries(cls, rows: np.ndarray, keys: np.ndarray) -> 'Blocks':
+        """Build blocks from aligned arrays of (row, key) entries.  Blocks are in
+        order of first appearance and members are in row order.  Missing keys
+        form one block."""
+        codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        sizes = np.bincount(codes, minlength=len(uniques))
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        return cls(np.asarray(uniques, dtype=object), offsets, np.asarray(rows)[order])
+
+    @classmethod
+    def from_dict(cls, blocks: dict[str, list]) -> 'Blocks':
+        """Build blocks from a dict of key to indices."""
+        if isinstance(blocks, Blocks):
+            return blocks
+        keys = np.empty(len(blocks), dtype=object)
+        keys[:] = list(blocks.keys())
+        sizes = np.fromiter((len(indices) for indices in blocks.values()), dtype=np.int64, count=len(blocks))
+        members = np.fromiter(
+            (idx for indices in blocks.values() for idx in indices), dtype=np.int64, count=sizes.sum()
+        )
+        return cls(keys, np.concatenate(([0], np.cumsum(sizes))), members)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return self.offsets.shape[0] - 1
+
+    def __iter__(self):
+        return iter(self.keys_array)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if self._positions is None:
+            self._positions = {k: b for b, k in enumerate(self.keys_array)}
+        b = self._positions[key]
+        return self.members[self.offsets[b]:self.offsets[b + 1]]
+
+    def __repr__(self) -> str:
+        return f'Blocks({len(self):,} blocks, {self.members.shape[0]:,} members)'
+
+    def select(self, mask: np.ndarray) -> 'Blocks':
+        """Keep the blocks where the boolean `mask` is True."""
+        sizes = self.sizes[mask]
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        starts = self.offsets[:-1][mask]
+        positions = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+        return Blocks(self.keys_array[mask], offsets, self.members[positions])
+
+    def drop_missing(self) -> 'Blocks':
+        """Remove the block of records with a missing key."""
+        return self.select(~pd.isna(self.keys_array))
+
+    def to_csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """The `(offsets, members)` arrays of the blocks."""
+        return self.offsets, self.members
+
+
+def standard_blocking(field_values: pd.Series) -> Blocks:
     """Each value has an index of rows it is used.
     
     Usage::
         >>> sb_title = standard_blocking(pp_df.title)
         >>> key = list(sb_title.keys())[5]
         >>> sb_title[key]
-            'macabre discovery distorted drama': [5, 109011]
+            array([     5, 109011], dtype=int32)
     """
-    blocks = defaultdict(list)
-    for idx, key in enumerate(field_values):
-        if key is not None:
-            blocks[key].append(idx)
-
-    return blocks
+    keys = np.asarray(field_values, dtype=object)
+    rows = np.arange(keys.shape[0])
+    return Blocks.from_entries(rows, keys)
 
 
 stop_words_for_token_blocks = set(stopwords.words('english') + list(string.punctuation))
+token_pattern = r"\w+"
+
+
+def get_token_entries(
+    df: pd.DataFrame | pd.Series, stop_words: set = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Tokenize every column of `df` with a vectorized regex and return aligned
+    arrays of (row, token) entries, one per unique token of a row, in row order.
+    Rows are positions in `df`.  Stop words are removed with a hashed lookup.
+
+    Usage::
+        >>> rows, tokens = get_token_entries(pp_df[['title', 'artist']])
+        >>> rows[:4], tokens[:4]
+            (array([0, 0, 0, 1]), array(['well', 'needn', 'first', 'macabre'], dtype=object))
+    """
+    stop_words = stop_words_for_token_blocks if stop_words is None else stop_words
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    positions = pd.RangeIndex(df.shape[0])
+
+    entries = []
+    for column in df.columns:
+        values = pd.Series(df[column].to_numpy(), index=positions).dropna().astype(str)
+        tokens = values.str.findall(token_pattern).explode().dropna()
+        entries.append(tokens)
+    tokens = pd.concat(entries) if entries else pd.Series(dtype=object)
+    tokens = tokens[~tokens.isin(stop_words)]
 
-def token_blocking(df: pd.DataFrame, stop_words: set) -> dict[str, list]:
+    entries = pd.DataFrame({'row': tokens.index.to_numpy(dtype=np.int64), 'token': tokens.to_numpy(dtype=object)})
+    entries = entries.drop_duplicates().sort_values('row', kind='stable')
+    return entries['row'].to_numpy(), entries['token'].to_numpy(dtype=object)
+
+
+def _get_token_entries_for_chunk(args: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """Process pool task: token entries of a chunk of rows, offset to the frame."""
+    df, stop_words, offset = args
+    rows, tokens = get_token_entries(df, stop_words)
+    return rows + offset, tokens
+
+
+def token_blocking(
+    df: pd.DataFrame | pd.Series, stop_words: set = None, n_jobs: int = 1, chunk_size: int = 100_000
+) -> Blocks:
     """Each token (of the row of concatenated fields) has an index of rows it is used.
 
+    Tokens come from `get_token_entries()` and the token to rows index is built
+    with `pd.factorize`.  With `n_jobs` > 1, chunks of `chunk_size` rows are
+    tokenized in a process pool.
+
     Usage::
         >>> token_blocks = token_blocking(pp_df[columns], stop_words_for_token_blocks)
         >>> key = list(token_blocks.keys())[0]
         >>> token_blocks[key]
-            [0, 1322, 2024, 2522, 3140, 3567, 4838, 8641, 8808, 12284, 13095, 15137, 16321, 18281, ...]
+            array([    0,  1322,  2024,  2522,  3140,  3567,  4838,  8641,  8808, 12284, ...], dtype=int32)
         >>> tmp = list(token_blocks.values())[0]
         >>> pp_df[columns].iloc[tmp]
     """
-    blocks = defaultdict(list)
-    for i, row in enumerate(df.itertuples()):
-        # concatenate columns and tokenize
-        string = " ".join([str(value) for value in row if not pd.isna(value)])
-        tokens = set(
-            [word for word in word_tokenize(string) if word not in stop_words]
-        )
-        # create blocks
-        for token in tokens:
-            blocks[token].append(i)
+    if n_jobs == 1 or df.shape[0] <= chunk_size:
+        rows, tokens = get_token_entries(df, stop_words)
+    else:
+        tasks = [
+            (df.iloc[start:start + chunk_size], stop_words, start)
+            for start in range(0, df.shape[0], chunk_size)
+        ]
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None) as executor:
+            results = list(executor.map(_get_token_entries_for_chunk, tasks))
+        rows = np.concatenate([result[0] for result in results])
+        tokens = np.concatenate([result[1] for result in results])
+
+    return Blocks.from_entries(rows, tokens)
+
 
-    return blocks
+_minhash_prime = 2 ** 31 - 1     #hashes (a*x + b) mod p stay within int64
+_band_hash_multiplier = np.uint64(1_000_003)
+
+
+def minhash_signatures(
+    token_matrix: csr_matrix, num_perm: int, seed: int = 0, chunk_size: int = 2_000
+) -> np.ndarray:
+    """MinHash signature of each record of a records x tokens matrix: for each
+    of `num_perm` hash functions (a*x + b) mod p of the token columns, the
+    smallest hash of the record's tokens.  Records without tokens have the
+    signature p, which no hash reaches.
+
+    Usage::
+        >>> signatures = minhash_signatures(get_token_matrix(df.title), num_perm=100)
+        >>> signatures.shape
+            (127451, 100)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _minhash_prime, num_perm, dtype=np.int64)
+    b = rng.integers(0, _minhash_prime, num_perm, dtype=np.int64)
+    columns = np.arange(token_matrix.shape[1], dtype=np.int64)
+    column_hashes = (a[:, None] * columns[None, :] + b[:, None]) % _minhash_prime
+
+    n_records = token_matrix.shape[0]
+    signatures = np.full((n_records, num_perm), _minhash_prime, dtype=np.int64)
+    for start in range(0, n_records, chunk_size):
+        chunk = token_matrix[start:start + chunk_size]
+        has_tokens = np.diff(chunk.indptr) > 0
+        if not has_tokens.any():
+            continue
+        #min over each record's run of token hashes
+        hashes = column_hashes[:, chunk.indices]
+        minimums = np.minimum.reduceat(hashes, chunk.indptr[:-1][has_tokens], axis=1)
+        signatures[start + np.flatnonzero(has_tokens)] = minimums.T
+    return signatures
+
+
+def get_lsh_entries(
+    token_matrix: csr_matrix, bands: int = 20, rows: int = 5, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Aligned arrays of (row, key) entries: the hash of each band of each
+    record's MinHash signature, which also encodes the band.  Records without
+    tokens have no entries.  Matrices from the same vectorizer give keys that
+    can be compared.
+
+    Usage::
+        >>> rows, keys = get_lsh_entries(get_token_matrix(pp_df.title), bands=20, rows=5)
+    """
+    signatures = minhash_signatures(token_matrix, bands * rows, seed)
+    records = np.flatnonzero(np.diff(token_matrix.indptr) > 0)
+    signatures = signatures[records].astype(np.uint64)
+
+    keys = []
+    for band in range(bands):
+        band_hash = np.zeros(records.shape[0], dtype=np.uint64)
+        for column in signatures[:, band * rows:(band + 1) * rows].T:
+            band_hash = band_hash * _band_hash_multiplier + column
+        keys.append(band_hash * _band_hash_multiplier + np.uint64(band))
+
+    return np.tile(records, bands), np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+
+
+def lsh_blocking(field_values: pd.Series, bands: int = 20, rows: int = 5, seed: int = 0) -> Blocks:
+    """Records sharing a band of their MinHash signature over the 3-grams of
+    the fuzzy scorer are in a block.  The signature is split into `bands` bands
+    of `rows` hashes, so records with 3-gram Jaccard similarity s share a block
+    with probability 1 - (1 - s^rows)^bands: more bands raise recall, more rows
+    lower the pair count.  Records without 3-grams are not in any block.
+
+    Usage::
+        >>> lsh_title = lsh_blocking(pp_df.title, bands=20, rows=5)
+        >>> lsh_title
+            Blocks(..., ... members)
+    """
+    token_matrix = get_token_matrix(field_values.fillna("").astype(str))
+    return Blocks.from_entries(*get_lsh_entries(token_matrix, bands, rows, seed))
+
+
+def get_knn_pairs(
+    vectors: np.ndarray | csr_matrix, n_neighbors: int = 10, cutoff: float = 0.0, batch_size: int = 2_000
+) -> np.ndarray:
+    """Pairs of each record with its `n_neighbors` nearest records by cosine
+    similarity, if the similarity is at least `cutoff`.  Rows of `vectors` are
+    records; rows without any non-zero value are not paired.  The index is
+    queried in batches of `batch_size` records to bound memory.  Pairs are
+    positions (i, j), with i > j, without duplicates.
+
+    Usage::
+        >>> get_knn_pairs(np.array([[1, 0], [0.9, 0.1], [0, 1]]), n_neighbors=1, cutoff=0.5)
+            array([[1, 0]], dtype=int32)
+    """
+    n_records = vectors.shape[0]
+    if issparse(vectors):
+        records = np.flatnonzero(np.diff(vectors.tocsr().indptr) > 0)
+    else:
+        records = np.flatnonzero(np.abs(vectors).sum(axis=1) > 0)
+    n_neighbors = min(n_neighbors + 1, records.shape[0])
+    if n_neighbors < 2:
+        return np.empty((0, 2), dtype=get_pair_dtype(n_records))
+
+    index = NearestNeighbors(n_neighbors=n_neighbors, metric="cosine", algorithm="brute")
+    index.fit(vectors[records])
+    keys = []
+    for start in range(0, records.shape[0], batch_size):
+        batch = records[start:start + batch_size]
+        distances, neighbors = index.kneighbors(vectors[batch])
+        #the record itself is usually its own nearest neighbor, and is dropped as a self-pair
+        keep = (1 - distances) >= cutoff
+        left = np.repeat(batch, n_neighbors).reshape(-1, n_neighbors)[keep]
+        right = records[neighbors[keep]]
+        keys.append(pairs_to_keys(np.column_stack((left, right)), n_records))
+    return keys_to_pairs(np.unique(np.concatenate(keys)), n_records)
+
+
+def knn_blocking(
+    field_values: pd.Series,
+    n_neighbors: int = 10,
+    cutoff: float = 0.0,
+    n_components: int = None,
+    batch_size: int = 2_000,
+    vector_type: str = 'tfidf',
+    cache: embedding.VectorCache = None
+) -> np.ndarray:
+    """Pairs of each record with its nearest records by the cosine similarity
+    of their character 3-gram TF-IDF vectors, from `get_knn_pairs()`.  With
+    `n_components`, the vectors are first reduced by TruncatedSVD to a dense
+    float32 matrix.  With `vector_type` of `embedding`, the dense vectors of the
+    `embedding` scorer's encoder are used instead, from its vector `cache`.  The pair
+    count is at most `n_neighbors` per record, however skewed the values are.
+
+    Usage::
+        >>> knn_title = knn_blocking(pp_df.title, n_neighbors=10, cutoff=0.5)
+        >>> knn_title
+            array([[   17,     3],
+                   [   98,    12],
+                   ...], dtype=int32)
+    """
+    if vector_type == 'embedding':
+        return get_knn_pairs(embedding.encode_values(field_values, cache), n_neighbors, cutoff, batch_size)
+    vectorizer = TfidfVectorizer(analyzer="char", ngram_range=(3, 3), dtype=np.float32)
+    try:
+        vectors = vectorizer.fit_transform(field_values.fillna("").astype(str))
+    except ValueError:
+        #no record has a 3-gram
+        return np.empty((0, 2), dtype=get_pair_dtype(field_values.shape[0]))
+    if n_components and n_components < vectors.shape[1]:
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        has_tokens = np.diff(vectors.indptr) > 0
+        vectors = svd.fit_transform(vectors).astype(np.float32)
+        vectors[~has_tokens] = 0
+    return get_knn_pairs(vectors, n_neighbors, cutoff, batch_size)
 
 
 def sorted_neighborhood(
-    df: pd.DataFrame, keys: list, window_size: int = 3
+    df: pd.DataFrame, keys: list, window_size: int = 3, multi_pass: bool = False
 ) -> np.ndarray:
     """Pairs of rows created from the sorted columns
 
+    Records are sorted on `keys` and each is paired with the `window_size`
+    records before it.  With `multi_pass`, each item of `keys` (a column or a
+    list of columns) is a separate sort key and the pairs of every pass are
+    combined.  Pairs are positions (i, j), with i > j, without duplicates, in
+    the format of `expand_blocks()`.  Records missing every key are skipped.
+
     Usage::
         >>> sn_pairs = sorted_neighborhood(pp_df, columns)
         >>> sn_pairs
-            array([[ 99353,  13878],
-                   [ 99353,  73335],
-                   [ 13878,  73335],
+            array([[    42,     12],
+                   [    97,     12],
                    ...,
-                   [ 59927,  20462],
-                   [127393,  20462],
-                   [ 90786,  20462]])
+                   [127450, 126008]], dtype=int32)
+        >>> sn_pairs = sorted_neighborhood(pp_df, ['title', ['artist', 'album']], window_size=5, multi_pass=True)
         >>> pp_df[columns].iloc[sn_pairs[3]]
     """
+    n_records = df.shape[0]
+    passes = [key if isinstance(key, list) else [key] for key in keys] if multi_pass else [list(keys)]
 
-    sorted_indices = (
-        df[keys].dropna(how="all").sort_values(keys).index.tolist()
-    )
-    pairs = []
-    for window_end in range(1, len(sorted_indices)):
-        window_start = max(0, window_end - window_size)
-        for i in range(window_start, window_end):
-            pairs.append([sorted_indices[i], sorted_indices[window_end]])
+    keys_per_pass = []
+    for sort_keys in passes:
+        values = df[sort_keys].reset_index(drop=True).dropna(how="all")
+        sorted_positions = values.sort_values(sort_keys, kind="stable").index.to_numpy(dtype=np.int64)
+        for offset in range(1, window_size + 1):
+            if offset >= sorted_positions.shape[0]:
+                break
+            #each record with the record `offset` places before it
+            pairs = np.column_stack((sorted_positions[offset:], sorted_positions[:-offset]))
+            keys_per_pass.append(pairs_to_keys(pairs, n_records))
 
-    return np.array(pairs)
\ No newline at end of file
+    if not keys_per_pass:
+        return np.empty((0, 2), dtype=get_pair_dtype(n_records))
+    return keys_to_pairs(np.unique(np.concatenate(keys_per_pass)), n_records)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Clustering
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+import numpy as np
+
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def get_connected_components(pairs: np.ndarray, n_records: int) -> np.ndarray:
+    """Label each record with the connected component it belongs to, in the
+    undirected graph whose edges are the matched `pairs`.  Transitive matches,
+    (a,b) and (b,c), are resolved into one component.
+
+    Usage::
+        >>> get_connected_components(np.array([[1, 0], [2, 1], [4, 3]]), n_records=6)
+            array([0, 0, 0, 1, 1, 2], dtype=int32)
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    graph = coo_matrix(
+        (np.ones(pairs.shape[0], dtype=np.int8), (pairs[:, 0], pairs[:, 1])),
+        shape=(n_records, n_records)
+    )
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def get_canonical_records(labels: np.ndarray, canonical: str = 'min') -> np.ndarray:
+    """For each record, the position of the record that represents its
+    component: the lowest (`canonical='min'`) or highest (`canonical='max'`)
+    position in the component.
+
+    Usage::
+        >>> get_canonical_records(np.array([0, 0, 0, 1, 1, 2]), canonical='max')
+            array([2, 2, 2, 4, 4, 5])
+    """
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    match canonical:
+        case 'min':
+            is_canonical = np.r_[True, sorted_labels[1:] != sorted_labels[:-1]]
+        case 'max':
+            is_canonical = np.r_[sorted_labels[1:] != sorted_labels[:-1], True]
+        case _:
+            raise ValueError(f'canonical must be `min` or `max`, not {canonical}')
+    canonical_of_label = np.empty(labels.max() + 1 if labels.shape[0] else 0, dtype=np.int64)
+    canonical_of_label[sorted_labels[is_canonical]] = order[is_canonical]
+    return canonical_of_label[labels]
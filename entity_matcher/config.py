@@ -16,6 +16,34 @@ field_config = {
         >>> field_config.clear()
         >>> field_config['blocking'] = {}
         >>> field_config['scoring']['COLUMN_NAME'] = 'SCORE_METHOD'
+
+    Blocking on key fields, shared by every scored field:
+        >>> field_config['blocking'] = {"operation": "standard", "process": "purge", "fields": ['COLUMN_NAME']}
+
+    Purging blocks to a budget of comparisons, with each record kept only in
+    the smallest 80% of its blocks:
+        >>> field_config['blocking'] = {"operation": "token", "process": "purge", "comparison_budget": 50_000_000, "filter_ratio": 0.8}
+
+    Meta blocking of token blocks, keeping the strongest edges of each record:
+        >>> field_config['blocking'] = {"operation": "token", "process": "meta", "weighting": "JS", "pruning": "CNP"}
+
+    Near-duplicate blocking on MinHash bands of 3-grams:
+        >>> field_config['blocking'] = {"operation": "lsh", "process": "purge", "bands": 20, "rows": 5}
+
+    Nearest neighbor candidates, without block processing:
+        >>> field_config['blocking'] = {"operation": "knn", "neighbors": 10, "cutoff": 0.5, "fields": ['COLUMN_NAME']}
+
+    Embedding scoring, with a hashed 3-gram encoder or a local word-vector
+    file, and nearest neighbor candidates on the same vectors:
+        >>> field_config['scoring']['COLUMN_NAME'] = 'embedding'
+        >>> field_config['embedding'] = {"encoder": "hashed", "dimensions": 256}
+        >>> field_config['embedding'] = {"encoder": "word_vectors", "path": "glove.6B.100d.txt"}
+        >>> field_config['blocking'] = {"operation": "knn", "vectors": "embedding", "neighbors": 10}
+
+    Weighted fields, scored cheapest first with pruning of pairs that cannot
+    reach the threshold:
+        >>> field_config['weights'] = {'COLUMN_NAME': 2}
+        >>> field_config['cascade'] = True
     
     """
     "blocking":{
@@ -39,13 +67,20 @@ def validate_config(field_config: dict) -> bool:
 
     assert (
         field_config['blocking'] == {} or 
-        list(field_config['blocking'].keys()) == ['operation', 'process']
+        list(field_config['blocking'].keys())[:2] == ['operation', 'process']
     )
-    for op_or_proc in field_config['blocking'].keys():
-        assert type(field_config['blocking'][op_or_proc]) == str
+    for op_or_proc in ['operation', 'process']:
+        if op_or_proc in field_config['blocking'].keys():
+            assert type(field_config['blocking'][op_or_proc]) == str
+    for field in field_config['blocking'].get('fields', []):
+        assert type(field) == str
 
     assert list(field_config['scoring'].keys()).__len__() > 0
     for field in field_config['scoring'].keys():
         assert type(field_config['scoring'][field]) == str
+
+    for field, weight in field_config.get('weights', {}).items():
+        assert field in field_config['scoring'] and weight > 0
+    assert type(field_config.get('cascade', False)) in [bool, list]
     
     return True
\ No newline at end of file
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Scoring Executor
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from .matching import score_pairs
+from .matching.embedding import VectorCache
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import multiprocessing
+import os
+
+import pandas as pd
+import numpy as np
+
+
+#column data and vector cache of a process worker, set once by the pool initializer
+_field_values = {}
+_cache = None
+
+
+def _initialize_worker(field_values: dict[str, pd.Series], cache: VectorCache = None) -> None:
+    global _field_values, _cache
+    _field_values = field_values
+    _cache = cache
+
+
+def _score_values_chunk(
+        field_values: dict[str, pd.Series], cache: VectorCache, task: tuple[str, str, np.ndarray]
+        ) -> np.ndarray:
+    """Score a chunk of one field's pairs on a single thread, since the pool
+    already runs a task per core."""
+    field, sim_type, pairs = task
+    return score_pairs(field_values[field], pairs, sim_type, cache, workers=1)
+
+
+def _score_chunk(task: tuple[str, str, np.ndarray]) -> np.ndarray:
+    """Process pool task: score a chunk of one field's pairs."""
+    return _score_values_chunk(_field_values, _cache, task)
+
+
+def get_n_jobs(n_jobs: int = None) -> int:
+    """Number of workers: `n_jobs`, or every core if it is negative."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def get_chunk_bounds(n_pairs: int, chunk_size: int) -> list[tuple[int, int]]:
+    """The `(start, stop)` of each chunk of `chunk_size` pairs, which depend
+    only on the pair count so results are reproducible for any `n_jobs`.
+
+    Usage::
+        >>> get_chunk_bounds(5, 2)
+            [(0, 2), (2, 4), (4, 5)]
+    """
+    return [(start, min(start + chunk_size, n_pairs)) for start in range(0, n_pairs, chunk_size)]
+
+
+class ScoringExecutor:
+    """Scores the pairs of several fields, split into chunks that are scored
+    concurrently by a pool of `n_jobs` workers.  Chunk scores are returned in
+    pair order, so the output is the same as scoring serially.
+
+    The read-only `field_values` and the vector `cache` of the `embedding`
+    scorer are given to each process worker once, by the pool initializer,
+    rather than with every task.  Workers are spawned rather than forked, so
+    they do not inherit locks held by the threads of rapidfuzz or BLAS.  The
+    `thread` backend passes them to each task directly and suits scorers that
+    release the GIL.  Within a pool, each task scores on a single thread
+    (`workers=1`), so the pool does not oversubscribe the cores.  With
+    `n_jobs` of 1, pairs are scored serially without a pool.
+
+    Usage::
+        >>> with ScoringExecutor(field_values, n_jobs=8) as executor:
+        ...     scores = executor.score({'title': ('fuzzy', title_pairs), 'artist': ('exact', artist_pairs)})
+        >>> scores['title'].shape
+            (13794,)
+    """
+
+    def __init__(
+            self,
+            field_values: dict[str, pd.Series],
+            n_jobs: int = 1,
+            chunk_size: int = 200_000,
+            backend: str = 'process',
+            cache: VectorCache = None
+            ) -> None:
+        self.field_values = field_values
+        self.cache = cache
+        self.n_jobs = get_n_jobs(n_jobs)
+        self.chunk_size = chunk_size
+        self.backend = backend
+        self._pool = None
+
+    def __enter__(self) -> 'ScoringExecutor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor | ThreadPoolExecutor:
+        if self._pool is None:
+            match self.backend:
+                case 'process':
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.n_jobs,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_initialize_worker,
+                        initargs=(self.field_values, self.cache)
+                        )
+                case 'thread':
+                    self._pool = ThreadPoolExecutor(max_workers=self.n_jobs)
+                case _:
+                    raise TypeError
+        return self._pool
+
+    def score(self, field_pairs: dict[str, tuple[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        """Scores of each field's pairs, from a dict of field to `(sim_type, pairs)`.
+        The chunks of every field are scored concurrently."""
+        if self.n_jobs == 1:
+            return {
+                field: score_pairs(self.field_values[field], pairs, sim_type, self.cache)
+                for field, (sim_type, pairs) in field_pairs.items()
+                }
+
+        tasks, task_fields = [], []
+        for field, (sim_type, pairs) in field_pairs.items():
+            for start, stop in get_chunk_bounds(pairs.shape[0], self.chunk_size):
+                tasks.append((field, sim_type, pairs[start:stop]))
+                task_fields.append(field)
+
+        score_chunk = _score_chunk
+        if self.backend == 'thread':
+            score_chunk = partial(_score_values_chunk, self.field_values, self.cache)
+        chunks = {field: [] for field in field_pairs}
+        for field, scores in zip(task_fields, self.pool.map(score_chunk, tasks)):
+            chunks[field].append(scores)
+        return {
+            field: np.concatenate(chunks[field]) if chunks[field] else np.empty(0, dtype=np.float64)
+            for field in field_pairs
+            }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Record Linkage
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from .blocking import (
+    Blocks,
+    get_token_entries,
+    get_lsh_entries
+)
+from .matching.cosine import get_token_vectorizer
+
+import pandas as pd
+import numpy as np
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.neighbors import NearestNeighbors
+
+
+_available_link_operations = ['standard', 'token', 'lsh', 'knn']
+
+
+def get_link_pairs(keys: np.ndarray, n_right: int) -> np.ndarray:
+    """Decode link keys `left * n_right + right` into (left, right) positions."""
+    left, right = np.divmod(np.asarray(keys, dtype=np.int64), n_right)
+    return np.column_stack((left, right))
+
+
+def expand_block_matches(
+        blocks: Blocks, key_index: pd.Index, left_rows: np.ndarray, left_keys: np.ndarray
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """Pair each left entry of (row, key) with every right record in the block
+    of its key, as aligned arrays of left and right positions.  `key_index`
+    holds the block keys.
+
+    Usage::
+        >>> right_blocks = Blocks.from_entries(np.array([0, 1, 2]), np.array(['a', 'b', 'a']))
+        >>> expand_block_matches(right_blocks, pd.Index(right_blocks.keys_array), np.array([0, 1]), np.array(['a', 'c']))
+            (array([0, 0]), array([0, 2]))
+    """
+    block_ids = key_index.get_indexer(left_keys)
+    found = block_ids >= 0
+    left_rows, block_ids = np.asarray(left_rows, dtype=np.int64)[found], block_ids[found]
+    sizes = blocks.sizes[block_ids]
+    local = np.arange(sizes.sum(), dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    right = blocks.members[np.repeat(blocks.offsets[block_ids], sizes) + local]
+    return np.repeat(left_rows, sizes), right.astype(np.int64)
+
+
+class LinkIndex:
+    """Blocking index of the right-side records of a linkage, built once and
+    probed with any number of batches of left-side records.  Only cross-source
+    pairs are created, so the cost grows with the left records times their
+    candidates rather than with the square of both tables.
+
+    Each of the blocking `fields` is indexed by the `operation`:
+
+    * standard: the right records of each value
+    * token: the right records of each token
+    * lsh: the right records of each MinHash band, over 3-grams of the right side
+    * knn: a nearest neighbor index of right-side 3-gram TF-IDF vectors
+    * None: every right record is a candidate of every left record
+
+    Right-side blocks of `purging_threshold` records or more are purged; no
+    other block processing (meta blocking, comparison budget, filtering) is
+    applied to cross-source blocks, so `EntityMatcher.create_link_index()`
+    rejects configs that ask for it.
+
+    Usage::
+        >>> index = LinkIndex(right_df, ['title', 'artist'], operation='token')
+        >>> pairs = index.candidate_pairs(left_df)
+        >>> pairs
+            array([[    0,   412],
+                   [    0,  9021],
+                   ...])
+    """
+
+    def __init__(
+            self,
+            right_df: pd.DataFrame,
+            fields: list,
+            operation: str = None,
+            purging_threshold: int = 10000,
+            bands: int = 20,
+            rows: int = 5,
+            n_neighbors: int = 10,
+            cutoff: float = 0.0,
+            n_components: int = None
+            ) -> None:
+        if operation is not None and operation not in _available_link_operations:
+            raise TypeError
+        self.n_right = right_df.shape[0]
+        self.fields = list(fields)
+        self.operation = operation
+        self.purging_threshold = purging_threshold
+        self.bands = bands
+        self.rows = rows
+        self.n_neighbors = n_neighbors
+        self.cutoff = cutoff
+        self.n_components = n_components
+        self.indexes = {
+            field: self.create_field_index(right_df[field].reset_index(drop=True))
+            for field in self.fields
+            } if operation else {}
+
+    def create_field_index(self, field_values: pd.Series) -> dict:
+        """Index of the right-side values of a field."""
+        match self.operation:
+            case 'standard':
+                values = field_values.dropna()
+                blocks = Blocks.from_entries(values.index.to_numpy(), values.to_numpy())
+                return self.get_block_index(blocks)
+            case 'token':
+                blocks = Blocks.from_entries(*get_token_entries(field_values))
+                return self.get_block_index(blocks)
+            case 'lsh':
+                vectorizer = get_token_vectorizer()
+                try:
+                    token_matrix = vectorizer.fit_transform(field_values.fillna("").astype(str)).tocsr()
+                except ValueError:
+                    #no record has a 3-gram
+                    return {'blocks': None}
+                blocks = Blocks.from_entries(*get_lsh_entries(token_matrix, self.bands, self.rows))
+                return {'vectorizer': vectorizer, **self.get_block_index(blocks)}
+            case 'knn':
+                vectorizer = TfidfVectorizer(analyzer="char", ngram_range=(3, 3), dtype=np.float32)
+                try:
+                    vectors = vectorizer.fit_transform(field_values.fillna("").astype(str))
+                except ValueError:
+                    return {'neighbors': None}
+                svd = None
+                if self.n_components and self.n_components < vectors.shape[1]:
+                    svd = TruncatedSVD(n_components=self.n_components, random_state=0).fit(vectors)
+                records = np.flatnonzero(np.diff(vectors.indptr) > 0)
+                vectors = svd.transform(vectors[records]).astype(np.float32) if svd else vectors[records]
+                neighbors = NearestNeighbors(
+                    n_neighbors=min(self.n_neighbors, records.shape[0]), metric="cosine", algorithm="brute"
+                    )
+                return {
+                    'vectorizer': vectorizer,
+                    'svd': svd,
+                    'records': records,
+                    'neighbors': neighbors.fit(vectors) if records.shape[0] else None
+                    }
+
+    def get_block_index(self, blocks: Blocks) -> dict:
+        """Purged blocks with a lookup of their keys.  Blocks of one record are
+        kept, since they may match left records."""
+        blocks = blocks.drop_missing()
+        blocks = blocks.select(blocks.sizes < self.purging_threshold)
+        return {'blocks': blocks, 'key_index': pd.Index(blocks.keys_array)}
+
+    def get_field_keys(self, field: str, field_values: pd.Series) -> np.ndarray:
+        """Link keys `left * n_right + right` of the left-side values of a field."""
+        index = self.indexes[field]
+        match self.operation:
+            case 'standard' | 'token' | 'lsh':
+                if index['blocks'] is None:
+                    return np.empty(0, dtype=np.int64)
+                if self.operation == 'standard':
+                    values = field_values.dropna()
+                    rows, keys = values.index.to_numpy(), values.to_numpy()
+                elif self.operation == 'token':
+                    rows, keys = get_token_entries(field_values)
+                else:
+                    token_matrix = index['vectorizer'].transform(field_values.fillna("").astype(str)).tocsr()
+                    rows, keys = get_lsh_entries(token_matrix, self.bands, self.rows)
+                left, right = expand_block_matches(index['blocks'], index['key_index'], rows, keys)
+            case 'knn':
+                if index['neighbors'] is None:
+                    return np.empty(0, dtype=np.int64)
+                vectors = index['vectorizer'].transform(field_values.fillna("").astype(str))
+                rows = np.flatnonzero(np.diff(vectors.indptr) > 0)
+                if rows.shape[0] == 0:
+                    return np.empty(0, dtype=np.int64)
+                vectors = index['svd'].transform(vectors[rows]) if index['svd'] else vectors[rows]
+                distances, neighbors = index['neighbors'].kneighbors(vectors)
+                keep = (1 - distances) >= self.cutoff
+                left = np.repeat(rows, neighbors.shape[1]).reshape(neighbors.shape)[keep]
+                right = index['records'][neighbors[keep]]
+        return left.astype(np.int64) * self.n_right + right
+
+    def candidate_pairs(self, left_df: pd.DataFrame) -> np.ndarray:
+        """Sorted, unique (left, right) positions of the candidate pairs of
+        `left_df` with the right-side records of the index."""
+        n_left = left_df.shape[0]
+        if self.operation is None:
+            left = np.repeat(np.arange(n_left, dtype=np.int64), self.n_right)
+            right = np.tile(np.arange(self.n_right, dtype=np.int64), n_left)
+            return np.column_stack((left, right))
+        keys = [
+            self.get_field_keys(field, left_df[field].reset_index(drop=True))
+            for field in self.fields
+            ]
+        return get_link_pairs(np.unique(np.concatenate(keys)), self.n_right)
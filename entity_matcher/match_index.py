@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+"""
+Match Index
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from .EntityMatcher import EntityMatcher
+from .blocking import (
+    Blocks,
+    get_token_entries,
+    get_lsh_entries
+)
+from .block_processing import expand_blocks
+from .linking import expand_block_matches
+from .pairs import (
+    create_index_pairs,
+    CandidatePairs
+)
+from .clustering import get_connected_components
+from .matching import (
+    prepare_field_values,
+    score_pairs
+)
+from .storage import (
+    save_arrays,
+    load_arrays
+)
+from . import preprocess
+from .matching.cosine import (
+    get_token_vectorizer,
+    rowwise_dot
+)
+
+import pandas as pd
+import numpy as np
+
+from scipy.sparse import csr_matrix, vstack, tril
+
+
+_available_index_operations = ['standard', 'token', 'lsh']
+
+
+def widen(matrix: csr_matrix, width: int) -> csr_matrix:
+    """The rows of `matrix` with `width` columns, the new ones empty, sharing its buffers."""
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], width), copy=False)
+
+
+def locate_segments(bounds: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Segment of each of `positions`, from the `bounds` of the segments: the
+    start of each, followed by the total length."""
+    return np.searchsorted(bounds, positions, side='right') - 1
+
+
+def take_values(segments: list, bounds: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Values at `positions` of a column stored as `segments`, without
+    concatenating the segments.
+
+    Usage::
+        >>> take_values([np.array([1, 2]), np.array([3])], np.array([0, 2, 3]), np.array([2, 0]))
+            array([3, 1])
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(segments) == 1:
+        return segments[0].take(positions)
+    segment_ids = locate_segments(bounds, positions)
+    parts = [
+        segments[segment].take(positions[segment_ids == segment] - bounds[segment])
+        for segment in np.unique(segment_ids)
+        ]
+    if not parts:
+        return np.empty(0, dtype=object)
+    values = np.concatenate(parts)
+    result = np.empty_like(values)
+    result[np.argsort(segment_ids, kind='stable')] = values
+    return result
+
+
+def take_rows(segments: list[csr_matrix], bounds: np.ndarray, positions: np.ndarray, width: int) -> csr_matrix:
+    """Rows at `positions` of a sparse matrix stored as row `segments`, with
+    `width` columns, without concatenating the segments."""
+    positions = np.asarray(positions, dtype=np.int64)
+    segment_ids = locate_segments(bounds, positions)
+    parts = [
+        widen(segments[segment][positions[segment_ids == segment] - bounds[segment]], width)
+        for segment in np.unique(segment_ids)
+        ]
+    if not parts:
+        return csr_matrix((0, width), dtype=np.float64)
+    rows = vstack(parts).tocsr()
+    return rows[np.argsort(np.argsort(segment_ids, kind='stable'))]
+
+
+def grow(array: np.ndarray, size: int) -> np.ndarray:
+    """`array`, writable, with room for `size` items, doubling its capacity
+    when it is full, so appends are amortized."""
+    if size <= array.shape[0] and array.flags.writeable:
+        return array
+    grown = np.zeros(max(size, 2 * array.shape[0]), dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+
+class MatchIndex:
+    """Index of matched records that grows with new records, without matching
+    the existing records again.
+
+    It keeps, for the `field_config`:
+
+    * values: the prepared values of each scored field
+    * vocabularies and vectors: the 3-gram vocabulary of each fuzzy (or `lsh`
+      blocking) field, extended as records are added, and each record's
+      normalized 3-gram vector, with its transpose as an inverted index
+    * blocks: the blocks of each blocking field, and the keys of purged blocks
+    * clusters: a union-find forest whose roots are the lowest position of
+      each cluster, and whether each record has any match
+
+    Each `add()` appends a segment to every part of the index, so existing
+    records are not copied.  The last two segments are merged while the last
+    is as large as the one before it, like a binary counter, so there are
+    logarithmically many segments and each record is merged a logarithmic
+    number of times.  `save()` merges them all.
+
+    `add()` scores only the new x existing and new x new candidate pairs and
+    merges the clusters they connect.  `match_one()` and `match_many()` find
+    the indexed records matching probe records.  Records are preprocessed on
+    the optional `preprocess_columns`.  Blocking operations are `standard`,
+    `token` and `lsh`, on the shared blocking `fields` or else the scored
+    fields.  Blocks are only purged by `purging_threshold`: the `meta`
+    process, `star` expansion, `comparison_budget` and `filter_ratio` raise a
+    TypeError.  Without blocking, candidates share a 3-gram of a fuzzy field
+    when that cannot drop a match (see `is_ngram_probe_complete`), and are
+    every pair otherwise.  Fields are combined by their `weights`; the
+    cascade is not applied.
+
+    Usage::
+        >>> index = MatchIndex(field_config)
+        >>> index.add(master_df)
+        >>> index.add(new_df)
+        >>> index.clusters
+            0         0
+            1
+            2         0
+            ...
+        >>> index.match_one({'title': 'my way', 'artist': 'frank sinatra'})
+               record  label  title  artist  scores
+            0    1022   1022    1.0     1.0     1.0
+    """
+
+    def __init__(self, field_config: dict, preprocess_columns: list = None) -> None:
+        self.matcher = EntityMatcher(field_config)
+        self.field_config = field_config
+        blocking = field_config['blocking']
+        if blocking != {} and blocking['operation'] not in _available_index_operations:
+            raise TypeError
+        #options the index does not apply are rejected rather than ignored
+        if blocking.get('process') == 'meta' or blocking.get('expansion', 'all') != 'all':
+            raise TypeError
+        if blocking.get('comparison_budget') is not None or blocking.get('filter_ratio') is not None:
+            raise TypeError
+        self.operation = blocking.get('operation')
+        self.blocking_fields = blocking.get('fields') or list( field_config['scoring'].keys() )
+        self.purging_threshold = blocking.get('purging_threshold', self.matcher._default_purging_threshold)
+        self.bands = blocking.get('bands', self.matcher._default_lsh_bands)
+        self.rows = blocking.get('rows', self.matcher._default_lsh_rows)
+        self.threshold = self.matcher._threshold
+        self.preprocess_columns = preprocess_columns
+
+        self.n_records = 0
+        self.bounds = np.zeros(1, dtype=np.int64)
+        self.labels = []
+        self.values = {}
+        self.vocabularies = {}
+        self.vectors = {}
+        self.inverted = {}
+        self.blocks = {}
+        self.purged = {}
+        self.parent = np.empty(0, dtype=np.int64)
+        self.is_matched = np.empty(0, dtype=bool)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, field_config: dict, preprocess_columns: list = None) -> 'MatchIndex':
+        """Index of the records of `df`, matched with each other."""
+        index = cls(field_config, preprocess_columns)
+        index.add(df)
+        return index
+
+    def save(self, path: str) -> None:
+        """Save the index to the directory `path`, as `.npy` arrays with a
+        versioned manifest, to be reopened with `MatchIndex.load()`.  The
+        segments are merged first.
+
+        Usage::
+            >>> index.save('songs_index')
+        """
+        self.merge_segments(0)
+        arrays = {
+            'record_index': self.record_index.to_numpy(),
+            'roots': self.get_roots(),
+            'is_matched': self.is_matched[:self.n_records],
+            }
+        if self.n_records:
+            for field, segments in self.values.items():
+                arrays[f'values/{field}'] = segments[0]
+            for field, segments in self.vectors.items():
+                arrays[f'vocabulary/{field}'] = np.array(list(self.vocabularies[field].keys()), dtype=object)
+                arrays[f'vectors/{field}'] = segments[0]
+                arrays[f'inverted/{field}'] = self.get_inverted_index(field, 0)
+            for field, segments in self.blocks.items():
+                blocks = segments[0]['blocks']
+                arrays[f'block_keys/{field}'] = blocks.keys_array
+                arrays[f'block_offsets/{field}'] = blocks.offsets
+                arrays[f'block_members/{field}'] = blocks.members
+                arrays[f'purged/{field}'] = self.purged[field].to_numpy()
+        metadata = {
+            'field_config': self.field_config,
+            'preprocess_columns': self.preprocess_columns,
+            'n_records': self.n_records
+            }
+        save_arrays(path, arrays, metadata)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> 'MatchIndex':
+        """Index saved by `save()`.  Vectors, blocks and clusters are memory-mapped
+        read-only with `mmap_mode`, so the index is ready without refitting and
+        worker processes share its pages.  String values and labels stay
+        encoded, and only the rows of scored candidates are decoded.  `add()`
+        appends new segments, and copies the clusters when it changes them.
+
+        Usage::
+            >>> index = MatchIndex.load('songs_index')
+            >>> index.match_one({'title': 'my way', 'artist': 'frank sinatra'})
+        """
+        arrays, metadata = load_arrays(path, mmap_mode)
+        index = cls(metadata['field_config'], metadata['preprocess_columns'])
+        index.n_records = metadata['n_records']
+        index.parent = arrays['roots']
+        index.is_matched = arrays['is_matched']
+        if index.n_records == 0:
+            return index
+        index.bounds = np.array([0, index.n_records], dtype=np.int64)
+        index.labels = [arrays['record_index']]
+        for field in index.field_config['scoring']:
+            index.values[field] = [arrays[f'values/{field}']]
+        for field in index.vector_fields:
+            grams = arrays[f'vocabulary/{field}'].to_numpy()
+            index.vocabularies[field] = dict(zip(grams, range(grams.shape[0])))
+            index.vectors[field] = [arrays[f'vectors/{field}']]
+            index.inverted[field] = [arrays[f'inverted/{field}']]
+        if index.operation:
+            for field in index.blocking_fields:
+                blocks = Blocks(
+                    np.asarray(arrays[f'block_keys/{field}']),
+                    arrays[f'block_offsets/{field}'],
+                    arrays[f'block_members/{field}']
+                    )
+                index.blocks[field] = [{'blocks': blocks, 'key_index': pd.Index(blocks.keys_array)}]
+                index.purged[field] = pd.Index(np.asarray(arrays[f'purged/{field}']))
+        return index
+
+    @property
+    def fuzzy_fields(self) -> list[str]:
+        return [field for field, sim_type in self.field_config['scoring'].items() if sim_type == 'fuzzy']
+
+    @property
+    def vector_fields(self) -> list[str]:
+        """Fields with 3-gram vectors: fuzzy scored fields and `lsh` blocking fields."""
+        fields = list(self.fuzzy_fields)
+        if self.operation == 'lsh':
+            fields += [field for field in self.blocking_fields if field not in fields]
+        return fields
+
+    @property
+    def record_index(self) -> pd.Index:
+        """Index labels of the added records."""
+        if not self.labels:
+            return pd.Index([])
+        return pd.Index(np.concatenate([np.asarray(labels) for labels in self.labels]))
+
+    @property
+    def clusters(self) -> pd.Series:
+        """The canonical record (lowest position) of each record's cluster, or ''
+        for records without a match, aligned to the added records."""
+        ids = self.get_roots().astype(object)
+        ids[~self.is_matched[:self.n_records]] = ''
+        return pd.Series(ids, index=self.record_index, name='group', dtype=object)
+
+    def vectorize(self, field: str, field_values: pd.Series, extend: bool = False) -> csr_matrix:
+        """Normalized 3-gram vectors of `field_values` in the columns of the
+        field's vocabulary.  Unseen 3-grams follow the vocabulary's columns, in
+        the order `extend` adds them to the vocabulary, so probes hash into the
+        same LSH bands as added records.  Indexed vectors are zero on them, so
+        the dot product with the first columns is still the cosine similarity."""
+        vocabulary = self.vocabularies.setdefault(field, {})
+        vectorizer = get_token_vectorizer()
+        try:
+            counts = vectorizer.fit_transform(field_values.fillna("").astype(str)).tocoo()
+        except ValueError:
+            #no record has a 3-gram
+            return csr_matrix((field_values.shape[0], len(vocabulary)), dtype=np.float64)
+
+        unseen = vocabulary if extend else {}
+        columns = np.empty(len(vectorizer.vocabulary_), dtype=np.int64)
+        for gram, column in vectorizer.vocabulary_.items():
+            if gram not in vocabulary and gram not in unseen:
+                unseen[gram] = len(vocabulary) + (0 if extend else len(unseen))
+            columns[column] = vocabulary[gram] if gram in vocabulary else unseen[gram]
+
+        norms = np.sqrt(np.bincount(counts.row, weights=counts.data ** 2, minlength=counts.shape[0]))
+        return csr_matrix(
+            (counts.data / norms[counts.row], (counts.row, columns[counts.col])),
+            shape=(counts.shape[0], len(vocabulary) + (0 if extend else len(unseen)))
+            )
+
+    def get_entries(self, field: str, field_values: pd.Series, vectors: csr_matrix = None) -> tuple[np.ndarray, np.ndarray]:
+        """(row, key) blocking entries of a field, with rows as positions of `field_values`."""
+        match self.operation:
+            case 'standard':
+                values = field_values.reset_index(drop=True).dropna()
+                return values.index.to_numpy(dtype=np.int64), values.to_numpy()
+            case 'token':
+                return get_token_entries(field_values)
+            case 'lsh':
+                return get_lsh_entries(vectors, self.bands, self.rows)
+
+    def get_block_segment(self, blocks: Blocks) -> dict:
+        """Segment of blocks without missing keys, with a lookup of their keys."""
+        blocks = blocks.drop_missing()
+        return {'blocks': blocks, 'key_index': pd.Index(blocks.keys_array)}
+
+    def merge_blocks(self, field: str, segments: list[dict]) -> dict:
+        """One segment of the blocks of `segments`.  Blocks that reach the
+        purging threshold are dropped and their keys kept as purged, since
+        blocks only grow."""
+        rows = np.concatenate([segment['blocks'].members.astype(np.int64) for segment in segments])
+        keys = np.concatenate([
+            np.repeat(segment['blocks'].keys_array, segment['blocks'].sizes) for segment in segments
+            ])
+        blocks = Blocks.from_entries(rows, keys)
+        keep = ~pd.Index(blocks.keys_array).isin(self.purged[field])
+        is_purged = keep & (blocks.sizes >= self.purging_threshold)
+        if is_purged.any():
+            self.purged[field] = self.purged[field].append(pd.Index(blocks.keys_array[is_purged]))
+        return self.get_block_segment(blocks.select(keep & ~is_purged))
+
+    def merge_segments(self, start: int) -> None:
+        """Merge the segments from `start` on into one, in every part of the index."""
+        if len(self.bounds) - 1 - start < 2:
+            return
+        self.labels[start:] = [np.concatenate([np.asarray(labels) for labels in self.labels[start:]])]
+        for segments in self.values.values():
+            segments[start:] = [np.concatenate([np.asarray(segment) for segment in segments[start:]])]
+        for field, segments in self.vectors.items():
+            width = len(self.vocabularies[field])
+            segments[start:] = [vstack([widen(segment, width) for segment in segments[start:]]).tocsr()]
+            self.inverted[field][start:] = [None]
+        for field, segments in self.blocks.items():
+            segments[start:] = [self.merge_blocks(field, segments[start:])]
+        self.bounds = np.concatenate([self.bounds[:start + 1], self.bounds[-1:]])
+
+    def get_inverted_index(self, field: str, segment: int) -> csr_matrix:
+        """Inverted index of a segment of a vector field: a row per 3-gram,
+        holding the weight of the 3-gram in each record of the segment."""
+        if self.inverted[field][segment] is None:
+            self.inverted[field][segment] = self.vectors[field][segment].T.tocsr()
+        return self.inverted[field][segment]
+
+    def is_block_kept(self, field: str, keys: np.ndarray, added_sizes: np.ndarray = 0) -> np.ndarray:
+        """Whether the blocks of `keys` of a field are not purged: the key was
+        not purged before and its blocks in every segment, with `added_sizes`
+        records being added to them, stay below the purging threshold."""
+        sizes = np.zeros(keys.shape[0], dtype=np.int64) + added_sizes
+        for segment in self.blocks.get(field, []):
+            block_ids = segment['key_index'].get_indexer(keys)
+            sizes += np.where(block_ids >= 0, segment['blocks'].sizes[block_ids], 0)
+        purged = self.purged.get(field, pd.Index([], dtype=object))
+        return (sizes < self.purging_threshold) & ~pd.Index(keys).isin(purged)
+
+    def get_probe_pairs(
+            self, entries: dict[str, tuple[np.ndarray, np.ndarray]], added: bool = False
+            ) -> tuple[np.ndarray, np.ndarray]:
+        """(probe row, indexed record) of each probe record sharing a block with
+        an indexed record, from the probes' blocking `entries`, with duplicates.
+        Blocks are probed in every segment, unless `is_block_kept()` is False,
+        counting the probes in the blocks if they are being `added`."""
+        rows, records = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for field in self.blocking_fields:
+            segments = self.blocks.get(field)
+            if not segments:
+                continue
+            field_rows, keys = entries[field]
+            added_sizes = 0
+            if added:
+                codes = pd.factorize(keys, use_na_sentinel=False)[0]
+                added_sizes = np.bincount(codes)[codes]
+            keep = self.is_block_kept(field, keys, added_sizes)
+            for segment in segments:
+                segment_rows, segment_records = expand_block_matches(
+                    segment['blocks'], segment['key_index'], field_rows[keep], keys[keep]
+                    )
+                rows.append(segment_rows)
+                records.append(segment_records)
+        return np.concatenate(rows), np.concatenate(records)
+
+    def get_ngram_pairs(self, probe_vectors: dict[str, csr_matrix]) -> tuple[np.ndarray, np.ndarray]:
+        """(probe row, indexed record) of each probe record sharing a 3-gram
+        with an indexed record in a fuzzy field, with duplicates.  Only the
+        posting lists of the probes' 3-grams are read."""
+        rows, records = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for field in self.fuzzy_fields:
+            for segment in range(len(self.vectors[field])):
+                inverted = self.get_inverted_index(field, segment)
+                product = (probe_vectors[field][:, :inverted.shape[0]] @ inverted).tocoo()
+                rows.append(product.row.astype(np.int64))
+                records.append(product.col.astype(np.int64) + self.bounds[segment])
+        return np.concatenate(rows), np.concatenate(records)
+
+    def get_candidates(
+            self, n_probes: int, entries: dict[str, tuple[np.ndarray, np.ndarray]], probe_vectors: dict[str, csr_matrix],
+            added: bool = False
+            ) -> tuple[np.ndarray, np.ndarray]:
+        """(probe row, indexed record) of the candidates of `n_probes` probe
+        records, from their blocking `entries` or 3-gram `probe_vectors`, with
+        the probes counted in the blocks if they are being `added`."""
+        if self.n_records == 0 or n_probes == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.operation:
+            return self.get_probe_pairs(entries, added)
+        if self.is_ngram_probe_complete:
+            return self.get_ngram_pairs(probe_vectors)
+        rows = np.repeat(np.arange(n_probes, dtype=np.int64), self.n_records)
+        records = np.tile(np.arange(self.n_records, dtype=np.int64), n_probes)
+        return rows, records
+
+    def get_new_pairs(
+            self, n_new: int, entries: dict[str, tuple[np.ndarray, np.ndarray]], new_vectors: dict[str, csr_matrix]
+            ) -> np.ndarray:
+        """Candidate pairs (i, j), i > j, of new records with each other, as
+        positions among the `n_new` new records.  Blocks are purged like the
+        probed ones, with `is_block_kept()` on their indexed and new records."""
+        if self.operation:
+            pairs = []
+            for field in self.blocking_fields:
+                blocks = Blocks.from_entries(*entries[field]).drop_missing()
+                keep = (blocks.sizes > 1) & self.is_block_kept(field, blocks.keys_array, blocks.sizes)
+                pairs.append(expand_blocks(blocks.select(keep)))
+        elif self.is_ngram_probe_complete:
+            pairs = []
+            for field in self.fuzzy_fields:
+                product = tril(new_vectors[field] @ new_vectors[field].T, k=-1).tocoo()
+                pairs.append(np.column_stack((product.row, product.col)))
+        else:
+            pairs = [create_index_pairs(n_new)]
+        return np.concatenate([np.empty((0, 2), dtype=np.int64)] + [pair.astype(np.int64) for pair in pairs])
+
+    def score_candidates(
+            self, df_probe: pd.DataFrame, probe_vectors: dict[str, csr_matrix],
+            rows: np.ndarray, indexed: np.ndarray, probe_pairs: np.ndarray = None
+            ) -> tuple[CandidatePairs, np.ndarray, np.ndarray]:
+        """Score the (probe row, indexed record) candidates, and the `probe_pairs`
+        of probes with each other, on the probes followed by the indexed
+        candidates, so only those records are gathered from the index.  Returns
+        the store of local pairs, their combined scores and the positions of
+        the indexed candidates."""
+        n_probes = df_probe.shape[0]
+        candidates, local = np.unique(indexed, return_inverse=True)
+        pairs = [np.column_stack((local.reshape(-1) + n_probes, rows))]
+        if probe_pairs is not None:
+            pairs.append(probe_pairs)
+        store = CandidatePairs.from_pairs(n_probes + candidates.shape[0], np.concatenate(pairs))
+        pairs = store.pairs
+        for field, sim_type in self.field_config['scoring'].items():
+            if sim_type == 'fuzzy':
+                width = probe_vectors[field].shape[1]
+                candidate_vectors = take_rows(self.vectors.get(field, []), self.bounds, candidates, width)
+                matrix = vstack([probe_vectors[field], candidate_vectors]).tocsr()
+                scores = rowwise_dot(matrix, pairs[:, 0], pairs[:, 1])
+            else:
+                candidate_values = take_values(self.values[field], self.bounds, candidates) if candidates.shape[0] else []
+                field_values = pd.concat([
+                    prepare_field_values(df_probe[field], sim_type).reset_index(drop=True),
+                    pd.Series(candidate_values, dtype=object)
+                    ], ignore_index=True)
+                scores = score_pairs(field_values, pairs, sim_type, self.matcher.vector_cache)
+            store.set_scores_by_keys(field, store.keys, scores)
+        return store, store.combined_scores(weights=self.field_config.get('weights')), candidates
+
+    def add(self, df_new: pd.DataFrame) -> pd.DataFrame:
+        """Add the records of `df_new`, match them against the existing records
+        and each other, and merge the clusters of the matches.  Returns the
+        matches, with the positions `0` and `1` (0 > 1) of the pair in the
+        index, each field's score and the combined `scores`.
+
+        Usage::
+            >>> matches = index.add(new_df)
+        """
+        labels = df_new.index.to_numpy()
+        df_new = self.prepare_records(df_new).reset_index(drop=True)
+        n_new = df_new.shape[0]
+        n_existing = self.n_records
+        n_records = n_existing + n_new
+
+        new_vectors = {field: self.vectorize(field, df_new[field], extend=True) for field in self.vector_fields}
+        new_entries = {}
+        if self.operation:
+            for field in self.blocking_fields:
+                new_entries[field] = self.get_entries(field, df_new[field], new_vectors.get(field))
+
+        #score new x existing and new x new pairs
+        rows, indexed = self.get_candidates(n_new, new_entries, new_vectors, added=True)
+        new_pairs = self.get_new_pairs(n_new, new_entries, new_vectors)
+        store, combined, candidates = self.score_candidates(df_new, new_vectors, rows, indexed, new_pairs)
+        matches = store.to_frame(combined > self.threshold, combined)
+        local = matches[[0, 1]].to_numpy(dtype=np.int64)
+        positions = local + n_existing
+        is_indexed = local >= n_new
+        positions[is_indexed] = candidates[local[is_indexed] - n_new]
+        matches[0], matches[1] = positions.max(axis=1), positions.min(axis=1)
+        matches = matches.sort_values([0, 1], kind='stable').reset_index(drop=True)
+
+        #append a segment of the new records
+        self.labels.append(labels)
+        for field, sim_type in self.field_config['scoring'].items():
+            self.values.setdefault(field, []).append(prepare_field_values(df_new[field], sim_type).to_numpy())
+        for field, vectors in new_vectors.items():
+            self.vectors.setdefault(field, []).append(vectors)
+            self.inverted.setdefault(field, []).append(None)
+        for field, (field_rows, keys) in new_entries.items():
+            self.purged.setdefault(field, pd.Index([], dtype=object))
+            segment = self.get_block_segment(Blocks.from_entries(field_rows + n_existing, keys))
+            self.blocks.setdefault(field, []).append(segment)
+        self.bounds = np.append(self.bounds, n_records)
+        self.n_records = n_records
+
+        self.update_clusters(matches[[0, 1]].to_numpy(dtype=np.int64), n_existing, n_records)
+        while len(self.bounds) > 2 and self.bounds[-1] - self.bounds[-2] >= self.bounds[-2] - self.bounds[-3]:
+            self.merge_segments(len(self.bounds) - 3)
+        self.matcher.vector_cache.clear()
+        return matches
+
+    def get_roots(self, positions: np.ndarray = None) -> np.ndarray:
+        """Root of the cluster of each record at `positions` (default all):
+        the lowest position in the cluster."""
+        positions = np.arange(self.n_records) if positions is None else positions
+        roots = self.parent[positions]
+        while True:
+            parents = self.parent[roots]
+            if (parents == roots).all():
+                return roots
+            roots = parents
+
+    def update_clusters(self, pairs: np.ndarray, n_existing: int, n_records: int) -> None:
+        """Merge the clusters connected by the matched `pairs`, after adding the
+        records from `n_existing` to `n_records`.  Only the roots of the
+        matched records are traversed and relinked."""
+        self.parent = grow(self.parent, n_records)
+        self.is_matched = grow(self.is_matched, n_records)
+        self.parent[n_existing:n_records] = np.arange(n_existing, n_records)
+        self.is_matched[n_existing:n_records] = False
+        if pairs.shape[0] == 0:
+            return
+        records = pairs.ravel()
+        roots = self.get_roots(records)
+        #compress the paths of the matched records
+        self.parent[records] = roots
+        nodes, local = np.unique(roots, return_inverse=True)
+        components = get_connected_components(local.reshape(-1, 2), nodes.shape[0])
+        lowest = np.full(components.max() + 1, np.iinfo(np.int64).max)
+        np.minimum.at(lowest, components, nodes)
+        self.parent[nodes] = lowest[components]
+        self.is_matched[records] = True
+
+    @property
+    def is_ngram_probe_complete(self) -> bool:
+        """Whether every match of a probe shares a 3-gram with it in a fuzzy
+        field: a record sharing none scores 0 on every fuzzy field, so its
+        combined score is at most the weight share of the other fields."""
+        if not self.fuzzy_fields:
+            return False
+        weights = self.field_config.get('weights') or {}
+        total = sum(weights.get(field, 1) for field in self.field_config['scoring'])
+        other = total - sum(weights.get(field, 1) for field in self.fuzzy_fields)
+        return other / total <= self.threshold
+
+    def prepare_records(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the index's preprocessing to a copy of the records."""
+        if not self.preprocess_columns:
+            return df
+        return preprocess.preprocess_df_columns(df.copy(), self.preprocess_columns)
+
+    def match_many(self, records: list[dict] | pd.DataFrame, top_k: int = None) -> pd.DataFrame:
+        """Indexed records that match each of the probe `records`, best first.
+        Probes are preprocessed like the indexed records, their candidates are
+        found in the blocking inverted indexes, or the 3-gram inverted indexes
+        without blocking, and only those candidates are scored.  The index is
+        not changed.
+
+        Returns the position `query` of the probe, the position `record` and
+        index label `label` of the match, each field's score and the combined
+        `scores`, with at most `top_k` matches per probe.
+
+        Usage::
+            >>> index.match_many([{'title': 'my way', 'artist': 'frank sinatra'}, {'title': 'yesterday', 'artist': 'beatles'}])
+               query  record  label  title  artist  scores
+            0      0    1022   1022    1.0     1.0     1.0
+            1      1      87     87    0.9     1.0    0.95
+        """
+        fields = list( self.field_config['scoring'].keys() )
+        df_probe = self.prepare_records(pd.DataFrame(records).reset_index(drop=True))
+        n_probes = df_probe.shape[0]
+
+        probe_vectors = {field: self.vectorize(field, df_probe[field]) for field in self.vector_fields}
+        entries = {}
+        if self.operation and self.n_records:
+            for field in self.blocking_fields:
+                entries[field] = self.get_entries(field, df_probe[field], probe_vectors.get(field))
+        rows, indexed = self.get_candidates(n_probes, entries, probe_vectors)
+        store, combined, candidates = self.score_candidates(df_probe, probe_vectors, rows, indexed)
+
+        self.matcher.vector_cache.clear()
+        matches = store.to_frame(combined > self.threshold, combined)
+        matches = matches.sort_values([1, 'scores'], ascending=[True, False], kind='stable')
+        if top_k is not None:
+            matches = matches.groupby(1, sort=False).head(top_k)
+        positions = candidates[matches[0].to_numpy() - n_probes]
+        labels = take_values(self.labels, self.bounds, positions) if positions.shape[0] else np.empty(0, dtype=object)
+        return pd.DataFrame({
+            'query': matches[1].to_numpy(),
+            'record': positions,
+            'label': labels,
+            **{column: matches[column].to_numpy() for column in fields + ['scores']}
+            })
+
+    def match_one(self, record: dict | pd.Series, top_k: int = None) -> pd.DataFrame:
+        """Indexed records that match a single `record`, of field values, best
+        first, as from `match_many()` without the `query` column.
+
+        Usage::
+            >>> index.match_one({'title': 'my way', 'artist': 'frank sinatra'})
+               record  label  title  artist  scores
+            0    1022   1022    1.0     1.0     1.0
+        """
+        return self.match_many([dict(record)], top_k).drop(columns='query')
+
+    def query(self, record: dict | pd.Series) -> pd.DataFrame:
+        """Indexed records that match a single `record`; see `match_one()`."""
+        return self.match_one(record)
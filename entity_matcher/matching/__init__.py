@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Matching
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from . import (
+    cosine,
+    exact,
+    levenshtein,
+    embedding
+)
+
+import pandas as pd
+import numpy as np
+
+
+def prepare_field_values(field_values: pd.Series, sim_type: str) -> pd.Series:
+    """Fill missing values for the scorers that require strings."""
+    if sim_type == "exact":
+        return field_values
+    return field_values.fillna("")
+
+
+def score_pairs(
+        field_values: pd.Series, pairs: np.ndarray, sim_type: str, cache: embedding.VectorCache = None,
+        workers: int = -1
+        ) -> np.ndarray:
+    """Score `pairs` of a single field with the `sim_type` method.  The
+    `field_values` are expected to come from `prepare_field_values()`.  The
+    `embedding` method encodes with the vector `cache` of the matcher, and
+    the `levenshtein` method scores with `workers` threads (-1 for every core).
+    """
+    if pairs.shape[0] == 0:
+        return np.empty(0, dtype=np.float64)
+    match sim_type:
+        case "exact":
+            return exact.exact_matches(field_values, pairs)
+        case "fuzzy":
+            return cosine.cosine_similarities(field_values, pairs)
+        case "levenshtein":
+            return levenshtein.levenshtein_distance(field_values, pairs, workers=workers)
+        case "embedding":
+            return embedding.wv_cosine_similarities(field_values, pairs, cache)
+        case _:
+            raise TypeError
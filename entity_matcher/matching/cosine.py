@@ -25,24 +25,47 @@ def cosine_similarities(
     """
     Computing cosine similarities on pairs
     """
-    token_matrix_1, token_matrix_2 = get_token_matrix_pair(field_values, pairs)
-    cos_sim = cosine_similarities_on_pair_matrices(token_matrix_1, token_matrix_2)
+    token_matrix, pair_rows = get_token_matrix_pair(field_values, pairs)
+    cos_sim = rowwise_dot(token_matrix, pair_rows[:, 0], pair_rows[:, 1])
     return cos_sim
 
 
 def get_token_matrix_pair(
     field_values: pd.Series, pairs: np.ndarray,
-) -> tuple[csr_matrix, csr_matrix]:
+) -> tuple[csr_matrix, np.ndarray]:
     """
-    Converting pairs into matrices of token counts (matrix of records
-    by tokens filled with token counts).
+    Converting the records used by pairs into one normalized matrix of
+    token counts (matrix of unique records by tokens filled with token
+    counts), so each record is tokenized once however many pairs it is in.
+    The pairs are returned as rows of that matrix.
     """
-    all_idx = np.unique(pairs)
-    vectorizer = CountVectorizer(analyzer="char", ngram_range=(3, 3))
-    vectorizer.fit(field_values.loc[all_idx])
-    token_matrix_1 = vectorizer.transform(field_values.loc[pairs[:, 0]])
-    token_matrix_2 = vectorizer.transform(field_values.loc[pairs[:, 1]])
-    return token_matrix_1, token_matrix_2
+    all_idx, pair_rows = np.unique(pairs, return_inverse=True)
+    token_matrix = get_normalized_token_matrix(field_values.iloc[all_idx])
+    return token_matrix, pair_rows.reshape(pairs.shape)
+
+
+def rowwise_dot(
+    matrix: csr_matrix, left: np.ndarray, right: np.ndarray, chunk_size: int = 1_000_000
+) -> np.ndarray:
+    """
+    Computing the dot product of rows `left[k]` and `right[k]` of a sparse
+    matrix for every k.  Pairs are processed in chunks: the rows of each side
+    are gathered, multiplied elementwise and the products are summed per pair
+    directly from the sparse buffers, so memory is bounded by the chunk.
+
+    Usage::
+        >>> token_matrix = get_normalized_token_matrix(df['title'].fillna(""))
+        >>> rowwise_dot(token_matrix, pairs[:, 0], pairs[:, 1])
+            array([0.25819889, 1.        , 0.        , ...])
+    """
+    matrix = matrix.tocsr()
+    result = np.zeros(len(left), dtype=np.float64)
+    for start in range(0, len(left), chunk_size):
+        stop = min(start + chunk_size, len(left))
+        product = matrix[left[start:stop]].multiply(matrix[right[start:stop]]).tocsr()
+        pair_ids = np.repeat(np.arange(stop - start), np.diff(product.indptr))
+        result[start:stop] = np.bincount(pair_ids, weights=product.data, minlength=stop - start)
+    return result
 
 
 def cosine_similarities_on_pair_matrices(
@@ -58,4 +81,94 @@ def cosine_similarities_on_pair_matrices(
     cos_sim = np.asarray(
         token_matrix_1.multiply(token_matrix_2).sum(axis=1)
     ).flatten()
-    return cos_sim
\ No newline at end of file
+    return cos_sim
+
+
+def get_token_vectorizer() -> CountVectorizer:
+    """Unfitted vectorizer of 3-gram token counts, used by the fuzzy scorer."""
+    return CountVectorizer(analyzer="char", ngram_range=(3, 3), dtype=np.float64)
+
+
+def get_token_matrix(field_values: pd.Series) -> csr_matrix:
+    """
+    Vectorizing each record once into a matrix of 3-gram token counts
+    (records by tokens).
+    """
+    vectorizer = get_token_vectorizer()
+    try:
+        return vectorizer.fit_transform(field_values).tocsr()
+    except ValueError:
+        #no record has a 3-gram
+        return csr_matrix((field_values.shape[0], 0), dtype=np.float64)
+
+
+def get_normalized_token_matrix(field_values: pd.Series) -> csr_matrix:
+    """
+    Matrix of 3-gram token counts from `get_token_matrix()`, with each record
+    normalized to unit length.
+    """
+    token_matrix = get_token_matrix(field_values)
+    if token_matrix.shape[1] == 0:
+        return token_matrix
+    return normalize(token_matrix, axis=1).tocsr()
+
+
+def sparse_cosine_top_k(
+    token_matrix: csr_matrix, cutoff: float, top_k: int = None, block_size: int = 1000
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finding pairs of records with cosine similarity of at least `cutoff`
+    through a chunked sparse matrix product of the normalized token matrix
+    with its transpose.  Each block of `block_size` rows is multiplied at a
+    time, so memory is bounded by the block.  If `top_k` is given, only the
+    `top_k` most similar records of each row are kept.
+
+    Returns the pairs (i, j), with i > j, and their similarities.
+
+    Usage::
+        >>> token_matrix = get_normalized_token_matrix(df['title'].fillna(""))
+        >>> pairs, scores = sparse_cosine_top_k(token_matrix, cutoff=0.7)
+        >>> pairs
+            array([[  36,   12],
+                   [ 101,   47],
+                   ...
+    """
+    n_records = token_matrix.shape[0]
+    token_matrix = token_matrix.tocsr()
+    pair_blocks, score_blocks = [], []
+    for start in range(0, n_records, block_size):
+        stop = min(start + block_size, n_records)
+        if top_k:
+            #every other record may be one of the row's nearest
+            product = (token_matrix[start:stop] @ token_matrix.T).tocoo()
+        else:
+            #only the lower triangle is needed, so records after the block are skipped
+            product = (token_matrix[start:stop] @ token_matrix[:stop].T).tocoo()
+        rows = product.row.astype(np.int64) + start
+        cols = product.col.astype(np.int64)
+        scores = product.data
+        keep = (scores >= cutoff) & (rows != cols)
+        if not top_k:
+            keep &= cols < rows
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+        if top_k:
+            order = np.lexsort((-scores, rows))
+            rows, cols, scores = rows[order], cols[order], scores[order]
+            row_start = np.searchsorted(rows, rows, side='left')
+            keep = (np.arange(rows.shape[0]) - row_start) < top_k
+            rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+        pair_blocks.append(np.column_stack((np.maximum(rows, cols), np.minimum(rows, cols))))
+        score_blocks.append(scores)
+
+    if not pair_blocks:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float64)
+    pairs = np.concatenate(pair_blocks)
+    scores = np.concatenate(score_blocks)
+    if top_k:
+        #a pair may be found from both of its rows
+        pairs, first = np.unique(pairs, axis=0, return_index=True)
+        scores = scores[first]
+    return pairs, scores
+
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Embedding Cosine Similarity Matching
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+import threading
+
+import pandas as pd
+import numpy as np
+
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+_default_dimensions = 256
+_default_ngram_size = 3
+_default_batch_size = 10_000
+_word_pattern = r"\w+"
+
+
+class HashedNgramEncoder:
+    """Encodes strings as character n-gram counts hashed into `dimensions`
+    signed buckets, L2-normalized.  It needs no fitting or files, so vectors
+    of the same string are the same in any process.
+
+    Usage::
+        >>> HashedNgramEncoder(dimensions=8).encode(np.array(['blue moon'], dtype=object)).shape
+            (1, 8)
+    """
+
+    def __init__(self, dimensions: int = _default_dimensions, ngram_size: int = _default_ngram_size) -> None:
+        self.dimensions = dimensions
+        self.vectorizer = HashingVectorizer(
+            analyzer="char",
+            ngram_range=(ngram_size, ngram_size),
+            n_features=dimensions,
+            alternate_sign=True,
+            norm="l2",
+            dtype=np.float32
+            )
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        return self.vectorizer.transform(values).toarray()
+
+
+def load_word_vectors(path: str) -> tuple[pd.Index, np.ndarray]:
+    """Words and float32 vectors of a local word-vector text file, in the
+    GloVe or word2vec text format: a word and its values on each line, with
+    an optional `count dimensions` header line.  Repeated words keep their
+    first vector."""
+    words, vectors = [], []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            parts = line.rstrip().split(" ")
+            if not words and len(parts) == 2:
+                #word2vec header
+                continue
+            words.append(parts[0])
+            vectors.append(np.asarray(parts[1:], dtype=np.float32))
+    words = pd.Index(words)
+    is_first = ~words.duplicated()
+    return words[is_first], np.vstack(vectors)[is_first]
+
+
+class WordVectorEncoder:
+    """Encodes strings as the mean vector of their lowercase words, from a
+    local word-vector file (see `load_word_vectors()`), L2-normalized.  Words
+    without a vector are skipped, and strings without any are zero vectors.
+
+    Usage::
+        >>> encoder = WordVectorEncoder('glove.6B.100d.txt')
+        >>> encoder.encode(np.array(['blue moon'], dtype=object)).shape
+            (1, 100)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.words, self.word_vectors = load_word_vectors(path)
+        self.dimensions = self.word_vectors.shape[1]
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        tokens = pd.Series(values, dtype=object).str.lower().str.findall(_word_pattern).explode().dropna()
+        word_ids = self.words.get_indexer(tokens.to_numpy())
+        rows, word_ids = tokens.index.to_numpy()[word_ids >= 0], word_ids[word_ids >= 0]
+        vectors = np.zeros((len(values), self.dimensions), dtype=np.float32)
+        np.add.at(vectors, rows, self.word_vectors[word_ids])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+class VectorCache:
+    """Vectors of the strings encoded so far by an `encoder`, keyed by the
+    64-bit hash of each string.  Strings are encoded once, in batches of
+    `batch_size`, and each batch's float32 vectors are kept as an append-only
+    block with its strings, with a hash -> row lookup, so cached vectors are
+    never copied.  A hit is used only if its stored string is the string
+    looked up; a string whose hash collides with another is encoded without
+    being cached.
+
+    A cache belongs to one matcher, which clears it after each run.  It is
+    safe to share between threads, and is pickled with its vectors.
+
+    Usage::
+        >>> cache = VectorCache(HashedNgramEncoder())
+        >>> cache.encode(np.array(['blue moon', 'red sky', 'blue moon'], dtype=object)).shape
+            (3, 256)
+        >>> len(cache)
+            2
+    """
+
+    def __init__(self, encoder, batch_size: int = _default_batch_size) -> None:
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getstate__(self) -> dict:
+        return {key: value for key, value in self.__dict__.items() if key != 'lock'}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Drop every cached vector."""
+        self.rows = {}
+        self.starts = []
+        self.blocks = []
+        self.strings = []
+
+    def take(self, rows: np.ndarray, parts: list[np.ndarray] = None) -> np.ndarray:
+        """Vectors of the cached `rows`, gathered from their blocks, or the
+        rows of other per-block `parts`, such as the `strings`."""
+        parts = self.blocks if parts is None else parts
+        if rows.shape[0] == 0:
+            if parts is self.blocks:
+                return np.empty((0, self.encoder.dimensions), dtype=np.float32)
+            return np.empty(0, dtype=object)
+        block_ids = np.searchsorted(self.starts, rows, side="right") - 1
+        first = parts[block_ids[0]]
+        taken = np.empty((rows.shape[0],) + first.shape[1:], dtype=first.dtype)
+        for block_id in np.unique(block_ids):
+            is_block = block_ids == block_id
+            taken[is_block] = parts[block_id][rows[is_block] - self.starts[block_id]]
+        return taken
+
+    def encode_batches(self, values: np.ndarray) -> list[np.ndarray]:
+        """Float32 vectors of `values`, encoded in batches of `batch_size`."""
+        return [
+            self.encoder.encode(values[start:start + self.batch_size]).astype(np.float32, copy=False)
+            for start in range(0, values.shape[0], self.batch_size)
+            ]
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        """Vectors of the string `values`, a row per value."""
+        values = np.asarray(values, dtype=object)
+        hashes = pd.util.hash_array(values)
+        unique_hashes, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        unique_values = values[first]
+        with self.lock:
+            rows = np.array([self.rows.get(key, -1) for key in unique_hashes.tolist()], dtype=np.int64)
+            is_new = rows < 0
+            is_collision = np.zeros(rows.shape[0], dtype=bool)
+            #a hit must be the same string, not only the same hash
+            is_collision[~is_new] = self.take(rows[~is_new], self.strings) != unique_values[~is_new]
+
+            new_values = unique_values[is_new]
+            new_rows = np.arange(len(self), len(self) + new_values.shape[0], dtype=np.int64)
+            for start, vectors in zip(range(0, new_values.shape[0], self.batch_size), self.encode_batches(new_values)):
+                self.starts.append(len(self) + start)
+                self.blocks.append(vectors)
+                self.strings.append(new_values[start:start + self.batch_size])
+            self.rows.update(zip(unique_hashes[is_new].tolist(), new_rows.tolist()))
+            rows[is_new] = new_rows
+
+            is_cached = ~is_collision
+            vectors = np.empty((unique_hashes.shape[0], self.encoder.dimensions), dtype=np.float32)
+            vectors[is_cached] = self.take(rows[is_cached])
+        if is_collision.any():
+            vectors[is_collision] = np.vstack(self.encode_batches(unique_values[is_collision]))
+        return vectors[inverse.reshape(-1)]
+
+
+def get_encoder(config: dict = None) -> HashedNgramEncoder | WordVectorEncoder:
+    """Encoder from the `embedding` section of a field config.
+
+    * hashed: `HashedNgramEncoder` of `dimensions` and `ngram_size` (default)
+    * word_vectors: `WordVectorEncoder` of the file at `path`
+
+    Usage::
+        >>> get_encoder({'encoder': 'word_vectors', 'path': 'glove.6B.100d.txt'})
+    """
+    config = config or {}
+    match config.get('encoder', 'hashed'):
+        case 'hashed':
+            return HashedNgramEncoder(
+                config.get('dimensions', _default_dimensions), config.get('ngram_size', _default_ngram_size)
+                )
+        case 'word_vectors':
+            return WordVectorEncoder(config['path'])
+        case _:
+            raise TypeError
+
+
+def get_dimensions(config: dict = None) -> int:
+    """Vector dimensions of the encoder of the `embedding` section of a field
+    config, without loading a word-vector file: from its first line."""
+    config = config or {}
+    if config.get('encoder', 'hashed') != 'word_vectors':
+        return config.get('dimensions', _default_dimensions)
+    with open(config['path'], encoding="utf-8") as file:
+        parts = file.readline().rstrip().split(" ")
+    return int(parts[1]) if len(parts) == 2 else len(parts) - 1
+
+
+def encode_values(field_values: pd.Series, cache: VectorCache = None) -> np.ndarray:
+    """Float32 vectors of a field's values, a row per record, with missing
+    values as empty strings, from the `cache` (a new one of the default
+    encoder if not given)."""
+    cache = VectorCache(get_encoder()) if cache is None else cache
+    return cache.encode(field_values.fillna("").astype(str).to_numpy(dtype=object))
+
+
+def wv_cosine_similarities(
+        field_values: pd.Series, pairs: np.ndarray, cache: VectorCache = None, chunk_size: int = 1_000_000
+        ) -> np.ndarray:
+    """
+    Computing the cosine similarities of the embedding vectors of pairs
+
+    Only the records used by pairs are encoded, each once, with the vectors
+    of the `cache` (see `encode_values()`), and the scores
+    are row-wise dot products of their normalized vectors, in chunks of
+    pairs.  Records without a vector score 0.
+    """
+    all_idx, pair_rows = np.unique(pairs, return_inverse=True)
+    pair_rows = pair_rows.reshape(pairs.shape)
+    vectors = encode_values(field_values.iloc[all_idx], cache)
+    results = np.empty(pairs.shape[0], dtype=np.float64)
+    for start in range(0, pairs.shape[0], chunk_size):
+        stop = min(start + chunk_size, pairs.shape[0])
+        left, right = vectors[pair_rows[start:stop, 0]], vectors[pair_rows[start:stop, 1]]
+        results[start:stop] = np.einsum("ij,ij->i", left, right)
+    return np.clip(results, -1.0, 1.0)
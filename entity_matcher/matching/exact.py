@@ -19,8 +19,11 @@ def exact_matches(
         ) -> np.ndarray:
     """
     Performing exact matches on pairs
-    """
 
-    arr1 = field_values.loc[pairs[:, 0]].values
-    arr2 = field_values.loc[pairs[:, 1]].values
+    Values are looked up by position, like the other scorers, so any index
+    of the frame gives the same scores.
+    """
+    values = field_values.to_numpy(dtype=object)
+    arr1 = values[pairs[:, 0]]
+    arr2 = values[pairs[:, 1]]
     return ((arr1 == arr2) & (~pd.isna(arr1)) & (~pd.isna(arr2))).astype(int)
\ No newline at end of file
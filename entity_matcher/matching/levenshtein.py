@@ -16,31 +16,27 @@ from rapidfuzz import process, fuzz
 
 
 def levenshtein_distance(
-        field_values: pd.Series, pairs: np.ndarray
+        field_values: pd.Series, pairs: np.ndarray, chunk_size: int = 1_000_000, workers: int = -1
         ) -> np.ndarray:
     """
     Performing levenshtein distance matching on pairs
 
+    The values of each side are gathered by position and every aligned pair
+    is scored in one native `process.cpdist` call per chunk, using `workers`
+    threads (all cores by default).  Scores are returned in pair order.
+
     Notes:
-        - the range of ratios is 0 - 100
+        - the range of ratios is 0 - 100, which is scaled to 0 - 1
     """
-    results = []
-    previous_target = None
-    for target in np.unique(pairs[:, 0]):
-        if target != previous_target:
-            comparison_index = [idx[1] for idx in pairs if idx[0]==target]
-            comparison_values = field_values[comparison_index].values
-            target_value = field_values.loc[target]
-            distances = process.extract(target_value, 
-                                        comparison_values, 
-                                        scorer=fuzz.QRatio, 
-                                        limit=None
-                                        )
-            ordered_distances = []
-            for idx, compare_idx in enumerate(comparison_index):
-                dist = [distance[1] for distance in distances if distance[2]==idx][0] / 100
-                ordered_distances.append(dist)
-            results.extend(ordered_distances)
-            previous_target = target
-
-    return np.array(results)
\ No newline at end of file
+    values = field_values.to_numpy(dtype=object)
+    results = np.empty(pairs.shape[0], dtype=np.float64)
+    for start in range(0, pairs.shape[0], chunk_size):
+        stop = min(start + chunk_size, pairs.shape[0])
+        distances = process.cpdist(values[pairs[start:stop, 0]], 
+                                   values[pairs[start:stop, 1]], 
+                                   scorer=fuzz.QRatio, 
+                                   workers=workers
+                                   )
+        results[start:stop] = distances / 100
+
+    return results
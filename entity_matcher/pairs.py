@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Pair Generation
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from collections.abc import Iterator
+
+import pandas as pd
+import numpy as np
+
+
+def count_index_pairs(n_records: int) -> int:
+    """Number of unique (i, j) pairs, with i > j, for `n_records` records."""
+    return n_records * (n_records - 1) // 2
+
+
+def get_pair_dtype(n_records: int) -> np.dtype:
+    """Smallest integer dtype able to hold every record index."""
+    return np.dtype(np.int32) if n_records <= np.iinfo(np.int32).max else np.dtype(np.int64)
+
+
+def triangle_index_to_pairs(
+        linear_index: np.ndarray, dtype: np.dtype = np.int64
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """Convert positions in the row-major lower triangle into (i, j) indices.
+
+    The lower triangle is enumerated as (1,0), (2,0), (2,1), (3,0), ... so that
+    position `k` is found at row `i` where `i*(i-1)/2 <= k < i*(i+1)/2`.
+
+    Usage::
+        >>> triangle_index_to_pairs(np.arange(6))
+            (array([1, 2, 2, 3, 3, 3]), array([0, 0, 1, 0, 1, 2]))
+    """
+    k = np.asarray(linear_index, dtype=np.int64)
+    i = ((1 + np.sqrt(1 + 8 * k.astype(np.float64))) // 2).astype(np.int64)
+    #correct float rounding at the triangle boundaries
+    i -= (i * (i - 1) // 2) > k
+    i += ((i + 1) * i // 2) <= k
+    j = k - i * (i - 1) // 2
+    return i.astype(dtype, copy=False), j.astype(dtype, copy=False)
+
+
+def create_index_pairs(n_records: int) -> np.ndarray:
+    """Create every lower-triangle pair (i, j), with i > j, as a compact array.
+
+    The pairs are written straight into the result in its dtype: `i` repeats
+    each row, and `j` is a running count that restarts at each row, so the
+    only temporary is one column of the result.
+
+    Usage::
+        >>> create_index_pairs(4)
+            array([[1, 0],
+                   [2, 0],
+                   [2, 1],
+                   [3, 0],
+                   [3, 1],
+                   [3, 2]], dtype=int32)
+    """
+    dtype = get_pair_dtype(n_records)
+    pairs = np.empty((count_index_pairs(n_records), 2), dtype=dtype)
+    if n_records < 2:
+        return pairs
+    rows = np.arange(1, n_records, dtype=dtype)
+    pairs[:, 0] = np.repeat(rows, rows)
+    #j steps by one within a row, and drops from i - 2 back to 0 at the start of row i
+    steps = np.ones(pairs.shape[0], dtype=dtype)
+    steps[0] = 0
+    row_starts = rows[1:].astype(np.int64) * (rows[1:] - 1) // 2
+    steps[row_starts] = 2 - rows[1:]
+    np.cumsum(steps, out=pairs[:, 1])
+    return pairs
+
+
+def iter_index_pairs(n_records: int, chunk_size: int = 5_000_000) -> Iterator[np.ndarray]:
+    """Yield the pairs of `create_index_pairs()`, in the same order, as chunks of
+    at most `chunk_size` rows so that memory is bounded by the chunk.
+
+    Usage::
+        >>> for chunk in iter_index_pairs(20_000, chunk_size=5_000_000):
+        ...     chunk.shape
+            (5000000, 2)
+            ...
+            (4990000, 2)
+    """
+    if chunk_size < 1:
+        raise ValueError('`chunk_size` must be a positive integer')
+    dtype = get_pair_dtype(n_records)
+    total = count_index_pairs(n_records)
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        i, j = triangle_index_to_pairs(np.arange(start, stop, dtype=np.int64), dtype)
+        yield np.column_stack((i, j))
+
+
+def pairs_to_keys(pairs: np.ndarray, n_records: int) -> np.ndarray:
+    """Encode pairs as int64 keys `i*n + j` with i > j, so that (a,b) and (b,a)
+    share a key.  Self-pairs are dropped.
+
+    Usage::
+        >>> pairs_to_keys(np.array([[0, 2], [2, 0], [1, 1]]), n_records=3)
+            array([6, 6])
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    i = np.maximum(pairs[:, 0], pairs[:, 1])
+    j = np.minimum(pairs[:, 0], pairs[:, 1])
+    keep = i != j
+    return i[keep] * n_records + j[keep]
+
+
+def keys_to_pairs(keys: np.ndarray, n_records: int) -> np.ndarray:
+    """Decode keys from `pairs_to_keys()` back into (i, j) pairs."""
+    dtype = get_pair_dtype(n_records)
+    i, j = np.divmod(np.asarray(keys, dtype=np.int64), n_records)
+    return np.column_stack((i.astype(dtype, copy=False), j.astype(dtype, copy=False)))
+
+
+def unique_pair_keys(pairs: np.ndarray, n_records: int) -> np.ndarray:
+    """Sorted, deduplicated keys for an array of pairs."""
+    return np.unique(pairs_to_keys(pairs, n_records))
+
+
+def is_member(keys: np.ndarray, sorted_keys: np.ndarray) -> np.ndarray:
+    """Boolean mask of which `keys` are found in the sorted array `sorted_keys`."""
+    if sorted_keys.shape[0] == 0:
+        return np.zeros(keys.shape[0], dtype=bool)
+    position = np.searchsorted(sorted_keys, keys)
+    position[position == sorted_keys.shape[0]] = 0
+    return sorted_keys[position] == keys
+
+
+class CandidatePairs:
+    """Store of candidate pairs: one sorted, deduplicated int64 key array of
+    `i*n + j` (i > j) with a float32 score column per field.  Scores are
+    scattered into the store by position, so the fields of a pair are combined
+    without merging tables.
+
+    Usage::
+        >>> store = CandidatePairs.from_pairs(df.shape[0], np.concatenate(list(pair_dict.values())))
+        >>> store.set_scores('title', pair_dict['title'], title_scores)
+        >>> store.set_scores('artist', pair_dict['artist'], artist_scores)
+        >>> store.to_frame(store.combined_scores() > 0.7)
+                 0     1     title  artist    scores
+            0   36    12  0.816497     NaN  0.816497
+            ...
+    """
+
+    def __init__(self, n_records: int, keys: np.ndarray) -> None:
+        self.n_records = n_records
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.scores = {}
+
+    @classmethod
+    def from_pairs(cls, n_records: int, pairs: np.ndarray) -> 'CandidatePairs':
+        """Create the store from pairs in any orientation, with duplicates."""
+        return cls(n_records, unique_pair_keys(pairs, n_records))
+
+    def __len__(self) -> int:
+        return self.keys.shape[0]
+
+    @property
+    def pairs(self) -> np.ndarray:
+        return keys_to_pairs(self.keys, self.n_records)
+
+    def get_positions(self, keys: np.ndarray) -> np.ndarray:
+        """Position of each of `keys` in the store, which must contain them."""
+        return np.searchsorted(self.keys, keys)
+
+    def set_scores(self, field: str, pairs: np.ndarray, scores: np.ndarray) -> None:
+        """Scatter a field's `scores` for `pairs` into the field's score column.
+        Pairs the field did not score are left as NaN."""
+        self.set_scores_by_keys(field, pairs_to_keys(pairs, self.n_records), scores[pairs[:, 0] != pairs[:, 1]])
+
+    def set_scores_by_keys(self, field: str, keys: np.ndarray, scores: np.ndarray) -> None:
+        """Scatter a field's `scores` for pair `keys` into the field's score column."""
+        if field not in self.scores:
+            self.scores[field] = np.full(len(self), np.nan, dtype=np.float32)
+        self.scores[field][self.get_positions(keys)] = scores
+
+    def combined_scores(self, fields: list = None, weights: dict[str, float] = None) -> np.ndarray:
+        """Mean of the available field scores of each pair, weighted by the
+        optional `weights` of each field (default 1)."""
+        fields = fields if fields is not None else list(self.scores.keys())
+        weights = weights or {}
+        total = np.zeros(len(self), dtype=np.float64)
+        count = np.zeros(len(self), dtype=np.float64)
+        for field in fields:
+            column = self.scores[field]
+            is_scored = ~np.isnan(column)
+            total[is_scored] += weights.get(field, 1) * column[is_scored]
+            count += weights.get(field, 1) * is_scored
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+
+    def to_frame(self, mask: np.ndarray = None, combined: np.ndarray = None) -> pd.DataFrame:
+        """Table of the pairs, selected by the boolean `mask`, with columns for
+        the pair indices `0` and `1`, each field's score and the combined `scores`."""
+        mask = mask if mask is not None else slice(None)
+        combined = combined if combined is not None else self.combined_scores()
+        frame = pd.DataFrame(keys_to_pairs(self.keys[mask], self.n_records))
+        for field, column in self.scores.items():
+            frame[field] = column[mask]
+        frame['scores'] = combined[mask]
+        return frame
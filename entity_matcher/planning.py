@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Memory Planning
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from .pairs import count_index_pairs
+from .blocking import Blocks, token_blocking, lsh_blocking
+from .block_processing import get_purging_threshold
+from .matching import embedding
+
+import pandas as pd
+import numpy as np
+
+import psutil
+
+
+_ngram_size = 3
+_min_chunk_pairs = 10_000
+_sparse_candidates_per_record = 10      #assumed candidates per record from the sparse cosine engine
+
+#approximate bytes held while scoring one pair, by scoring method
+_scoring_bytes_per_pair = {
+    'exact': 40,
+    'levenshtein': 48,
+}
+#bytes per stored 3-gram: float64 count + int32 column index
+_bytes_per_ngram = 12
+
+
+def get_available_memory(memory_limit: int = None) -> int:
+    """Memory, in bytes, that is currently free on the system, capped by the
+    optional user-supplied `memory_limit` (bytes).
+    """
+    available = psutil.virtual_memory().available
+    if memory_limit:
+        available = min(available, int(memory_limit))
+    return available
+
+
+def get_block_sizes(field_values: pd.Series, operation: str) -> np.ndarray:
+    """Number of records in each block produced by the `standard` blocking
+    operation, without building the blocks themselves.
+    """
+    values = field_values.dropna()
+    match operation:
+        case 'standard':
+            return values.value_counts().to_numpy()
+        case _:
+            raise TypeError
+
+
+def create_blocks(
+        field_values: pd.Series, blocking: dict, n_jobs: int = 1, bands: int = 20, rows: int = 5
+        ) -> Blocks | None:
+    """Blocks of the `token` and `lsh` blocking operations, whose sizes are
+    only known once the blocks are built, so the plan keeps them for the run
+    to reuse.  None for other operations.  `bands` and `rows` are the `lsh`
+    defaults, used when the blocking does not set them.
+    """
+    match blocking.get('operation'):
+        case 'token':
+            return token_blocking(field_values, n_jobs=n_jobs)
+        case 'lsh':
+            return lsh_blocking(field_values, blocking.get('bands', bands), blocking.get('rows', rows))
+        case _:
+            return None
+
+
+def count_block_pairs(block_sizes: np.ndarray, expansion: str = 'all') -> int:
+    """Number of pairs created when expanding blocks with `expand_blocks()`:
+    every pair within a block (`all`) or the first record of a block paired
+    with each of the others (`star`).  Duplicates across blocks are counted.
+    """
+    block_sizes = np.asarray(block_sizes, dtype=np.int64)
+    if expansion == 'star':
+        return int(np.maximum(block_sizes - 1, 0).sum())
+    return int((block_sizes * (block_sizes - 1) // 2).sum())
+
+
+def count_sorted_neighborhood_pairs(n_records: int, window_size: int = 3) -> int:
+    """Number of pairs of a sorted neighborhood pass over `n_records` records,
+    each paired with the `window_size` records before it."""
+    return sum(max(n_records - offset, 0) for offset in range(1, window_size + 1))
+
+
+def estimate_pair_count(
+        field_values: pd.Series, blocking: dict, purging_threshold: int = 10000, blocks: Blocks = None
+        ) -> int:
+    """Estimate the number of candidate pairs for a field after blocking, from
+    the sizes of its `blocks` if they are built (see `create_blocks()`)."""
+    if blocking == {}:
+        return count_index_pairs(field_values.shape[0])
+    if blocking['operation'] == 'knn':
+        #at most `neighbors` pairs per record
+        return field_values.dropna().shape[0] * int(blocking.get('neighbors', 10))
+    if blocking['operation'] == 'sorted_neighborhood':
+        return count_sorted_neighborhood_pairs(field_values.dropna().shape[0], int(blocking.get('window', 3)))
+    if blocks is not None:
+        sizes = blocks.drop_missing().sizes
+    else:
+        sizes = get_block_sizes(field_values, blocking['operation'])
+    if blocking.get('process') in ('purge', 'meta'):
+        #meta blocking prunes the purged pairs, and filtering removes some, so this is an upper bound
+        purging_threshold = blocking.get('purging_threshold', purging_threshold)
+        if blocking.get('comparison_budget') is not None:
+            purging_threshold = min(purging_threshold, get_purging_threshold(sizes, blocking['comparison_budget']))
+        sizes = sizes[(sizes > 1) & (sizes < purging_threshold)]
+    return count_block_pairs(sizes, blocking.get('expansion', 'all'))
+
+
+def estimate_ngrams_per_record(field_values: pd.Series) -> float:
+    """Average count of character 3-grams per record, which bounds the
+    non-zero entries of each row in the fuzzy scorer's token matrix.
+    """
+    lengths = field_values.fillna("").astype(str).str.len().to_numpy()
+    if lengths.shape[0] == 0:
+        return 0.0
+    return float(np.maximum(lengths - (_ngram_size - 1), 0).mean())
+
+
+def estimate_scoring_bytes_per_pair(
+        field_values: pd.Series, sim_type: str, dimensions: int = embedding._default_dimensions
+        ) -> float:
+    """Approximate working memory, in bytes, used to score a single pair, with
+    embedding vectors of `dimensions`."""
+    if sim_type == 'fuzzy':
+        #rows of both sides are gathered from the record matrix, then their product is held
+        ngrams = estimate_ngrams_per_record(field_values)
+        return 3 * ngrams * _bytes_per_ngram + 32
+    if sim_type == 'embedding':
+        #float32 vectors of both sides are gathered, with the cached vectors of unique records
+        return 3 * 4 * dimensions + 32
+    return _scoring_bytes_per_pair.get(sim_type, 64)
+
+
+def estimate_stage_memory(
+        df: pd.DataFrame, field_config: dict, pair_count: dict[str, int]
+        ) -> dict[str, int]:
+    """Estimate peak memory, in bytes, of each stage of `EntityMatcher.get_matches()`.
+
+    * pairs: int32 pair arrays for every field, with the int32 column built
+      while generating them and, when blocking, the int64 pair keys and the
+      sorted copy made to deduplicate them
+    * ngram_matrix: sparse 3-gram matrices of the largest fuzzy field
+    * scoring: working memory of the largest field scored by other methods
+    * scores: float64 score array for every field
+    * pair_store: unique pair keys with a float32 score column per field
+    """
+    fields = list( field_config['scoring'].keys() )
+    total_pairs = sum(pair_count.values())
+    stages = {
+        'pairs': (2 * 4 + 4 + (2 * 8 if field_config['blocking'] != {} else 0)) * total_pairs,
+        'ngram_matrix': 0,
+        'scoring': 0,
+        'scores': 8 * total_pairs,
+        'pair_store': (8 + 4 * len(fields) + 2 * 8) * total_pairs,
+    }
+    dimensions = embedding.get_dimensions(field_config.get('embedding'))
+    for field, sim_type in field_config['scoring'].items():
+        working = int(pair_count[field] * estimate_scoring_bytes_per_pair(df[field], sim_type, dimensions))
+        stage = 'ngram_matrix' if sim_type == 'fuzzy' else 'scoring'
+        stages[stage] = max(stages[stage], working)
+    return stages
+
+
+def estimate_chunk_pairs(
+        df: pd.DataFrame, field_config: dict, pair_count: dict[str, int], memory_budget: int
+        ) -> int:
+    """Largest chunk of pairs that can be scored within the `memory_budget`,
+    after the memory held for the whole run (pair keys when blocking) is removed.
+    """
+    fields = list( field_config['scoring'].keys() )
+    resident = 0
+    if field_config['blocking'] != {}:
+        resident = (2 * 4 + 8) * sum(pair_count.values())
+    dimensions = embedding.get_dimensions(field_config.get('embedding'))
+    per_pair = 2 * 4 + 8 * (len(fields) + 1) + max(
+        estimate_scoring_bytes_per_pair(df[field], sim_type, dimensions)
+        for field, sim_type in field_config['scoring'].items()
+    )
+    chunk_pairs = int((memory_budget - resident) // per_pair)
+    return max(chunk_pairs, _min_chunk_pairs)
+
+
+def plan_memory(
+        df: pd.DataFrame,
+        field_config: dict,
+        memory_limit: int = None,
+        default_blocking: dict = None,
+        budget_fraction: float = 0.5,
+        sparse_cosine: bool = False,
+        sparse_top_k: int = None,
+        n_jobs: int = 1,
+        lsh_bands: int = 20,
+        lsh_rows: int = 5
+        ) -> dict:
+    """Estimate the cost of each matching stage and choose blocking and chunk
+    size so the run fits within the memory budget.
+
+    The budget is `budget_fraction` of the free system memory, or of the
+    `memory_limit` (bytes) if that is smaller.  If the configured run does not
+    fit and blocking is off, `default_blocking` is applied.  If it still does
+    not fit, `chunk_pairs` is set so that scoring is streamed in chunks.
+
+    With `sparse_cosine`, unblocked candidates come from the sparse cosine
+    engine, so their count is taken as linear in the records (`sparse_top_k`
+    per record, if given) rather than every pair.
+
+    The `token` and `lsh` blocks that are built to count their pairs are
+    returned as `blocks`, by blocking field, so the run does not build them
+    again.  The `lsh` blocks use `lsh_bands` and `lsh_rows` unless the blocking
+    sets `bands` and `rows`, so they match the blocks the run would build.
+
+    Usage::
+        >>> plan = plan_memory(df, field_config, memory_limit=2 * 1024 ** 3)
+        >>> print(format_plan(plan))
+            records: 127,451
+            blocking: {'operation': 'standard', 'process': 'purge'}
+            ...
+    """
+    available = get_available_memory(memory_limit)
+    memory_budget = int(available * budget_fraction)
+    blocking = dict(field_config['blocking'])
+
+    def estimate(blocking):
+        config = {**field_config, 'blocking': blocking}
+        blocks = {
+            field: create_blocks(df[field], blocking, n_jobs, lsh_bands, lsh_rows)
+            for field in (blocking.get('fields') or field_config['scoring'])
+            if blocking.get('operation') in ('token', 'lsh')
+            }
+        if blocking == {} and sparse_cosine:
+            per_record = sparse_top_k or _sparse_candidates_per_record
+            pair_count = {field: df.shape[0] * per_record for field in field_config['scoring']}
+        elif blocking.get('operation') == 'sorted_neighborhood' and blocking.get('keys'):
+            #one pass per sort key, shared by every scored field
+            window_size = int(blocking.get('window', 3))
+            shared = sum(
+                count_sorted_neighborhood_pairs(df[key].dropna(how='all').shape[0], window_size)
+                for key in [key if isinstance(key, list) else [key] for key in blocking['keys']]
+                )
+            pair_count = {field: shared for field in field_config['scoring']}
+        elif blocking.get('fields'):
+            #union of the key fields' pairs, shared by every scored field
+            shared = sum(
+                estimate_pair_count(df[field], blocking, blocks=blocks.get(field)) for field in blocking['fields']
+                )
+            pair_count = {field: shared for field in field_config['scoring']}
+        else:
+            pair_count = {
+                field: estimate_pair_count(df[field], blocking, blocks=blocks.get(field))
+                for field in field_config['scoring']
+                }
+        stages = estimate_stage_memory(df, config, pair_count)
+        return config, pair_count, stages, blocks
+
+    config, pair_count, stages, blocks = estimate(blocking)
+    if sum(stages.values()) > memory_budget and blocking == {} and default_blocking:
+        config, pair_count, stages, blocks = estimate(dict(default_blocking))
+
+    chunk_pairs = None
+    if sum(stages.values()) > memory_budget:
+        chunk_pairs = estimate_chunk_pairs(df, config, pair_count, memory_budget)
+
+    return {
+        'records': df.shape[0],
+        'available_memory': available,
+        'memory_budget': memory_budget,
+        'blocking': config['blocking'],
+        'pair_count': pair_count,
+        'stages': stages,
+        'estimated_memory': sum(stages.values()),
+        'chunk_pairs': chunk_pairs,
+        'blocks': blocks,
+    }
+
+
+def format_plan(plan: dict) -> str:
+    """Readable report of a plan from `plan_memory()`."""
+    mb = 1024 ** 2
+    lines = [
+        f"records: {plan['records']:,}",
+        f"blocking: {plan['blocking'] if plan['blocking'] else 'none'}",
+        f"memory budget: {plan['memory_budget'] / mb:,.1f} MB of {plan['available_memory'] / mb:,.1f} MB available",
+    ]
+    for field, count in plan['pair_count'].items():
+        lines.append(f"pairs for {field}: {count:,}")
+    for stage, size in plan['stages'].items():
+        lines.append(f"stage {stage}: {size / mb:,.1f} MB")
+    lines.append(f"estimated memory: {plan['estimated_memory'] / mb:,.1f} MB")
+    if plan['chunk_pairs']:
+        lines.append(f"streaming in chunks of {plan['chunk_pairs']:,} pairs")
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Storage of fitted state
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from scipy.sparse import csr_matrix, issparse
+
+
+_format_version = 1
+_manifest_name = 'manifest.json'
+
+
+def encode_strings(array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Encode an array of strings, with missing values, into a utf-8 byte
+    buffer, the offsets of each string in it and a mask of missing values.
+
+    Usage::
+        >>> encode_strings(np.array(['ab', None, 'c'], dtype=object))
+            (array([97, 98, 99], dtype=uint8), array([0, 2, 2, 3]), array([False,  True, False]))
+    """
+    missing = pd.isna(array)
+    encoded = [b'' if is_missing else value.encode('utf-8') for value, is_missing in zip(array, missing)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, np.asarray(missing, dtype=bool)
+
+
+def decode_strings(
+        buffer: np.ndarray, offsets: np.ndarray, missing: np.ndarray,
+        rows: np.ndarray = None, chunk_size: int = 100_000
+        ) -> np.ndarray:
+    """Object array of the strings from `encode_strings()`, or of only their
+    `rows`, with None where missing.  Each chunk of rows is gathered from the
+    buffer into a fixed-width array and decoded in one step; ascii text is
+    widened to unicode without decoding.
+
+    Usage::
+        >>> decode_strings(*encode_strings(np.array(['ab', None, 'c'], dtype=object)), rows=np.array([2, 0]))
+            array(['c', 'ab'], dtype=object)
+    """
+    buffer = np.asarray(buffer)
+    rows = np.arange(offsets.shape[0] - 1) if rows is None else np.asarray(rows, dtype=np.int64)
+    result = np.empty(rows.shape[0], dtype=object)
+    for start in range(0, rows.shape[0], chunk_size):
+        chunk = rows[start:start + chunk_size]
+        starts, stops = offsets[chunk], offsets[chunk + 1]
+        lengths = stops - starts
+        width = max(int(lengths.max()) if chunk.shape[0] else 0, 1)
+        columns = np.arange(width)
+        positions = np.minimum(starts[:, None] + columns, max(buffer.shape[0] - 1, 0))
+        chars = np.where(columns < lengths[:, None], buffer[positions] if buffer.shape[0] else 0, 0).astype(np.uint8)
+        if chars.shape[0] and chars.max() >= 128:
+            strings = np.char.decode(np.ascontiguousarray(chars).view(f'S{width}').ravel(), 'utf-8')
+        else:
+            strings = chars.astype(np.uint32).view(f'U{width}').ravel()
+        result[start:start + chunk.shape[0]] = strings.astype(object)
+    result[np.asarray(missing)[rows]] = None
+    return result
+
+
+class StringColumn:
+    """Strings saved by `save_arrays()`, kept as their memory-mapped buffer,
+    offsets and missing mask.  Only the rows that are taken are decoded, so
+    processes share the pages of the column.
+
+    Usage::
+        >>> arrays, metadata = load_arrays('index')
+        >>> arrays['values/title'].take(np.array([4, 17]))
+            array(['my way', 'yesterday'], dtype=object)
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, missing: np.ndarray) -> None:
+        self.buffer = buffer
+        self.offsets = offsets
+        self.missing = missing
+
+    def __len__(self) -> int:
+        return self.offsets.shape[0] - 1
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        return decode_strings(self.buffer, self.offsets, self.missing, rows)
+
+    def to_numpy(self) -> np.ndarray:
+        return decode_strings(self.buffer, self.offsets, self.missing)
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return self.to_numpy()
+
+
+def is_string_array(array: np.ndarray) -> bool:
+    """Whether an object array holds only strings and missing values."""
+    return all(isinstance(value, str) for value in array[~pd.isna(array)])
+
+
+def save_arrays(path: str, arrays: dict[str, np.ndarray | csr_matrix], metadata: dict = None) -> None:
+    """Save named arrays to the directory `path`, as raw `.npy` files that can
+    be memory-mapped, with a versioned `manifest.json` of their layout and the
+    `metadata`.
+
+    * numeric arrays are saved as is
+    * sparse matrices are saved as their csr `data`, `indices` and `indptr`
+    * string arrays are saved as a utf-8 buffer, offsets and missing mask
+    * other object arrays are pickled, so they are read into memory
+
+    Usage::
+        >>> save_arrays('index', {'labels': labels, 'vectors': vectors}, {'field_config': field_config})
+    """
+    os.makedirs(path, exist_ok=True)
+    entries = {}
+    for position, (name, array) in enumerate(arrays.items()):
+        stem = f'{position:04d}'
+        if issparse(array):
+            array = array.tocsr()
+            parts = {'data': array.data, 'indices': array.indices, 'indptr': array.indptr}
+            entries[name] = {'kind': 'csr', 'file': stem, 'shape': list(array.shape)}
+        else:
+            array = np.asarray(array)
+            if array.dtype != object:
+                parts = {'array': array}
+                entries[name] = {'kind': 'array', 'file': stem}
+            elif is_string_array(array):
+                buffer, offsets, missing = encode_strings(array)
+                parts = {'buffer': buffer, 'offsets': offsets, 'missing': missing}
+                entries[name] = {'kind': 'strings', 'file': stem}
+            else:
+                parts = {'object': array}
+                entries[name] = {'kind': 'object', 'file': stem}
+        for part, values in parts.items():
+            np.save(os.path.join(path, f'{stem}.{part}.npy'), values, allow_pickle=(part == 'object'))
+
+    manifest = {
+        'format_version': _format_version,
+        'package_version': __version__,
+        'arrays': entries,
+        'metadata': metadata or {},
+        }
+    with open(os.path.join(path, _manifest_name), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def load_manifest(path: str) -> dict:
+    """The manifest of a directory from `save_arrays()`, checking its format version."""
+    with open(os.path.join(path, _manifest_name)) as file:
+        manifest = json.load(file)
+    if manifest.get('format_version') != _format_version:
+        raise TypeError
+    return manifest
+
+
+def load_arrays(path: str, mmap_mode: str = 'r') -> tuple[dict, dict]:
+    """Load the arrays and metadata saved by `save_arrays()`.  Numeric arrays
+    and the parts of sparse matrices are memory-mapped with `mmap_mode`, so
+    processes that load the same files share their pages; use None to read
+    them into memory.  Strings are loaded as a `StringColumn`, which decodes
+    rows when they are taken.
+
+    Usage::
+        >>> arrays, metadata = load_arrays('index')
+        >>> arrays['vectors']
+            <127451x8934 sparse matrix of type '<class 'numpy.float64'>' ...>
+    """
+    manifest = load_manifest(path)
+
+    def load(stem, part):
+        is_object = part == 'object'
+        return np.load(
+            os.path.join(path, f'{stem}.{part}.npy'),
+            mmap_mode=None if is_object else mmap_mode,
+            allow_pickle=is_object
+            )
+
+    arrays = {}
+    for name, entry in manifest['arrays'].items():
+        stem = entry['file']
+        match entry['kind']:
+            case 'array':
+                arrays[name] = load(stem, 'array')
+            case 'csr':
+                arrays[name] = csr_matrix(
+                    (load(stem, 'data'), load(stem, 'indices'), load(stem, 'indptr')),
+                    shape=tuple(entry['shape']),
+                    copy=False
+                    )
+            case 'strings':
+                arrays[name] = StringColumn(load(stem, 'buffer'), load(stem, 'offsets'), load(stem, 'missing'))
+            case 'object':
+                arrays[name] = load(stem, 'object')
+    return arrays, manifest['metadata']
@@ -2,10 +2,17 @@ from .review import get_similar_text
 from .summarize import (df_sparsity_summary, 
                        create_sparsity_table
                        )
+from .report import (blocking_report,
+                     compare_blocking_approaches,
+                     format_report
+                     )
 
 
 __all__ = [
     "get_similar_text",
     "df_sparsity_summary",
-    "create_sparsity_table"
+    "create_sparsity_table",
+    "blocking_report",
+    "compare_blocking_approaches",
+    "format_report"
     ]
\ No newline at end of file
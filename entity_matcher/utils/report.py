@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Report blocking quality and cost
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from ..EntityMatcher import EntityMatcher
+from ..blocking import Blocks
+from ..block_processing import expand_blocks
+from ..pairs import (
+    count_index_pairs,
+    triangle_index_to_pairs,
+    unique_pair_keys,
+    keys_to_pairs,
+    is_member
+)
+from ..matching import (
+    prepare_field_values,
+    score_pairs
+)
+
+import time
+
+import pandas as pd
+import numpy as np
+
+
+_block_size_bins = [1, 2, 3, 6, 11, 101, 1001, 10001]
+_default_sample_pairs = 10_000
+
+
+def get_true_pair_keys(truth: pd.Series) -> np.ndarray:
+    """Sorted keys of the pairs of records that share a ground-truth id, such
+    as the `CID` column of the test data.  Records without an id are skipped.
+
+    Usage::
+        >>> true_keys = get_true_pair_keys(df['CID'])
+        >>> true_keys.shape
+            (44117,)
+    """
+    n_records = truth.shape[0]
+    blocks = Blocks.from_entries(np.arange(n_records), truth.to_numpy()).drop_missing()
+    return unique_pair_keys(expand_blocks(blocks, mode='all', deduplicate=False), n_records)
+
+
+def get_pair_metrics(pair_keys: np.ndarray, n_records: int, true_keys: np.ndarray = None) -> dict:
+    """Quality of a set of candidate pair keys, sorted and unique.
+
+    * reduction_ratio: share of all pairs that are not candidates
+    * pair_completeness: share of true pairs that are candidates (recall)
+    * pair_quality: share of candidates that are true pairs (precision)
+
+    The last two are None without `true_keys`.
+
+    Usage::
+        >>> get_pair_metrics(pair_keys, df.shape[0], get_true_pair_keys(df['CID']))
+            {'candidate_pairs': 64021, 'total_pairs': 8121746475, 'reduction_ratio': 0.99999, ...}
+    """
+    total_pairs = count_index_pairs(n_records)
+    candidate_pairs = int(pair_keys.shape[0])
+    metrics = {
+        'candidate_pairs': candidate_pairs,
+        'total_pairs': total_pairs,
+        'reduction_ratio': 1 - candidate_pairs / total_pairs if total_pairs else 0.0,
+        'pair_completeness': None,
+        'pair_quality': None,
+    }
+    if true_keys is not None:
+        found = int(is_member(true_keys, pair_keys).sum())
+        metrics['pair_completeness'] = found / true_keys.shape[0] if true_keys.shape[0] else 1.0
+        metrics['pair_quality'] = found / candidate_pairs if candidate_pairs else 0.0
+    return metrics
+
+
+def get_block_size_histogram(blocks: Blocks, bins: list = None) -> pd.DataFrame:
+    """Count of blocks by size range, with the pairs each range creates.
+
+    Usage::
+        >>> get_block_size_histogram(blocks['title'])
+            size        blocks      pairs
+            1            98712          0
+            2             4980       4980
+            3-5           1532       5401
+            ...
+    """
+    bins = bins or _block_size_bins
+    sizes = Blocks.from_dict(blocks).sizes
+    edges = list(bins) + [max(int(sizes.max()) + 1 if sizes.shape[0] else 0, bins[-1] + 1)]
+    labels = [
+        str(low) if high - low == 1 else f'{low}-{high - 1}'
+        for low, high in zip(edges[:-2], edges[1:-1])
+        ] + [f'{edges[-2]}+']
+    ranges = pd.cut(sizes, edges, right=False, labels=labels)
+    histogram = pd.DataFrame({'size': ranges, 'blocks': 1, 'pairs': sizes * (sizes - 1) // 2})
+    return histogram.groupby('size', observed=False)[['blocks', 'pairs']].sum()
+
+
+def get_largest_blocks(blocks: Blocks, top_n: int = 10) -> pd.DataFrame:
+    """The `top_n` largest blocks, with their key, size and pairs created.
+
+    Usage::
+        >>> get_largest_blocks(blocks['title'], 3)
+                    key  size   pairs
+            0  untitled   412   84666
+            ...
+    """
+    blocks = Blocks.from_dict(blocks)
+    sizes = blocks.sizes
+    largest = np.argsort(-sizes, kind='stable')[:top_n]
+    return pd.DataFrame({
+        'key': blocks.keys_array[largest],
+        'size': sizes[largest],
+        'pairs': sizes[largest] * (sizes[largest] - 1) // 2,
+        })
+
+
+def estimate_scoring_time(
+        df: pd.DataFrame, field_config: dict, pairs: np.ndarray,
+        pair_count: int = None, sample_pairs: int = _default_sample_pairs, seed: int = 0
+        ) -> float:
+    """Seconds to score `pair_count` pairs (default all `pairs`) with every
+    scored field, extrapolated from timing a random sample of `sample_pairs`.
+
+    Usage::
+        >>> estimate_scoring_time(df, field_config, pairs)
+            12.4
+    """
+    pair_count = pairs.shape[0] if pair_count is None else pair_count
+    if pairs.shape[0] == 0 or pair_count == 0:
+        return 0.0
+    rng = np.random.default_rng(seed)
+    sample = pairs[rng.choice(pairs.shape[0], min(sample_pairs, pairs.shape[0]), replace=False)]
+    start = time.perf_counter()
+    for field, sim_type in field_config['scoring'].items():
+        score_pairs(prepare_field_values(df[field], sim_type), sample, sim_type)
+    elapsed = time.perf_counter() - start
+    return elapsed / sample.shape[0] * pair_count
+
+
+def blocking_report(
+        df: pd.DataFrame, field_config: dict, truth: str = None,
+        top_n: int = 10, sample_pairs: int = _default_sample_pairs
+        ) -> dict:
+    """Quality and cost of the blocking of a `field_config` on `df`.
+
+    The candidate pairs are those every field is scored on.  With a `truth`
+    column of ground-truth ids, the pair completeness and quality are given.
+    Block operations also give the block size histogram and largest blocks
+    of each blocking field, before processing.
+
+    Usage::
+        >>> report = blocking_report(df, field_config, truth='CID')
+        >>> print(format_report(report))
+            blocking: {'operation': 'standard', 'process': 'purge'}
+            candidate pairs: 64,021 of 8,121,746,475
+            reduction ratio: 0.999992
+            pair completeness: 0.4123
+            ...
+    """
+    df = df.reset_index(drop=True)
+    n_records = df.shape[0]
+    Matcher = EntityMatcher(field_config)
+    true_keys = get_true_pair_keys(df[truth]) if truth else None
+
+    if field_config['blocking'] == {} and not Matcher.is_sparse_cosine_applicable(field_config):
+        #every pair is a candidate, so they are not created
+        metrics = get_pair_metrics(np.empty(0, dtype=np.int64), n_records)
+        metrics['candidate_pairs'] = metrics['total_pairs']
+        metrics['reduction_ratio'] = 0.0
+        if true_keys is not None:
+            metrics['pair_completeness'] = 1.0
+            metrics['pair_quality'] = true_keys.shape[0] / metrics['total_pairs'] if metrics['total_pairs'] else 0.0
+        positions = np.random.default_rng(0).integers(0, metrics['total_pairs'], min(sample_pairs, metrics['total_pairs']))
+        sample = np.column_stack(triangle_index_to_pairs(positions))
+        scoring_time = estimate_scoring_time(df, field_config, sample, metrics['total_pairs'], sample_pairs)
+    else:
+        pair_dict = Matcher.create_pairs_from_blocking_approach(df, field_config)
+        pair_keys = np.unique(np.concatenate(
+            [unique_pair_keys(pairs, n_records) for pairs in pair_dict.values()]
+            ))
+        metrics = get_pair_metrics(pair_keys, n_records, true_keys)
+        scoring_time = estimate_scoring_time(df, field_config, keys_to_pairs(pair_keys, n_records), sample_pairs=sample_pairs)
+
+    block_sizes, largest_blocks = {}, {}
+    if field_config['blocking'].get('operation') in ['standard', 'token', 'lsh']:
+        for field, blocks in Matcher.create_blocks(df, field_config).items():
+            block_sizes[field] = get_block_size_histogram(blocks)
+            largest_blocks[field] = get_largest_blocks(blocks, top_n)
+
+    return {
+        'blocking': field_config['blocking'],
+        'records': n_records,
+        **metrics,
+        'block_sizes': block_sizes,
+        'largest_blocks': largest_blocks,
+        'estimated_scoring_seconds': scoring_time,
+    }
+
+
+def get_blocking_combinations(fields: list = None) -> list[dict]:
+    """Every blocking operation and process combination of `EntityMatcher`,
+    with shared blocking `fields` if given.  Operations that create pairs
+    directly are not combined with a process."""
+    combinations = []
+    for operation in EntityMatcher._available_blocking_operations:
+        if operation in ['sorted_neighborhood', 'knn']:
+            combinations.append({'operation': operation})
+        else:
+            for process in EntityMatcher._available_blocking_processes:
+                combinations.append({'operation': operation, 'process': process})
+    if fields:
+        combinations = [{**blocking, 'fields': fields} for blocking in combinations]
+    return combinations
+
+
+def compare_blocking_approaches(
+        df: pd.DataFrame, field_config: dict, truth: str = None,
+        blockings: list[dict] = None, fields: list = None, sample_pairs: int = _default_sample_pairs
+        ) -> pd.DataFrame:
+    """Report of every blocking approach, from `get_blocking_combinations()`
+    unless `blockings` are given, with the scoring of `field_config`.  One
+    row per blocking, with the pair metrics, estimated scoring time and the
+    seconds taken by its report.
+
+    Usage::
+        >>> compare_blocking_approaches(df, field_config, truth='CID', fields=['title', 'artist'])
+                operation process  candidate_pairs  reduction_ratio  pair_completeness  ...
+            0    standard   purge            64021         0.999992             0.4123  ...
+            ...
+    """
+    blockings = blockings if blockings is not None else get_blocking_combinations(fields)
+    rows = []
+    for blocking in blockings:
+        config = {**field_config, 'blocking': blocking}
+        start = time.perf_counter()
+        report = blocking_report(df, config, truth=truth, sample_pairs=sample_pairs)
+        rows.append({
+            'operation': blocking.get('operation', 'none'),
+            'process': blocking.get('process'),
+            'candidate_pairs': report['candidate_pairs'],
+            'reduction_ratio': report['reduction_ratio'],
+            'pair_completeness': report['pair_completeness'],
+            'pair_quality': report['pair_quality'],
+            'estimated_scoring_seconds': report['estimated_scoring_seconds'],
+            'report_seconds': time.perf_counter() - start,
+            })
+    return pd.DataFrame(rows)
+
+
+def format_report(report: dict) -> str:
+    """Readable report from `blocking_report()`."""
+    lines = [
+        f"blocking: {report['blocking'] if report['blocking'] else 'none'}",
+        f"candidate pairs: {report['candidate_pairs']:,} of {report['total_pairs']:,}",
+        f"reduction ratio: {report['reduction_ratio']:.6f}",
+    ]
+    if report['pair_completeness'] is not None:
+        lines.append(f"pair completeness: {report['pair_completeness']:.4f}")
+        lines.append(f"pair quality: {report['pair_quality']:.6f}")
+    lines.append(f"estimated scoring time: {report['estimated_scoring_seconds']:,.1f} s")
+    for field, histogram in report['block_sizes'].items():
+        lines.append(f"block sizes of {field}:")
+        lines.append(histogram.to_string())
+        lines.append(f"largest blocks of {field}:")
+        lines.append(report['largest_blocks'][field].to_string(index=False))
+    return "\n".join(lines)
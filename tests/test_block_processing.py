@@ -15,8 +15,13 @@ from entity_matcher.blocking import (
     )
 from entity_matcher.block_processing import (
     purge_blocks,
+    filter_blocks,
+    get_purging_threshold,
+    get_block_cardinalities,
 
     meta_blocks,
+    get_edge_weights,
+    prune_edge_weights,
     get_pairs_from_blocks,
     get_adjacency_matrix_from_pairs,
     prune_edges,
@@ -25,11 +30,15 @@ from entity_matcher.block_processing import (
     get_union_of_adj_matrices,
     union_of_blocks,
 
-    run_all_blocking_approaches
+    run_all_blocking_approaches,
+
+    blocks_to_csr,
+    expand_blocks
     )
 from tests.setup import prepare_dataset
 
 import pandas as pd
+import numpy as np
 
 
 #setup
@@ -54,6 +63,44 @@ def test_block_purging():
     assert len(token_blocks2) == 44418
 
 
+def test_adaptive_purge_blocks():
+    blocks = {'a': [0, 3], 'b': [1, 2, 4], 'c': [5, 6, 7, 8], 'd': [9]}
+    assert get_block_cardinalities(blocks).tolist() == [1, 3, 6, 0]
+    assert get_purging_threshold(np.array([2, 3, 4, 1]), comparison_budget=5) == 4
+    assert get_purging_threshold(np.array([2, 3, 4, 1]), comparison_budget=0) == 2
+    purged = purge_blocks(blocks, comparison_budget=5)
+    assert list(purged.keys()) == ['a', 'b']
+    assert list(purge_blocks(blocks, purging_threshold=3, comparison_budget=5).keys()) == ['a']
+
+
+def test_filter_blocks():
+    blocks = {'a': [0, 1], 'b': [0, 1, 2], 'c': [0, 2]}
+    filtered = filter_blocks(blocks, filter_ratio=0.5)
+    assert filtered['a'].tolist() == [0, 1]
+    assert filtered['b'].tolist() == []
+    assert filtered['c'].tolist() == [0, 2]
+    assert dict(filter_blocks(blocks, filter_ratio=1.0)).keys() == blocks.keys()
+    assert filter_blocks(blocks, filter_ratio=1.0).members.shape[0] == 7
+
+
+def test_expand_blocks():
+    columns = ['title','artist','album']
+    samp_df = pp_df.sample(frac=.10, random_state=1).reset_index(drop=True)
+    token_blocks = purge_blocks(token_blocking(samp_df[columns], stop_words_for_token_blocks), 500)
+
+    expected = set(
+        (max(pair), min(pair)) for pair in get_pairs_from_blocks(token_blocks) if pair[0] != pair[1]
+        )
+    pairs = expand_blocks(token_blocks, mode='all')
+    assert pairs.dtype == np.int32
+    assert set(map(tuple, pairs)) == expected
+    assert pairs.shape[0] == len(expected)
+
+    offsets, members = blocks_to_csr(token_blocks)
+    star_pairs = expand_blocks((offsets, members), mode='star', deduplicate=False)
+    assert star_pairs.shape[0] == (np.diff(offsets) - 1).sum()
+
+
 def test_meta_blocking_components():
     columns = ['title','artist','album']
     samp_df = pp_df.sample(frac=.10, random_state=1)
@@ -80,6 +127,24 @@ def test_meta_blocking():
     assert pairs.shape == (169388, 2)
 
 
+def test_meta_blocking_weights():
+    blocks = {'a': [0, 1, 2], 'b': [0, 1], 'c': [1, 3], 'd': [0, 2, 3]}
+    lower = np.tril_indices(4, -1)
+    cbs = get_edge_weights(blocks, 4, 'CBS').toarray()[lower]
+    assert cbs.tolist() == [2, 2, 1, 1, 1, 1]
+    js = get_edge_weights(blocks, 4, 'JS').toarray()[lower]
+    assert np.allclose(js, [2/4, 2/3, 1/4, 1/4, 1/4, 1/3])
+    arcs = get_edge_weights(blocks, 4, 'ARCS').toarray()[lower]
+    assert np.allclose(arcs, [4/3, 2/3, 1/3, 1/3, 1, 1/3])
+
+    #legacy threshold of common blocks
+    pairs = meta_blocks(np.arange(4), blocks)
+    assert pairs.tolist() == [[1, 0], [2, 0]]
+    #each record keeps its strongest edge
+    pruned = prune_edge_weights(get_edge_weights(blocks, 4, 'ARCS'), 'CNP', n_neighbors=1)
+    assert sorted(zip(*pruned.nonzero())) == [(1, 0), (2, 0), (3, 1)]
+
+
 def test_union_of_blocks_components():
     samp_df = pp_df.sample(frac=.10, random_state=1)
     sb_title = standard_blocking(samp_df.title)
@@ -11,10 +11,16 @@ from entity_matcher.blocking import (
     standard_blocking,
     stop_words_for_token_blocks, 
     token_blocking, 
-    sorted_neighborhood
+    sorted_neighborhood,
+    lsh_blocking,
+    knn_blocking,
+    Blocks
     )
 from tests.setup import prepare_dataset
 
+import pandas as pd
+import numpy as np
+
 
 
 pp_df = prepare_dataset(preprocess=True)
@@ -27,13 +33,95 @@ def test_standard_blocking():
     assert len(sb_title) == 115258 and len(sb_artist) == 40613 and len(sb_album) == 69404
 
 
+def test_blocks():
+    sb_title = standard_blocking(pp_df.title)
+    assert isinstance(sb_title, Blocks)
+    assert sb_title.members.dtype == np.int32 and sb_title.offsets.dtype == np.int64
+    assert sb_title.sizes.sum() == pp_df.shape[0]
+
+    key = list(sb_title.keys())[5]
+    assert list(sb_title[key]) == list(np.flatnonzero(pp_df.title.to_numpy() == key))
+
+    large = sb_title.select(sb_title.sizes > 1)
+    assert len(large) == (sb_title.sizes > 1).sum()
+    assert list(large[key]) == list(sb_title[key]) or key not in large
+
+
 def test_token_blocking():
     columns = ['title','artist','album']
     token_blocks = token_blocking(pp_df[columns], stop_words_for_token_blocks)
-    assert len(token_blocks) == 202201
+    #preprocessed values are lowercase words and digits separated by single spaces, so
+    #there is one block per distinct space-separated word that is not a stop word
+    words = {word for value in pp_df[columns].stack() for word in value.split()}
+    assert len(token_blocks) == len(words - stop_words_for_token_blocks)
+
+
+def test_token_blocking_words():
+    df = pd.DataFrame({
+        'title': ['gonna fly now', 'cannot stop 1999', None, 'wanna be 1999'],
+        'artist': ['conti', 'gonna', 'x', 'spice']
+        })
+    token_blocks = token_blocking(df, stop_words_for_token_blocks)
+    #words are not split like contractions, and the row index is not a token
+    assert token_blocks.keys_array.tolist() == ['gonna', 'fly', 'conti', 'stop', '1999', 'x', 'wanna', 'spice']
+    assert token_blocks['gonna'].tolist() == [0, 1]
+    assert token_blocks['1999'].tolist() == [1, 3]
+
+
+def test_token_blocking_entries():
+    df = pd.DataFrame({'title': ['the blue sky', 'blue moon', None], 'artist': ['sky', 'moon', 'blue']})
+    token_blocks = token_blocking(df)
+    assert list(token_blocks.keys()) == ['blue', 'sky', 'moon']
+    assert token_blocks['blue'].tolist() == [0, 1, 2]
+    assert token_blocks['sky'].tolist() == [0]
+    assert len(token_blocking(df.title)) == 3
+    chunked = token_blocking(df, n_jobs=2, chunk_size=1)
+    assert all((chunked[key] == token_blocks[key]).all() for key in token_blocks)
+
+
+def test_token_blocking_csr():
+    df = pd.DataFrame({'title': ['The blue sky!', 'blue moon', None, 'a'], 'artist': ['sky', 'moon, blue', 'blue', 'x-ray']})
+    token_blocks = token_blocking(df)
+    #keys in order of first use, each row once per block, punctuation and stop words dropped
+    assert token_blocks.keys_array.tolist() == ['The', 'blue', 'sky', 'moon', 'x', 'ray']
+    assert token_blocks.offsets.tolist() == [0, 1, 4, 5, 6, 7, 8]
+    assert token_blocks.members.tolist() == [0, 0, 1, 2, 0, 1, 3, 3]
+    assert token_blocks.members.dtype == np.int32
 
 
 def test_sorted_neighborhood():
     columns = ['title','artist','album']
     sn_pairs = sorted_neighborhood(pp_df, columns)
-    assert len(sn_pairs) == 382296
\ No newline at end of file
+    assert len(sn_pairs) == 382296
+
+def test_sorted_neighborhood_multi_pass():
+    df = pd.DataFrame({'title': ['c', 'a', 'd', 'b', None], 'artist': ['x', 'y', 'x', 'y', 'z']})
+    sn_pairs = sorted_neighborhood(df, ['title'], window_size=1)
+    assert sn_pairs.tolist() == [[2, 0], [3, 0], [3, 1]]
+    assert sn_pairs.dtype == np.int32
+
+    sn_pairs = sorted_neighborhood(df, ['title', 'artist'], window_size=1, multi_pass=True)
+    assert sn_pairs.tolist() == [[2, 0], [2, 1], [3, 0], [3, 1], [4, 3]]
+
+
+def test_lsh_blocking():
+    titles = pd.Series(['midnight train', 'midnight trains', 'blue skies above', 'blue skies abov', 'xy', None])
+    lsh_blocks = lsh_blocking(titles, bands=20, rows=2)
+    blocked_together = set(
+        tuple(indices) for indices in lsh_blocks.values() if len(indices) > 1
+        )
+    assert (0, 1) in blocked_together and (2, 3) in blocked_together
+    #records without 3-grams are not blocked
+    assert not set(lsh_blocks.members) & {4, 5}
+    assert len(lsh_blocks) == len(lsh_blocking(titles, bands=20, rows=2))
+
+
+def test_knn_blocking():
+    titles = pd.Series(['midnight train', 'blue skies above', 'midnight trains', 'blue skies abov', None])
+    knn_pairs = knn_blocking(titles, n_neighbors=1, cutoff=0.5)
+    assert knn_pairs.tolist() == [[2, 0], [3, 1]]
+    assert knn_pairs.dtype == np.int32
+    knn_pairs = knn_blocking(titles, n_neighbors=1, n_components=2)
+    assert knn_pairs.tolist() == [[2, 0], [3, 1]]
+    knn_pairs = knn_blocking(titles, n_neighbors=1, cutoff=0.5, vector_type='embedding')
+    assert knn_pairs.tolist() == [[2, 0], [3, 1]]
@@ -0,0 +1,43 @@
+"""
+Test Clustering
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.clustering import (
+    get_connected_components,
+    get_canonical_records
+    )
+import entity_matcher as em
+
+import pandas as pd
+import numpy as np
+
+
+
+def test_get_connected_components():
+    pairs = np.array([[1, 0], [2, 1], [4, 3]])
+    labels = get_connected_components(pairs, n_records=6)
+    assert labels[0] == labels[1] == labels[2]
+    assert labels[3] == labels[4] != labels[0]
+    assert len(set(labels)) == 3
+
+    assert list(get_canonical_records(labels, canonical='min')) == [0, 0, 0, 3, 3, 5]
+    assert list(get_canonical_records(labels, canonical='max')) == [2, 2, 2, 4, 4, 5]
+
+
+def test_match_pairs_to_columns():
+    df = pd.DataFrame({'title': list('abcdef'), 'CID': [10, 11, 12, 13, 14, 15]})
+    matches = pd.DataFrame([[1, 0], [2, 1], [4, 3]])
+    field_config = {'blocking': {}, 'scoring': {'title': 'fuzzy'}}
+
+    Matcher = em.EntityMatcher(field_config)
+    groups = Matcher.match_pairs_to_columns(df, matches)
+    assert list(groups) == [0, 0, 0, 3, 3, '']
+    assert list(df.columns) == ['title', 'CID']
+
+    groups = Matcher.match_pairs_to_columns(df, matches, canonical='CID')
+    assert list(groups) == [10, 10, 10, 13, 13, '']
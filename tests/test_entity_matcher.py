@@ -8,6 +8,7 @@ __license__ = "MIT"
 
 
 import entity_matcher as em
+from entity_matcher import planning
 
 from tests.setup import prepare_dataset
 
@@ -39,6 +40,68 @@ def test_get_matches_single_field_no_blocking():
     assert matched.shape == (6,2)
 
 
+def test_get_matches_single_field_no_blocking_chunked():
+    samp_df = pp_df.iloc[indices].reset_index()
+    field_config = em.field_config
+    field_config.clear()
+    field_config['blocking'] = {}
+    field_config['scoring'] = {}
+    field_config['scoring']['title'] = 'fuzzy'
+
+    Matcher = em.EntityMatcher(field_config)
+    samp_df['Proposed Matches'] = Matcher.get_matches(samp_df, chunk_pairs=100)
+    matched = samp_df[['title','Proposed Matches']][samp_df['Proposed Matches']!=''].sort_values('Proposed Matches')
+    print(matched)
+
+    assert matched.shape == (6,2)
+
+
+def test_plan_memory():
+    samp_df = pp_df.iloc[indices].reset_index()
+    field_config = em.field_config
+    field_config.clear()
+    field_config['blocking'] = {}
+    field_config['scoring'] = {}
+    field_config['scoring']['title'] = 'fuzzy'
+
+    Matcher = em.EntityMatcher(field_config)
+    plan = Matcher.plan_memory(samp_df)
+    assert plan['blocking'] == {} and plan['chunk_pairs'] is None
+    #fuzzy fields without blocking take their candidates from the sparse cosine engine
+    assert plan['pair_count']['title'] == samp_df.shape[0] * planning._sparse_candidates_per_record
+
+    field_config['scoring']['title'] = 'levenshtein'
+    plan = em.EntityMatcher(field_config).plan_memory(samp_df)
+    assert plan['pair_count']['title'] == samp_df.shape[0] * (samp_df.shape[0] - 1) // 2
+    field_config['scoring']['title'] = 'fuzzy'
+
+    Matcher = em.EntityMatcher(field_config, memory_limit=1)
+    plan = Matcher.plan_memory(samp_df)
+    assert plan['blocking'] == Matcher._default_blocking
+    assert plan['chunk_pairs'] > 0
+
+    #token blocks are built once, by the plan, and reused by the run
+    field_config['blocking'] = {'operation': 'token', 'process': 'purge'}
+    Matcher = em.EntityMatcher(field_config)
+    plan = Matcher.plan_memory(samp_df)
+    assert list(plan['blocks']) == ['title']
+    assert (plan['blocks']['title'].sizes == Matcher.create_blocks(samp_df, field_config)['title'].sizes).all()
+    pairs = Matcher.create_pairs_from_blocking_approach(samp_df, field_config, blocks=plan['blocks'])
+    expected = Matcher.create_pairs_from_blocking_approach(samp_df, field_config)
+    assert (pairs['title'] == expected['title']).all()
+
+    #lsh blocks of the plan use the matcher's band defaults
+    class LshMatcher(em.EntityMatcher):
+        _default_lsh_bands = 10
+        _default_lsh_rows = 2
+    field_config['blocking'] = {'operation': 'lsh', 'process': 'purge'}
+    Matcher = LshMatcher(field_config)
+    plan = Matcher.plan_memory(samp_df)
+    expected = Matcher.create_blocks(samp_df, field_config)['title']
+    assert plan['blocks']['title'].keys_array.tolist() == expected.keys_array.tolist()
+    assert plan['blocks']['title'].members.tolist() == expected.members.tolist()
+
+
 def test_get_matches_single_field_with_blocking():
     samp_df = pp_df.iloc[indices].reset_index()
     field_config = em.field_config
@@ -72,6 +135,47 @@ def test_get_matches_multiple_fields_with_blocking():
 
     assert matched.shape == (4,4)
 
+def test_get_matches_multiple_fields_with_shared_blocking():
+    samp_df = pp_df.sample(frac=.10, random_state=1).reset_index()
+    field_config = em.field_config
+    field_config.clear()
+    field_config['blocking'] = {"operation": "standard", "process": "purge", "fields": ["artist", "album"]} 
+    field_config['scoring'] = {}
+    field_config['scoring']['title'] = 'fuzzy'
+    field_config['scoring']['artist'] = 'fuzzy'
+    field_config['scoring']['album'] = 'fuzzy'
+
+    Matcher = em.EntityMatcher(field_config)
+    pair_dict = Matcher.create_pairs_from_blocking_approach(samp_df, field_config)
+    assert list(pair_dict.keys()) == [Matcher._default_combined_pair_name]
+
+    matches = Matcher.get_field_similarity_scores_from_pairs(samp_df, pair_dict, field_config, Matcher._threshold)
+    assert matches.shape[0] > 0
+    assert matches[['title','artist','album']].notna().all().all()
+
+
+def test_get_matches_weighted_cascade():
+    samp_df = pp_df.sample(frac=.10, random_state=1).reset_index()
+    field_config = em.field_config
+    field_config.clear()
+    field_config['blocking'] = {"operation": "standard", "process": "purge", "fields": ["artist", "album"]} 
+    field_config['scoring'] = {}
+    field_config['scoring']['title'] = 'levenshtein'
+    field_config['scoring']['artist'] = 'fuzzy'
+    field_config['scoring']['album'] = 'fuzzy'
+    field_config['weights'] = {'title': 2}
+
+    Matcher = em.EntityMatcher(field_config)
+    pair_dict = Matcher.create_pairs_from_blocking_approach(samp_df, field_config)
+    expected = Matcher.get_field_similarity_scores_from_pairs(samp_df, pair_dict, field_config, Matcher._threshold)
+
+    field_config['cascade'] = True
+    assert Matcher.get_scoring_order(field_config) == ['artist', 'album', 'title']
+    matches = Matcher.get_field_similarity_scores_from_pairs(samp_df, pair_dict, field_config, Matcher._threshold)
+    assert matches[[0,1]].equals(expected[[0,1]])
+    assert matches['scores'].equals(expected['scores'])
+
+
 #NOTE: this test requires a long runtime
 def test_get_matches_multiple_fields_with_blocking_ALL_DATA():
     start = time.time()
@@ -92,6 +196,10 @@ def test_get_matches_multiple_fields_with_blocking_ALL_DATA():
     counts = matched['Proposed Matches'].value_counts()
     duration = time.time() - start
 
+    #connected components: each cluster has two records or more, and is named by its lowest record
+    groups = matched.groupby('Proposed Matches')
+    assert (groups.size() > 1).all()
+    assert (groups.apply(lambda group: group.index.min()) == groups.size().index).all()
     assert matched.shape == (97835, 4)
     assert list(counts[:3]) == [440, 285, 266]
     assert duration < 7 * 60           #routine takes less than 7min
@@ -151,6 +259,10 @@ def test_get_levenshtein_matches_multiple_fields_with_blocking_ALL_DATA():
     counts = matched['Proposed Matches'].value_counts()
     duration = time.time() - start
 
+    #connected components: each cluster has two records or more, and is named by its lowest record
+    groups = matched.groupby('Proposed Matches')
+    assert (groups.size() > 1).all()
+    assert (groups.apply(lambda group: group.index.min()) == groups.size().index).all()
     assert matched.shape == (98228, 4)
     #assert list(counts[:3]) == [440, 285, 266]
     assert duration < 20 * 60           #routine takes less than 20min
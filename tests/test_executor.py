@@ -0,0 +1,43 @@
+"""
+Test Executor
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.executor import (
+    ScoringExecutor,
+    get_chunk_bounds
+)
+from entity_matcher.pairs import create_index_pairs
+
+import pandas as pd
+import numpy as np
+
+
+field_values = {
+    'title': pd.Series(['blue moon', 'blue moon', 'blue mon', 'red sky', 'red skies', '']),
+    'number': pd.Series([1, 1, 2, 3, 3, None]),
+    'artist': pd.Series(['sinatra', 'sinatra', 'sinatr', 'adele', 'adel', '']),
+    }
+pairs = create_index_pairs(6)
+
+
+def test_get_chunk_bounds():
+    assert get_chunk_bounds(5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert get_chunk_bounds(0, 2) == []
+
+
+def test_scoring_executor():
+    field_pairs = {'title': ('fuzzy', pairs), 'number': ('exact', pairs[:7]), 'artist': ('levenshtein', pairs)}
+    with ScoringExecutor(field_values) as executor:
+        expected = executor.score(field_pairs)
+    assert expected['title'].shape == (15,) and expected['number'].shape == (7,)
+
+    for backend in ['process', 'thread']:
+        with ScoringExecutor(field_values, n_jobs=2, chunk_size=4, backend=backend) as executor:
+            scores = executor.score(field_pairs)
+        for field in field_pairs:
+            assert np.allclose(scores[field], expected[field])
@@ -0,0 +1,69 @@
+"""
+Test Linking
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.linking import LinkIndex
+import entity_matcher as em
+
+import pandas as pd
+import numpy as np
+import pytest
+
+
+right_df = pd.DataFrame({
+    'title': ['blue moon', 'red sky', 'green grass', None],
+    'artist': ['sinatra', 'adele', 'adele', 'prince'],
+    }, index=[10, 11, 12, 13])
+left_df = pd.DataFrame({
+    'title': ['red skies', 'blue moon', 'purple rain'],
+    'artist': ['adele', 'sinatra', 'prince'],
+    }, index=[100, 101, 102])
+
+
+def test_link_index_candidate_pairs():
+    index = LinkIndex(right_df, ['artist'], operation='standard')
+    pairs = index.candidate_pairs(left_df)
+    assert pairs.tolist() == [[0, 1], [0, 2], [1, 0], [2, 3]]
+    #the index is reused for a batch of left records
+    assert index.candidate_pairs(left_df.iloc[1:]).tolist() == [[0, 0], [1, 3]]
+
+    index = LinkIndex(right_df, ['title'], operation='token')
+    assert index.candidate_pairs(left_df).tolist() == [[0, 1], [1, 0]]
+
+    index = LinkIndex(right_df, ['title'])
+    assert index.candidate_pairs(left_df).shape == (12, 2)
+
+
+def test_link():
+    field_config = {
+        'blocking': {'operation': 'standard', 'process': 'purge', 'fields': ['artist']},
+        'scoring': {'title': 'fuzzy', 'artist': 'exact'}
+        }
+    Matcher = em.EntityMatcher(field_config)
+    matches = Matcher.link(left_df, right_df)
+    assert list(matches.columns) == ['left_idx', 'right_idx', 'title', 'artist', 'scores']
+    assert list(zip(matches['left_idx'], matches['right_idx'])) == [(100, 11), (101, 10)]
+    assert np.isclose(matches['scores'].iloc[1], 1.0)
+
+    index = Matcher.create_link_index(right_df)
+    batched = Matcher.link(left_df, right_df, index=index, batch_size=1)
+    pd.testing.assert_frame_equal(batched, matches)
+
+
+def test_create_link_index_rejects_unsupported_options():
+    blocking = {'operation': 'token', 'process': 'purge', 'fields': ['title']}
+    for options in [
+            {'process': 'meta'},
+            {'comparison_budget': 100},
+            {'filter_ratio': 0.5},
+            {'operation': 'knn', 'vectors': 'embedding'},
+            ]:
+        field_config = {'blocking': {**blocking, **options}, 'scoring': {'title': 'fuzzy'}}
+        Matcher = em.EntityMatcher(field_config)
+        with pytest.raises(TypeError):
+            Matcher.create_link_index(right_df)
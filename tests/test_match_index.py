@@ -0,0 +1,144 @@
+"""
+Test Match Index
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.match_index import MatchIndex
+
+import pandas as pd
+import numpy as np
+
+import pytest
+
+
+field_config = {
+    'blocking': {'operation': 'token', 'process': 'purge', 'fields': ['title']},
+    'scoring': {'title': 'fuzzy', 'artist': 'exact'}
+    }
+master_df = pd.DataFrame({
+    'title': ['blue moon', 'red sky', 'blue moon', 'green grass'],
+    'artist': ['sinatra', 'adele', 'sinatra', 'prince'],
+    }, index=[10, 11, 12, 13])
+new_df = pd.DataFrame({
+    'title': ['red sky', 'purple rain', 'purple rain', 'blue moons'],
+    'artist': ['adele', 'prince', 'prince', 'sinatra'],
+    }, index=[20, 21, 22, 23])
+
+
+def test_match_index_add():
+    index = MatchIndex.from_frame(master_df, field_config)
+    assert index.clusters.tolist() == [0, '', 0, '']
+    vocabulary_size = len(index.vocabularies['title'])
+
+    matches = index.add(new_df)
+    #only new x existing and new x new pairs are scored
+    assert (matches[0] >= master_df.shape[0]).all()
+    assert index.clusters.tolist() == [0, 1, 0, '', 1, 5, 5, 0]
+    assert list(index.clusters.index) == [10, 11, 12, 13, 20, 21, 22, 23]
+    assert len(index.vocabularies['title']) > vocabulary_size
+    #the second segment is as large as the first, so they are merged
+    assert index.bounds.tolist() == [0, 8]
+    assert index.vectors['title'][0].shape == (8, len(index.vocabularies['title']))
+
+    #adding in batches gives the clusters of adding at once
+    combined = MatchIndex.from_frame(pd.concat([master_df, new_df]), field_config)
+    pd.testing.assert_series_equal(combined.clusters, index.clusters)
+
+
+def test_match_index_query():
+    index = MatchIndex.from_frame(master_df, field_config)
+    result = index.query({'title': 'blue moon', 'artist': 'sinatra'})
+    assert result['label'].tolist() == [10, 12]
+    assert np.allclose(result['scores'], 1.0)
+    #unseen 3-grams count toward the similarity, without changing the index
+    result = index.query({'title': 'blue moonlight', 'artist': 'sinatra'})
+    assert (result['title'] < 1.0).all()
+    assert index.n_records == 4
+    assert index.query({'title': 'yellow', 'artist': 'sinatra'}).empty
+
+
+def test_match_index_save_load(tmp_path):
+    index = MatchIndex.from_frame(master_df, field_config)
+    index.save(str(tmp_path))
+    loaded = MatchIndex.load(str(tmp_path))
+    assert not loaded.vectors['title'][0].data.flags.writeable
+    pd.testing.assert_series_equal(loaded.clusters, index.clusters)
+    record = {'title': 'blue moon', 'artist': 'sinatra'}
+    pd.testing.assert_frame_equal(loaded.query(record), index.query(record))
+    #the loaded index grows like the original
+    loaded.add(new_df)
+    index.add(new_df)
+    pd.testing.assert_series_equal(loaded.clusters, index.clusters)
+
+
+def test_match_index_match_many():
+    index = MatchIndex.from_frame(master_df, field_config)
+    result = index.match_many(new_df)
+    assert list(result.columns) == ['query', 'record', 'label', 'title', 'artist', 'scores']
+    assert list(zip(result['query'], result['label'])) == [(0, 11), (3, 10), (3, 12)]
+    assert index.match_many(new_df, top_k=1)['query'].tolist() == [0, 3]
+    pd.testing.assert_frame_equal(
+        index.match_one(new_df.iloc[3]),
+        result[result['query'] == 3].drop(columns='query').reset_index(drop=True)
+        )
+
+    #without blocking, candidates share a 3-gram of a fuzzy field
+    index = MatchIndex.from_frame(master_df, {**field_config, 'blocking': {}})
+    assert index.is_ngram_probe_complete
+    assert index.match_many(new_df)['label'].tolist() == [11, 10, 12]
+
+    #probes are preprocessed like the indexed records
+    index = MatchIndex.from_frame(master_df, field_config, preprocess_columns=['title'])
+    assert index.match_one({'title': 'Blue  Moon!', 'artist': 'sinatra'})['label'].tolist() == [10, 12]
+
+
+def test_match_index_segments():
+    records = pd.concat([master_df, new_df])
+    index = MatchIndex.from_frame(records.iloc[:4], field_config)
+    for position in range(4, 7):
+        index.add(records.iloc[position:position + 1])
+    #small additions stay in their own segments until they are merged
+    assert index.bounds.tolist() == [0, 4, 6, 7]
+    assert index.query({'title': 'purple rain', 'artist': 'prince'})['label'].tolist() == [21, 22]
+    index.add(records.iloc[7:])
+    assert index.bounds.tolist() == [0, 8]
+    assert index.clusters.tolist() == [0, 1, 0, '', 1, 5, 5, 0]
+
+    #without blocking, new records are compared through the 3-gram inverted index
+    index = MatchIndex.from_frame(master_df, {**field_config, 'blocking': {}})
+    matches = index.add(new_df)
+    assert list(zip(matches[0], matches[1])) == [(4, 1), (6, 5), (7, 0), (7, 2)]
+    assert index.clusters.tolist() == [0, 1, 0, '', 1, 5, 5, 0]
+
+
+def test_match_index_purged_blocks():
+    purge_config = {
+        'blocking': {'operation': 'standard', 'process': 'purge', 'fields': ['artist'], 'purging_threshold': 3},
+        'scoring': {'title': 'fuzzy', 'artist': 'exact'}
+        }
+    batch_df = pd.DataFrame({'title': ['purple rain', 'purple rain'], 'artist': ['prince', 'prince']})
+    #the batch takes the block to the purging threshold, so no pair of it is scored
+    index = MatchIndex.from_frame(master_df, purge_config)
+    assert index.add(batch_df).empty
+    assert index.clusters.tolist() == [0, '', 0, '', '', '']
+    combined = MatchIndex.from_frame(pd.concat([master_df, batch_df], ignore_index=True), purge_config)
+    assert combined.clusters.tolist() == index.clusters.tolist()
+    #the block is purged, so later batches are not paired in it either
+    assert index.add(batch_df).empty
+    assert 'prince' in index.purged['artist']
+    assert index.clusters.tolist()[6:] == ['', '']
+
+
+def test_match_index_rejects_unsupported_options():
+    for options in [
+            {'process': 'meta'},
+            {'expansion': 'star'},
+            {'comparison_budget': 100},
+            {'filter_ratio': 0.5},
+            ]:
+        with pytest.raises(TypeError):
+            MatchIndex({**field_config, 'blocking': {**field_config['blocking'], **options}})
@@ -19,9 +19,14 @@ from entity_matcher.block_processing import (
     get_union_of_adj_matrices, 
     get_pairs_from_adj_matrix
     )
+from entity_matcher.matching import cosine, levenshtein, embedding, exact
+from entity_matcher.pairs import create_index_pairs
 import entity_matcher as em
 from tests.setup import prepare_dataset
 
+import pandas as pd
+import numpy as np
+
 from memory_profiler import memory_usage
 from time import sleep
 
@@ -80,4 +85,113 @@ def test_matching_process():
     mem_usage = memory_usage(run_matching_process)
     print('Memory usage (in chunks of .1 seconds): %s' % mem_usage)
     print('Maximum memory usage: %s' % max(mem_usage))
-    assert True == True
\ No newline at end of file
+    assert True == True
+
+
+def test_sparse_cosine_top_k():
+    pp_df = prepare_dataset(preprocess=True)
+    titles = pp_df.title.iloc[:500].fillna("").reset_index(drop=True)
+
+    all_pairs = create_index_pairs(titles.shape[0])
+    all_scores = cosine.cosine_similarities(titles, all_pairs)
+    expected = all_pairs[all_scores >= 0.7]
+
+    token_matrix = cosine.get_normalized_token_matrix(titles)
+    pairs, scores = cosine.sparse_cosine_top_k(token_matrix, cutoff=0.7, block_size=64)
+    assert set(map(tuple, pairs)) == set(map(tuple, expected))
+    assert np.allclose(scores, cosine.cosine_similarities(titles, pairs))
+
+    pairs, scores = cosine.sparse_cosine_top_k(token_matrix, cutoff=0.7, top_k=1)
+    assert pairs.shape[0] <= titles.shape[0]
+
+
+def test_rowwise_dot():
+    pp_df = prepare_dataset(preprocess=True)
+    titles = pp_df.title.iloc[:500].fillna("").reset_index(drop=True)
+    pairs = create_index_pairs(titles.shape[0])
+
+    token_matrix = cosine.get_normalized_token_matrix(titles)
+    expected = cosine.cosine_similarities_on_pair_matrices(
+        token_matrix[pairs[:, 0]], token_matrix[pairs[:, 1]]
+        )
+    scores = cosine.rowwise_dot(token_matrix, pairs[:, 0], pairs[:, 1], chunk_size=10_000)
+    assert np.allclose(scores, expected)
+    assert np.allclose(cosine.cosine_similarities(titles, pairs), expected)
+
+
+def test_levenshtein_distance_in_pair_order():
+    pp_df = prepare_dataset(preprocess=True)
+    titles = pp_df.title.iloc[:200].fillna("").reset_index(drop=True)
+    pairs = create_index_pairs(titles.shape[0])
+    pairs = pairs[np.random.default_rng(1).permutation(pairs.shape[0])]
+
+    scores = levenshtein.levenshtein_distance(titles, pairs)
+    expected = [
+        levenshtein.fuzz.QRatio(titles[i], titles[j]) / 100
+        for i, j in pairs[:100]
+        ]
+    assert scores.shape == (pairs.shape[0],)
+    assert np.allclose(scores[:100], expected)
+
+
+def test_embedding_cosine_similarities(tmp_path):
+    pp_df = prepare_dataset(preprocess=True)
+    titles = pp_df.title.iloc[:200].fillna("").reset_index(drop=True)
+    pairs = create_index_pairs(titles.shape[0])
+
+    cache = embedding.VectorCache(embedding.HashedNgramEncoder(dimensions=64))
+    vectors = embedding.encode_values(titles, cache)
+    scores = embedding.wv_cosine_similarities(titles, pairs, cache)
+    assert scores.shape == (pairs.shape[0],)
+    assert np.allclose(scores, np.einsum("ij,ij->i", vectors[pairs[:, 0]], vectors[pairs[:, 1]]))
+    #each unique title is encoded once
+    assert len(cache) == titles.nunique()
+    #new strings are appended as a block, without copying the cached vectors
+    blocks = list(cache.blocks)
+    more = cache.encode(np.array(['blue moon', titles[0], 'red sky'], dtype=object))
+    assert all(block is cached for block, cached in zip(cache.blocks, blocks))
+    assert len(cache.blocks) == len(blocks) + 1
+    assert np.allclose(more[1], vectors[0])
+    #a hash collision is not served another string's vector
+    key = int(pd.util.hash_array(np.array(['green grass'], dtype=object))[0])
+    cache.rows[key] = cache.rows[int(pd.util.hash_array(np.array(['blue moon'], dtype=object))[0])]
+    collided = cache.encode(np.array(['green grass'], dtype=object))
+    assert np.allclose(collided, cache.encoder.encode(np.array(['green grass'], dtype=object)))
+    cache.clear()
+    assert len(cache) == 0
+
+    path = tmp_path / "vectors.txt"
+    path.write_text("3 2\nblue 1 0\nmoon 0 1\nsky 1 1\n")
+    encoder = embedding.WordVectorEncoder(str(path))
+    vectors = encoder.encode(np.array(['Blue Moon', 'sky', 'red'], dtype=object))
+    assert np.allclose(vectors, [[0.5 ** 0.5, 0.5 ** 0.5], [0.5 ** 0.5, 0.5 ** 0.5], [0, 0]])
+
+
+def test_embedding_cache_belongs_to_matcher():
+    df = pd.DataFrame({'title': ['blue moon', 'blue moons', 'red sky']})
+    field_config = {'blocking': {}, 'scoring': {'title': 'embedding'}, 'embedding': {'dimensions': 32}}
+    Matcher = em.EntityMatcher(field_config)
+    other = em.EntityMatcher({**field_config, 'embedding': {'dimensions': 64}})
+    assert Matcher.vector_cache is not other.vector_cache
+    assert Matcher.vector_cache.encoder.dimensions == 32
+    Matcher.get_matches(df)
+    #the vectors are not kept after the run
+    assert len(Matcher.vector_cache) == 0
+
+
+def test_scoring_is_positional():
+    df = pd.DataFrame({
+        'title': ['blue moon', 'red sky', 'blue moon', 'red skies', 'green'],
+        'number': [1, 2, 1, 2, 3],
+        })
+    field_config = {
+        'blocking': {},
+        'scoring': {'title': 'fuzzy', 'number': 'exact'}
+        }
+    Matcher = em.EntityMatcher(field_config)
+    expected = Matcher.get_matches(df.reset_index(drop=True))
+    for index in [[4, 3, 2, 1, 0], ['e', 'd', 'c', 'b', 'a']]:
+        matches = Matcher.get_matches(df.set_axis(index))
+        assert list(np.asarray(matches)) == list(np.asarray(expected))
+    pairs = np.array([[2, 0], [3, 1], [4, 0]])
+    assert exact.exact_matches(df['number'].set_axis(['e', 'd', 'c', 'b', 'a']), pairs).tolist() == [1, 1, 0]
@@ -0,0 +1,71 @@
+"""
+Test Pair Generation
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.pairs import (
+    count_index_pairs,
+    triangle_index_to_pairs,
+    create_index_pairs,
+    iter_index_pairs,
+    CandidatePairs
+    )
+
+import numpy as np
+
+import tracemalloc
+
+
+
+def test_create_index_pairs():
+    pairs = create_index_pairs(5)
+    expected = np.array([[i, j] for i in range(5) for j in range(5) if j < i])
+    assert pairs.dtype == np.int32
+    assert pairs.shape == (count_index_pairs(5), 2)
+    assert (pairs == expected).all()
+    assert create_index_pairs(1).shape == (0, 2)
+
+    #the pairs are generated in int32, in triangle order, without int64 temporaries
+    n = 2_000
+    tracemalloc.start()
+    pairs = create_index_pairs(n)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1.6 * pairs.nbytes
+    i, j = triangle_index_to_pairs(np.arange(count_index_pairs(n)))
+    assert (pairs[:, 0] == i).all() and (pairs[:, 1] == j).all()
+
+
+def test_triangle_index_to_pairs():
+    n = 2_000
+    i, j = triangle_index_to_pairs(np.arange(count_index_pairs(n)))
+    assert (i > j).all()
+    assert (i * (i - 1) // 2 + j == np.arange(count_index_pairs(n))).all()
+
+
+def test_iter_index_pairs():
+    chunks = list(iter_index_pairs(101, chunk_size=333))
+    assert max(chunk.shape[0] for chunk in chunks) == 333
+    assert (np.concatenate(chunks) == create_index_pairs(101)).all()
+
+
+def test_candidate_pairs():
+    title_pairs = np.array([[1, 0], [2, 1], [1, 0]])
+    artist_pairs = np.array([[0, 1], [3, 2]])
+    store = CandidatePairs.from_pairs(4, np.concatenate([title_pairs, artist_pairs]))
+    assert len(store) == 3
+    assert (store.pairs == np.array([[1, 0], [2, 1], [3, 2]])).all()
+
+    store.set_scores('title', title_pairs, np.array([.9, .5, .9]))
+    store.set_scores('artist', artist_pairs, np.array([.7, 1.]))
+    combined = store.combined_scores()
+    assert np.allclose(combined, [.8, .5, 1.])
+
+    frame = store.to_frame(combined > .6, combined)
+    assert list(frame.columns) == [0, 1, 'title', 'artist', 'scores']
+    assert frame.shape == (2, 5)
+    assert np.isnan(frame['title'].iloc[1])
@@ -0,0 +1,49 @@
+"""
+Test Storage
+"""
+
+__author__ = "Jason Beach"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+
+from entity_matcher.storage import (
+    encode_strings,
+    decode_strings,
+    save_arrays,
+    load_arrays,
+    StringColumn
+)
+
+import numpy as np
+
+from scipy.sparse import csr_matrix
+
+
+def test_encode_strings():
+    strings = np.array(['blue moon', None, '', 'café'], dtype=object)
+    decoded = decode_strings(*encode_strings(strings))
+    assert decoded.tolist() == ['blue moon', None, '', 'café']
+    #only the rows taken are decoded, in their order
+    decoded = decode_strings(*encode_strings(strings), rows=np.array([3, 1, 0]), chunk_size=2)
+    assert decoded.tolist() == ['café', None, 'blue moon']
+
+
+def test_save_load_arrays(tmp_path):
+    arrays = {
+        'labels': np.array([0, 0, 1], dtype=np.int64),
+        'vectors': csr_matrix(np.array([[0.6, 0.8], [0, 1.0], [0, 0]])),
+        'titles': np.array(['a', 'b', None], dtype=object),
+        'keys': np.array([1, 'b'], dtype=object),
+        }
+    save_arrays(str(tmp_path), arrays, {'n_records': 3})
+    loaded, metadata = load_arrays(str(tmp_path))
+    assert metadata == {'n_records': 3}
+    assert isinstance(loaded['labels'], np.memmap)
+    assert loaded['labels'].tolist() == [0, 0, 1]
+    assert (loaded['vectors'] != arrays['vectors']).nnz == 0
+    assert isinstance(loaded['titles'], StringColumn)
+    assert len(loaded['titles']) == 3
+    assert loaded['titles'].take(np.array([2, 1])).tolist() == [None, 'b']
+    assert loaded['titles'].to_numpy().tolist() == ['a', 'b', None]
+    assert loaded['keys'].tolist() == [1, 'b']
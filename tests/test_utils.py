@@ -9,6 +9,8 @@ __license__ = "MIT"
 
 import entity_matcher as em
 
+import pandas as pd
+
 from tests.setup import prepare_dataset
 
 
@@ -51,4 +53,27 @@ def test_summary_df_sparsity_summary():
                                              xcol='SourceID', 
                                              ycols=['title', 'language']
                                              )
-    assert result_df.shape == (5,3)
\ No newline at end of file
+    assert result_df.shape == (5,3)
+
+def test_report_blocking_report():
+    df = pd.DataFrame({
+        'title': ['blue moon', 'blue moon', 'blue moon', 'red sky', 'red skies', 'green'],
+        'CID': [1, 1, 2, 3, 3, 4]
+        })
+    field_config = {
+        'blocking': {'operation': 'standard', 'process': 'purge'},
+        'scoring': {'title': 'levenshtein'}
+        }
+    report = em.utils.blocking_report(df, field_config, truth='CID')
+    assert report['candidate_pairs'] == 3 and report['total_pairs'] == 15
+    assert report['reduction_ratio'] == 1 - 3 / 15
+    assert report['pair_completeness'] == 1 / 2
+    assert report['pair_quality'] == 1 / 3
+    assert report['block_sizes']['title'].loc['3-5', 'blocks'] == 1
+    assert report['largest_blocks']['title']['key'].iloc[0] == 'blue moon'
+
+    comparison = em.utils.compare_blocking_approaches(
+        df, field_config, truth='CID', blockings=[{}, {'operation': 'sorted_neighborhood'}]
+        )
+    assert comparison['candidate_pairs'].tolist() == [15, 12]
+    assert comparison['pair_completeness'].tolist() == [1.0, 1.0]